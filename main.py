@@ -16,12 +16,21 @@ ssl._create_default_https_context = ssl._create_unverified_context  # noqa
 from src.core.config import config
 from src.core.logger import logger
 from src.core.exceptions import BotError, PublishError
+from src.core.tracing import tracer
 from src.services.openrouter import OpenRouterService
+from src.services.cache import PersistentCache
+from src.services.usage_ledger import UsageLedger
+from src.services.examples_index import ExamplesIndex
+from src.services.dedup import DuplicateIndex
+from src.services.draft_cache import DraftCache
 from src.agents.generator_agent import ContentGeneratorAgent
 from src.agents.reviewer_agent import ReviewerAgent
 from src.agents.safety_agent import SafetyAgent
+from src.agents.verification_agent import VerificationAgent
+from src.agents.post_pipeline import build_post_pipeline
 from src.telegram_bot.bot import MedicalTelegramBot
 from src.telegram_bot.task_queue import TaskQueue
+from src.telegram_bot.middlewares import TracingMiddleware
 from src.telegram_bot.handlers.user_interface import setup_handlers
 from src.scheduler.task_scheduler import TaskScheduler
 from src.scheduler.tasks import SchedulerTasks
@@ -33,7 +42,10 @@ from aiogram.enums import ParseMode
 telegram_bot = None
 scheduler = None
 dispatcher = None
-
+openrouter = None
+usage_ledger = None
+duplicate_index = None
+caches = []  # PersistentCache: LLM-ответы, вердикты, черновики
 
 
 async def shutdown(signal_type=None):
@@ -46,12 +58,28 @@ async def shutdown(signal_type=None):
     if scheduler:
         scheduler.stop()
     
+    if openrouter:
+        await openrouter.close()
+    
+    # SQLite-соединения кэшей — после сессии: запросы в полёте ещё могут писать в кэш
+    for cache in caches:
+        cache.close()
+    caches.clear()
+    
+    if usage_ledger:
+        await usage_ledger.close()
+    
+    if duplicate_index:
+        duplicate_index.close()
+    
+    await tracer.close()
+    
     logger.info("👋 Бот остановлен")
 
 
 async def main():
     """Запуск бота для MVP демонстрации"""
-    global telegram_bot, scheduler, dispatcher
+    global telegram_bot, scheduler, dispatcher, openrouter, usage_ledger, duplicate_index
     
     logger.info("=" * 80)
     logger.info("🚀 ЗАПУСК MEDICAL SMM BOT (MVP)")
@@ -62,21 +90,72 @@ async def main():
         config.validate()
         logger.info("✅ Конфигурация проверена")
         
+        # До OpenRouter: сессия подключает трассировку HTTP, только если она включена
+        await tracer.start()
+        
         # 2. Инициализация OpenRouter
+        llm_cache = None
+        if config.LLM_CACHE_ENABLED:
+            llm_cache = PersistentCache(
+                db_path=config.LLM_CACHE_PATH,
+                table="llm_responses",
+                ttl=config.LLM_CACHE_TTL,
+                memory_items=config.LLM_CACHE_MEMORY_ITEMS,
+                max_bytes=config.LLM_CACHE_MAX_BYTES
+            )
+            caches.append(llm_cache)
+
+        verdict_cache = None
+        if config.VERDICT_CACHE_ENABLED:
+            verdict_cache = PersistentCache(
+                db_path=config.LLM_CACHE_PATH,
+                table="verdicts",
+                ttl=config.VERDICT_CACHE_TTL
+            )
+            caches.append(verdict_cache)
+
+        draft_cache = None
+        if config.DRAFT_CACHE_ENABLED:
+            draft_cache = DraftCache(
+                PersistentCache(
+                    db_path=config.LLM_CACHE_PATH,
+                    table="drafts",
+                    ttl=config.DRAFT_CACHE_TTL,
+                    memory_items=config.DRAFT_CACHE_MEMORY_ITEMS
+                ),
+                prompt_version=ContentGeneratorAgent.PROMPT_VERSION
+            )
+            caches.append(draft_cache.cache)
+
+        usage_ledger = UsageLedger(db_path=config.LLM_LEDGER_PATH)
+        await usage_ledger.start()
+
         openrouter = OpenRouterService(
             api_key=config.OPENROUTER_API_KEY,
-            base_url=config.OPENROUTER_BASE_URL
+            base_url=config.OPENROUTER_BASE_URL,
+            cache=llm_cache,
+            ledger=usage_ledger
         )
+        await openrouter.start()
         logger.info("✅ OpenRouter инициализирован")
         
         # 3. Инициализация AI-агентов
-        generator_agent = ContentGeneratorAgent(openrouter=openrouter)
-        reviewer_agent = ReviewerAgent(openrouter=openrouter)
-        safety_agent = SafetyAgent(openrouter=openrouter)
+        examples_index = ExamplesIndex().load() if config.FEW_SHOT_EXAMPLES > 0 else None
+        generator_agent = ContentGeneratorAgent(openrouter=openrouter, examples_index=examples_index)
+        reviewer_agent = ReviewerAgent(openrouter=openrouter, verdict_cache=verdict_cache)
+        if config.COMBINED_VERIFICATION:
+            # Один вызов вместо SafetyAgent + ReviewerAgent: вердикт + review
+            safety_agent = VerificationAgent(openrouter=openrouter, verdict_cache=verdict_cache)
+        else:
+            safety_agent = SafetyAgent(openrouter=openrouter, verdict_cache=verdict_cache)
         logger.info("✅ AI-агенты инициализированы")
         
         # 4. Инициализация очереди задач
-        task_queue = TaskQueue()
+        # Почти-дубликаты: архив каналов + всё, что проходит через очередь
+        if config.DEDUP_ENABLED:
+            duplicate_index = DuplicateIndex().load()
+            duplicate_index.index_examples()
+        task_queue = TaskQueue(duplicates=duplicate_index)
         logger.info("✅ Очередь задач инициализирована")
         
         # 5. Инициализация Telegram Bot
@@ -89,14 +168,21 @@ async def main():
         # 6. Настройка Dispatcher и handlers
         dispatcher = Dispatcher()
 
+        # Конвейер поста: лимиты генераций и проверок общие для всех чатов
+        post_pipeline = build_post_pipeline(generator_agent, safety_agent, duplicates=duplicate_index)
+
         # Инициализируем агенты в handlers (для user_interface.py)
         from src.telegram_bot.handlers.user_interface import set_agents
-        set_agents(generator_agent, safety_agent, telegram_bot)
+        set_agents(generator_agent, safety_agent, telegram_bot, duplicate_index, draft_cache, post_pipeline)
 
         # Инициализируем telegram_bot в admin handlers
-        from src.telegram_bot.handlers.admin import set_telegram_bot
+        from src.telegram_bot.handlers.admin import set_telegram_bot, set_usage_ledger, set_post_pipeline
         set_telegram_bot(telegram_bot)
+        set_usage_ledger(usage_ledger)
+        set_post_pipeline(post_pipeline)
 
+        # Апдейт Telegram — корень трассы: trace_id общий для всех этапов до превью
+        dispatcher.update.outer_middleware(TracingMiddleware())
         setup_handlers(dispatcher)
         logger.info("✅ Handlers настроены")
         
@@ -146,6 +232,14 @@ async def main():
         )
         logger.info("  🧹 Очистка старых задач: 03:00 MSK")
         
+        # Посты, дописанные в data/examples, попадают в индекс few-shot без перезапуска
+        if examples_index is not None:
+            async def refresh_examples():
+                examples_index.refresh()
+            
+            scheduler.add_interval_job(refresh_examples, minutes=10, job_id="refresh_examples")
+            logger.info("  📚 Обновление индекса примеров: каждые 10 минут")
+        
         # Запускаем планировщик
         scheduler.start()
         logger.info("✅ Планировщик запущен")
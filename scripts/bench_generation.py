@@ -0,0 +1,217 @@
+"""
+Нагрузочный бенчмарк конвейера генерации: ContentGeneratorAgent → SafetyAgent
+
+Посты прогоняются через тот же конвейер этапов, что и в боте
+(src/agents/post_pipeline.py), пакетом через Pipeline.map().
+
+По умолчанию поднимает в том же процессе заглушку OpenRouter
+(scripts/fake_openrouter.py) — сеть и токены не нужны. С --base-url
+бьёт в уже запущенную заглушку (или в настоящий API).
+
+Примеры:
+    python scripts/bench_generation.py --posts 50 --concurrency 10
+    python scripts/bench_generation.py --latency lognormal:0.0,0.6 --error-rate 0.05 --rate-limit-rate 0.05
+    python scripts/bench_generation.py --stream --max-p95 5   # для CI: код выхода 1 при p95 > 5 с
+    python scripts/bench_generation.py --stream --pipelined   # проверка абзацев во время генерации
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Dict, List
+
+from aiohttp import web
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "scripts"))
+
+from fake_openrouter import FakeSettings, create_app  # noqa: E402
+from src.services.openrouter import OpenRouterService  # noqa: E402
+from src.services.rate_limiter import ModelRateLimiter  # noqa: E402
+from src.agents.generator_agent import ContentGeneratorAgent  # noqa: E402
+from src.agents.safety_agent import SafetyAgent  # noqa: E402
+from src.agents.post_pipeline import build_post_pipeline  # noqa: E402
+from src.core.exceptions import GenerationAborted  # noqa: E402
+from src.core.pipeline import PipelineRun  # noqa: E402
+from src.agents.specialty_loader import SPECIALTY_MAP  # noqa: E402
+
+TOPICS = [
+    "Новые критерии гестационного сахарного диабета",
+    "Вакцинация против ВПЧ у подростков",
+    "Контроль гликемии при диабете 2 типа",
+    "Антибиотики при ОРВИ: когда не нужны",
+    "Атопический дерматит: обновление рекомендаций",
+]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def post_inputs(index: int, stream: bool, pipelined: bool, first_chunks: Dict[int, float], fragment_min_chars: int = None) -> Dict:
+    """Входные данные прогона конвейера для одного поста, как в боте"""
+    specialty = list(SPECIALTY_MAP)[index % len(SPECIALTY_MAP)]
+    specialty_config = SPECIALTY_MAP[specialty]
+    topic = f"{TOPICS[index % len(TOPICS)]} #{index}"
+
+    async def on_chunk(draft: str):
+        first_chunks.setdefault(index, time.monotonic())
+
+    return {
+        "news": {
+            "title": topic,
+            "content": f"Тема для поста: {topic}",
+            "source_name": "Бенчмарк",
+            "source_url": ""
+        },
+        "channel": {
+            "name": specialty_config["name"],
+            "specialty": specialty,
+            "emoji": specialty_config["emoji"],
+            "link": specialty_config["link"]
+        },
+        "on_chunk": on_chunk if stream else None,
+        "candidates": 1,
+        "pipelined": pipelined,
+        "fragment_min_chars": fragment_min_chars
+    }
+
+
+def post_result(run: PipelineRun, first_chunk_at: float = None) -> Dict[str, float]:
+    """Тайминги этапов прогона, сек"""
+    if not run.ok:
+        if isinstance(run.exception, GenerationAborted):
+            stage = "safety_abort"
+        else:
+            stage = "generation" if run.failed_stage == "generate" else run.failed_stage
+        return {"ok": False, "stage": stage, "error": run.error}
+
+    generation = run.timings["generate"]["duration_ms"] / 1000
+    return {
+        "ok": True,
+        "generation": generation,
+        "first_chunk": first_chunk_at - run.started_at if first_chunk_at else generation,
+        "safety": run.timings["safety"]["duration_ms"] / 1000,
+        "total": run.duration_ms / 1000
+    }
+
+
+async def bench(args: argparse.Namespace) -> int:
+    runner = None
+    base_url = args.base_url
+
+    if base_url is None:
+        settings = FakeSettings(
+            latency=args.latency,
+            chunk_delay=args.chunk_delay,
+            error_rate=args.error_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            retry_after=args.retry_after,
+            stream_abort_rate=args.stream_abort_rate,
+            unsafe_rate=args.unsafe_rate,
+            seed=args.seed
+        )
+        app = create_app(settings)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", args.port).start()
+        base_url = f"http://127.0.0.1:{args.port}/api/v1"
+
+    openrouter = OpenRouterService(
+        api_key=args.api_key,
+        base_url=base_url,
+        limiter=ModelRateLimiter(rps=args.rps, burst=args.burst)
+    )
+    await openrouter.start()
+
+    # Тот же конвейер, что у бота; лимиты этапов — по параллельности бенчмарка
+    pipeline = build_post_pipeline(
+        ContentGeneratorAgent(openrouter=openrouter),
+        SafetyAgent(openrouter=openrouter),
+        name="bench",
+        generate_concurrency=args.concurrency,
+        safety_concurrency=args.concurrency
+    )
+    first_chunks: Dict[int, float] = {}
+    items = [
+        post_inputs(i, args.stream, args.pipelined, first_chunks, args.fragment_min_chars)
+        for i in range(args.posts)
+    ]
+
+    mode = ("stream + конвейерная проверка" if args.pipelined else "stream") if args.stream else "без stream"
+    print(f"🏁 {args.posts} постов, параллельно {args.concurrency}, {mode} → {base_url}")
+
+    started_at = time.monotonic()
+    runs = await pipeline.map(items, concurrency=args.concurrency)
+    results = [post_result(run, first_chunks.get(i)) for i, run in enumerate(runs)]
+    elapsed = time.monotonic() - started_at
+
+    await openrouter.close()
+
+    ok = [r for r in results if r["ok"]]
+    failed = [r for r in results if not r["ok"]]
+
+    print(f"\n⏱ Всего: {elapsed:.2f}s, {len(ok) / elapsed:.2f} постов/с, ошибок: {len(failed)}")
+    print(f"{'этап':<14}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for stage in ("first_chunk", "generation", "safety", "total"):
+        samples = [r[stage] for r in ok]
+        print(
+            f"{stage:<14}"
+            f"{percentile(samples, 0.5):>8.2f}s{percentile(samples, 0.95):>8.2f}s"
+            f"{percentile(samples, 0.99):>8.2f}s{max(samples, default=0.0):>8.2f}s"
+        )
+
+    for r in failed[:5]:
+        print(f"❌ {r['stage']}: {str(r['error'])[:120]}")
+
+    print(f"\n🚦 Лимитер: {openrouter.limiter.get_stats()}")
+
+    if runner is not None:
+        print(f"🧪 Заглушка: {app['fake'].stats}")
+        await runner.cleanup()
+
+    p95 = percentile([r["total"] for r in ok], 0.95)
+    if args.max_p95 is not None and p95 > args.max_p95:
+        print(f"❌ p95 {p95:.2f}s превышает порог {args.max_p95:.2f}s")
+        return 1
+    if failed and not args.allow_errors:
+        return 1
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк генерации постов на заглушке OpenRouter")
+    parser.add_argument("--posts", type=int, default=20, help="Сколько постов сгенерировать")
+    parser.add_argument("--concurrency", type=int, default=5, help="Постов одновременно")
+    parser.add_argument("--stream", action="store_true", help="Потоковая генерация (как живое превью в боте)")
+    parser.add_argument("--pipelined", action="store_true", help="Проверять абзацы во время генерации (нужен --stream)")
+    parser.add_argument("--fragment-min-chars", type=int, default=None, help="Минимальный фрагмент конвейерной проверки")
+    parser.add_argument("--base-url", default=None, help="Внешний API вместо встроенной заглушки")
+    parser.add_argument("--api-key", default="fake-key")
+    parser.add_argument("--port", type=int, default=8089, help="Порт встроенной заглушки")
+    parser.add_argument("--rps", type=float, default=None, help="Лимит запросов в секунду на модель (по умолчанию OPENROUTER_RPS)")
+    parser.add_argument("--burst", type=int, default=None, help="Всплеск лимитера (по умолчанию OPENROUTER_BURST)")
+    parser.add_argument("--latency", default="lognormal:-1.0,0.5", help="Распределение задержки заглушки")
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--stream-abort-rate", type=float, default=0.0)
+    parser.add_argument("--unsafe-rate", type=float, default=0.0, help="Доля вердиктов «небезопасно»")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-p95", type=float, default=None, help="Порог p95 полного цикла, сек (код выхода 1)")
+    parser.add_argument("--allow-errors", action="store_true", help="Не считать ошибки генерации провалом")
+    args = parser.parse_args()
+    if args.pipelined and not args.stream:
+        parser.error("--pipelined работает только с --stream")
+    return args
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(bench(parse_args())))
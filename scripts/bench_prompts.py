@@ -0,0 +1,144 @@
+"""
+Микробенчмарк сборки промптов: str.format() на каждый вызов против
+предкомпилированных шаблонов src/agents/prompt_templates.py
+
+Сначала проверяет, что оба способа дают одинаковые messages (иначе
+провайдер перестанет попадать в кэш префикса), затем меряет время
+сборки messages для ContentGeneratorAgent и generate_from_topic.
+
+Примеры:
+    python scripts/bench_prompts.py
+    python scripts/bench_prompts.py --number 50000 --repeat 7
+"""
+
+import sys
+import timeit
+import argparse
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.agents.generator_prompts import (  # noqa: E402
+    GENERATOR_SYSTEM_PROMPT,
+    USER_PROMPT_TEMPLATE,
+    TOPIC_SYSTEM_PROMPT_TEMPLATE,
+    TOPIC_USER_PROMPT_TEMPLATE
+)
+from src.agents.specialty_loader import get_specialty_config  # noqa: E402
+from src.agents.prompt_templates import (  # noqa: E402
+    specialty_context,
+    generator_user_template,
+    topic_system_prompt,
+    topic_user_template,
+    cache_info
+)
+from src.services.openrouter import build_messages  # noqa: E402
+
+SPECIALTY = "гинекология"
+CHANNEL = {
+    "name": "Профессия – гинекология",
+    "specialty": SPECIALTY,
+    "emoji": "🍑",
+    "link": "https://t.me/profgynecologist"
+}
+NEWS = {
+    "title": "Обновлены рекомендации по ведению беременности при ГСД",
+    "content": "Минздрав утвердил новые протоколы диагностики гестационного сахарного диабета. " * 4,
+    "source_name": "Минздрав РФ",
+    "source_url": "https://minzdrav.gov.ru/news"
+}
+TOPIC = "Новые критерии ГСД 2026"
+POST_TYPE = "клинрекомендации"
+MAX_LENGTH = 2000
+
+
+def news_messages_format():
+    """Прежний путь ContentGeneratorAgent.execute"""
+    specialty_prompt = get_specialty_config(SPECIALTY)["prompt"]
+    custom_instructions = f"Следуй инструкциям специализации «{SPECIALTY}» из системного промпта."
+    user_prompt = USER_PROMPT_TEMPLATE.format(
+        news_title=NEWS["title"],
+        news_content=NEWS["content"],
+        news_source=NEWS["source_name"],
+        news_url=NEWS["source_url"],
+        channel_name=CHANNEL["name"],
+        specialty=CHANNEL["specialty"],
+        channel_emoji=CHANNEL["emoji"],
+        channel_link=CHANNEL["link"],
+        custom_instructions=custom_instructions,
+        style_examples=""
+    )
+    return build_messages(user_prompt, [GENERATOR_SYSTEM_PROMPT, specialty_prompt])
+
+
+def news_messages_template():
+    """Путь через prompt_templates"""
+    user_prompt = generator_user_template(
+        SPECIALTY, CHANNEL["name"], CHANNEL["emoji"], CHANNEL["link"]
+    ).render(
+        news_title=NEWS["title"],
+        news_content=NEWS["content"],
+        news_source=NEWS["source_name"],
+        news_url=NEWS["source_url"],
+        style_examples=""
+    )
+    return build_messages(user_prompt, [GENERATOR_SYSTEM_PROMPT, specialty_context(SPECIALTY)])
+
+
+def topic_messages_format():
+    """Прежний путь ContentGeneratorService.generate_from_topic"""
+    specialty_config = get_specialty_config(SPECIALTY)
+    fields = {
+        "max_length": MAX_LENGTH,
+        "emoji": specialty_config["emoji"],
+        "channel_link": specialty_config["link"],
+        "post_type": POST_TYPE
+    }
+    system_prompt = TOPIC_SYSTEM_PROMPT_TEMPLATE.format(**fields)
+    user_prompt = TOPIC_USER_PROMPT_TEMPLATE.format(topic=TOPIC, **fields)
+    return build_messages(user_prompt, [specialty_config["prompt"]], system=system_prompt)
+
+
+def topic_messages_template():
+    """Путь через prompt_templates"""
+    system_prompt = topic_system_prompt(SPECIALTY, POST_TYPE, MAX_LENGTH)
+    user_prompt = topic_user_template(SPECIALTY, POST_TYPE, MAX_LENGTH).render(topic=TOPIC)
+    return build_messages(user_prompt, [specialty_context(SPECIALTY)], system=system_prompt)
+
+
+def measure(func, number: int, repeat: int) -> float:
+    """Лучшее время одного вызова, мкс"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Микробенчмарк сборки промптов")
+    parser.add_argument("--number", type=int, default=20000, help="Вызовов в одном замере")
+    parser.add_argument("--repeat", type=int, default=5, help="Замеров (берётся лучший)")
+    args = parser.parse_args()
+
+    cases = [
+        ("новость → пост", news_messages_format, news_messages_template),
+        ("тема → пост", topic_messages_format, topic_messages_template),
+    ]
+
+    for name, before, after in cases:
+        if before() != after():
+            print(f"❌ {name}: шаблоны дают другие messages")
+            return 1
+
+    print(f"{'сценарий':<18}{'format, мкс':>14}{'шаблон, мкс':>14}{'ускорение':>12}")
+    for name, before, after in cases:
+        before_us = measure(before, args.number, args.repeat)
+        after_us = measure(after, args.number, args.repeat)
+        print(f"{name:<18}{before_us:>14.2f}{after_us:>14.2f}{before_us / after_us:>11.1f}x")
+
+    hits = sum(info["hits"] for info in cache_info().values())
+    misses = sum(info["misses"] for info in cache_info().values())
+    print(f"\n💾 Мемоизация: {hits} попаданий, {misses} промахов")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
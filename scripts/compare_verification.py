@@ -0,0 +1,186 @@
+"""
+Сравнение совмещённой проверки (VerificationAgent, один вызов) с раздельной
+(SafetyAgent + ReviewerAgent, два вызова) на одних и тех же постах
+
+Считает совпадение вердиктов (is_safe, severity, safe ревьюера), задержку
+и токены каждого пути. По умолчанию работает на встроенной заглушке
+OpenRouter — это проверка обвязки; реальное качество совмещённого промпта
+проверяется с --base-url https://openrouter.ai/api/v1 и настоящим ключом.
+
+Примеры:
+    python scripts/compare_verification.py
+    python scripts/compare_verification.py --posts data/verification_samples.json --min-agreement 0.9 \\
+        --base-url https://openrouter.ai/api/v1 --api-key $OPENROUTER_API_KEY
+"""
+
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+from aiohttp import web
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "scripts"))
+
+from fake_openrouter import FakeSettings, create_app  # noqa: E402
+from src.services.openrouter import OpenRouterService  # noqa: E402
+from src.services.usage_ledger import UsageLedger  # noqa: E402
+from src.agents.safety_agent import SafetyAgent  # noqa: E402
+from src.agents.reviewer_agent import ReviewerAgent  # noqa: E402
+from src.agents.verification_agent import VerificationAgent  # noqa: E402
+from src.agents.safety_pipeline import SEVERITY_ORDER  # noqa: E402
+
+# Посты по умолчанию: безопасный, требующий правки и пограничный
+SAMPLE_POSTS = [
+    {
+        "specialty": "гинекология",
+        "channel_name": "Профессия – гинекология",
+        "content": (
+            "🍑 <b>Обновлены рекомендации по ведению беременности при ГСД</b>\n\n"
+            "Минздрав утвердил новые протоколы. Порог глюкозы для диагностики — ≥5,1 ммоль/л.\n\n"
+            "❗️ Диагностика и лечение ГСД проводятся только под контролем эндокринолога и акушера-гинеколога."
+        )
+    },
+    {
+        "specialty": "терапия",
+        "channel_name": "Профессия – терапия",
+        "content": (
+            "Новые данные о витамине D! Исследования показали эффективность в профилактике COVID-19. "
+            "Дефицит витамина увеличивает риск тяжёлого течения."
+        )
+    },
+    {
+        "specialty": "педиатрия",
+        "channel_name": "Профессия – педиатрия",
+        "content": (
+            "🧸 <b>Антибиотики при ОРВИ у детей</b>\n\n"
+            "ОРВИ вызывают вирусы, поэтому антибиотики при неосложнённом течении не нужны.\n\n"
+            "📌 Если температура держится дольше трёх дней — покажите ребёнка педиатру."
+        )
+    },
+]
+
+
+def severity_distance(a: str, b: str) -> int:
+    if a not in SEVERITY_ORDER or b not in SEVERITY_ORDER:
+        return len(SEVERITY_ORDER)
+    return abs(SEVERITY_ORDER.index(a) - SEVERITY_ORDER.index(b))
+
+
+async def run_separate(safety: SafetyAgent, reviewer: ReviewerAgent, post: Dict[str, Any]) -> Dict[str, Any]:
+    """Текущий путь: два последовательных вызова"""
+    started_at = time.monotonic()
+    verdict = await safety.execute(post["content"], post["specialty"], post["channel_name"])
+    review = await reviewer.execute(post["content"])
+    return {"verdict": verdict, "review": review, "latency": time.monotonic() - started_at}
+
+
+async def run_combined(verification: VerificationAgent, post: Dict[str, Any]) -> Dict[str, Any]:
+    """Совмещённый путь: один вызов"""
+    started_at = time.monotonic()
+    verdict = await verification.execute(post["content"], post["specialty"], post["channel_name"])
+    return {"verdict": verdict, "review": verdict.get("review", {}), "latency": time.monotonic() - started_at}
+
+
+def tokens_by_agent(report: List[Dict[str, Any]]) -> Dict[str, int]:
+    totals: Dict[str, int] = {}
+    for row in report:
+        totals[row["agent"]] = totals.get(row["agent"], 0) + row["prompt_tokens"] + row["completion_tokens"]
+    return totals
+
+
+async def compare(args: argparse.Namespace) -> int:
+    posts = json.loads(Path(args.posts).read_text(encoding="utf-8")) if args.posts else SAMPLE_POSTS
+
+    runner = None
+    base_url = args.base_url
+    if base_url is None:
+        app = create_app(FakeSettings(latency=args.latency, seed=args.seed))
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", args.port).start()
+        base_url = f"http://127.0.0.1:{args.port}/api/v1"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = UsageLedger(db_path=str(Path(tmp) / "usage.db"))
+        await ledger.start()
+
+        # Без кэшей: каждый путь честно ходит в модель
+        openrouter = OpenRouterService(api_key=args.api_key, base_url=base_url, ledger=ledger)
+        await openrouter.start()
+
+        safety = SafetyAgent(openrouter=openrouter)
+        reviewer = ReviewerAgent(openrouter=openrouter)
+        verification = VerificationAgent(openrouter=openrouter)
+
+        rows = []
+        for index, post in enumerate(posts * args.repeat):
+            separate = await run_separate(safety, reviewer, post)
+            combined = await run_combined(verification, post)
+            rows.append((index, separate, combined))
+
+        tokens = tokens_by_agent(await ledger.get_report("day"))
+        await openrouter.close()
+        await ledger.close()
+
+    if runner is not None:
+        await runner.cleanup()
+
+    print(f"{'#':<4}{'is_safe':>16}{'severity':>22}{'review.safe':>16}{'раздельно':>12}{'вместе':>10}")
+    agree_safe = agree_severity = agree_review = 0
+    for index, separate, combined in rows:
+        a, b = separate["verdict"], combined["verdict"]
+        same_safe = a.get("is_safe") == b.get("is_safe")
+        close_severity = severity_distance(a.get("severity"), b.get("severity")) <= 1
+        same_review = bool(separate["review"].get("safe")) == bool(combined["review"].get("safe"))
+        agree_safe += same_safe
+        agree_severity += close_severity
+        agree_review += same_review
+        print(
+            f"{index + 1:<4}"
+            f"{str(a.get('is_safe')) + '/' + str(b.get('is_safe')):>16}"
+            f"{str(a.get('severity')) + '/' + str(b.get('severity')):>22}"
+            f"{str(separate['review'].get('safe')) + '/' + str(combined['review'].get('safe')):>16}"
+            f"{separate['latency']:>11.2f}s{combined['latency']:>9.2f}s"
+        )
+
+    total = len(rows)
+    separate_latency = sum(r[1]["latency"] for r in rows)
+    combined_latency = sum(r[2]["latency"] for r in rows)
+    separate_tokens = tokens.get("SafetyAgent", 0) + tokens.get("ReviewerAgent", 0)
+    combined_tokens = tokens.get("VerificationAgent", 0)
+
+    print(f"\n✅ Совпадение is_safe: {agree_safe}/{total}, severity ±1: {agree_severity}/{total}, ревью: {agree_review}/{total}")
+    print(f"⏱ Задержка: раздельно {separate_latency:.2f}s, вместе {combined_latency:.2f}s "
+          f"({combined_latency / max(separate_latency, 1e-9):.0%})")
+    print(f"🔢 Токены: раздельно {separate_tokens}, вместе {combined_tokens} "
+          f"({combined_tokens / max(separate_tokens, 1):.0%})")
+
+    agreement = min(agree_safe, agree_severity, agree_review) / max(total, 1)
+    if agreement < args.min_agreement:
+        print(f"❌ Совпадение {agreement:.0%} ниже порога {args.min_agreement:.0%}")
+        return 1
+    return 0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Совмещённая проверка против SafetyAgent + ReviewerAgent")
+    parser.add_argument("--posts", default=None, help="JSON-список {content, specialty, channel_name}")
+    parser.add_argument("--repeat", type=int, default=1, help="Прогнать каждый пост N раз")
+    parser.add_argument("--min-agreement", type=float, default=0.9, help="Порог совпадения (код выхода 1)")
+    parser.add_argument("--base-url", default=None, help="Внешний API вместо встроенной заглушки")
+    parser.add_argument("--api-key", default="fake-key")
+    parser.add_argument("--port", type=int, default=8090, help="Порт встроенной заглушки")
+    parser.add_argument("--latency", default="fixed:0.3", help="Распределение задержки заглушки")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(compare(parse_args())))
@@ -0,0 +1,408 @@
+"""
+Локальная заглушка OpenRouter API для офлайн-бенчмарков
+
+Эмулирует POST /chat/completions (обычный и потоковый режимы) без сети
+и без траты токенов:
+- задержка первого байта по заданному распределению (для всех или по моделям)
+- потоковая выдача ответа фрагментами (SSE)
+- инъекция ошибок 5xx, 429 с Retry-After и обрывов посреди потока
+- заготовленные ответы генератора, проверки безопасности и ревьюера
+- кэш префикса промпта: повторный префикс до метки cache_control
+  отдаётся в usage.prompt_tokens_details.cached_tokens
+- приёмник трасс OTLP/HTTP JSON (POST /v1/traces) вместо коллектора
+  OpenTelemetry: TRACING_EXPORTER=otlp, TRACING_OTLP_ENDPOINT=http://127.0.0.1:8080/v1/traces
+
+Запуск:
+    python scripts/fake_openrouter.py --port 8080 --latency lognormal:0.0,0.4 --error-rate 0.02
+
+Бот направляется на заглушку через .env:
+    OPENROUTER_BASE_URL=http://127.0.0.1:8080/api/v1
+"""
+
+import re
+import json
+import hashlib
+import random
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+# Сколько последних спанов хранит приёмник трасс
+MAX_SPANS = 10000
+
+
+# ---------------------------------------------------------------- латентность
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Распределение задержки из строки
+
+    Форматы:
+        fixed:0.5            — всегда 0.5 с
+        uniform:0.2,1.5      — равномерно от 0.2 до 1.5 с
+        normal:1.0,0.3       — нормальное (среднее, σ), не меньше 0
+        lognormal:0.0,0.5    — логнормальное (μ, σ логарифма) — «длинный хвост»
+        exp:1.0              — экспоненциальное со средним 1.0 с
+
+    Returns:
+        Функция rng -> секунды
+    """
+    name, _, raw_args = spec.partition(":")
+    args = [float(a) for a in raw_args.split(",") if a]
+
+    distributions = {
+        "fixed": lambda rng: args[0],
+        "uniform": lambda rng: rng.uniform(args[0], args[1]),
+        "normal": lambda rng: max(0.0, rng.gauss(args[0], args[1])),
+        "lognormal": lambda rng: rng.lognormvariate(args[0], args[1]),
+        "exp": lambda rng: rng.expovariate(1 / args[0]),
+    }
+    if name not in distributions:
+        raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+    return distributions[name]
+
+
+# ------------------------------------------------------------ готовые ответы
+
+GENERATOR_RESPONSE = """{emoji} <b>Новые данные: {topic}</b>
+
+📌 Опубликованы обновлённые клинические рекомендации по теме «{topic}».
+
+✅ Ключевые изменения:
+🔹 уточнены критерии диагностики;
+🔹 пересмотрены интервалы наблюдения;
+🔹 добавлены рекомендации по немедикаментозной профилактике.
+
+❗️ Решение о диагностике и лечении принимает лечащий врач — при симптомах обратитесь к специалисту.
+
+Источник: клинические рекомендации Минздрава РФ, 2026.
+
+{emoji} <a href="https://t.me/example">{specialty}</a>"""
+
+SAFETY_SAFE_RESPONSE = {
+    "is_safe": True,
+    "severity": "safe",
+    "issues": [],
+    "recommendations": [],
+    "statistics": {
+        "total_issues": 0, "critical_issues": 0, "high_issues": 0,
+        "medium_issues": 0, "low_issues": 0
+    }
+}
+
+SAFETY_UNSAFE_RESPONSE = {
+    "is_safe": False,
+    "severity": "high",
+    "issues": [{
+        "type": "direct_prescription",
+        "severity": "high",
+        "description": "Прямое назначение препарата без консультации врача",
+        "location": "принимайте по 1 таблетке",
+        "recommendation": "Заменить на рекомендацию обратиться к врачу"
+    }],
+    "recommendations": ["Убрать прямые назначения"],
+    "statistics": {
+        "total_issues": 1, "critical_issues": 0, "high_issues": 1,
+        "medium_issues": 0, "low_issues": 0
+    }
+}
+
+REVIEWER_RESPONSE = {"safe": True, "issues": [], "suggestions": ["Сократить вступление до одного предложения"]}
+
+
+def _find(pattern: str, text: str, default: str) -> str:
+    match = re.search(pattern, text)
+    return match.group(1).strip() if match else default
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """Текст сообщения: строка или список блоков {"type": "text", ...}"""
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return "\n\n".join(block.get("text", "") for block in content)
+    return str(content)
+
+
+def cached_prefix(messages: List[Dict[str, Any]]) -> str:
+    """Префикс промпта до последней метки cache_control (пусто, если меток нет)"""
+    prefix, parts = "", []
+    for message in messages:
+        content = message.get("content")
+        blocks = content if isinstance(content, list) else [{"text": str(content)}]
+        for block in blocks:
+            parts.append(block.get("text", ""))
+            if block.get("cache_control"):
+                prefix = "\n\n".join(parts)
+    return prefix
+
+
+def canned_response(messages: List[Dict[str, Any]], rng: random.Random, unsafe_rate: float) -> str:
+    """
+    Ответ по типу промпта: проверка безопасности, ревью или генерация поста
+    """
+    system = " ".join(message_text(m) for m in messages if m.get("role") == "system")
+    user = " ".join(message_text(m) for m in messages if m.get("role") == "user")
+
+    if "is_safe" in system or "МЕДИЦИНСКОЙ БЕЗОПАСНОСТИ" in user:
+        verdict = SAFETY_UNSAFE_RESPONSE if rng.random() < unsafe_rate else SAFETY_SAFE_RESPONSE
+        if '"suggestions"' in system:
+            # Совмещённая проверка (VerificationAgent): вердикт + советы ревьюера
+            verdict = {**verdict, "suggestions": REVIEWER_RESPONSE["suggestions"]}
+        return json.dumps(verdict, ensure_ascii=False, indent=2)
+
+    if '"safe"' in system:
+        return json.dumps(REVIEWER_RESPONSE, ensure_ascii=False)
+
+    return GENERATOR_RESPONSE.format(
+        emoji=_find(r"\*\*Эмодзи канала:\*\*\s*(\S+)", user, "🩺"),
+        topic=_find(r"ТЕМА:\s*(.+)", user, None) or _find(r"\*\*Новость/Тема:\*\*\s*(.+)", user, "медицинская новость"),
+        specialty=_find(r"\*\*Специализация:\*\*\s*(.+)", user, "Медицина")
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов (~4 символа на токен)"""
+    return max(1, len(text) // 4)
+
+
+# ------------------------------------------------------------------- сервер
+
+@dataclass
+class FakeSettings:
+    """Поведение заглушки"""
+    latency: str = "fixed:0.3"
+    model_latency: Dict[str, str] = field(default_factory=dict)
+    chunk_delay: float = 0.02
+    chunk_size: int = 40
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    max_concurrency: int = 0
+    stream_abort_rate: float = 0.0
+    unsafe_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+class FakeOpenRouter:
+    """Обработчики заглушки и счётчики запросов"""
+
+    def __init__(self, settings: FakeSettings):
+        self.settings = settings
+        self.rng = random.Random(settings.seed)
+        self._latency = parse_latency(settings.latency)
+        self._model_latency = {
+            model: parse_latency(spec) for model, spec in settings.model_latency.items()
+        }
+        self.in_flight = 0
+        self.stats = {
+            "requests": 0, "streams": 0, "errors": 0, "rate_limited": 0, "aborted": 0,
+            "prompt_cache_hits": 0, "disconnected": 0
+        }
+        self._prompt_cache = set()
+        # Спаны, принятые на /v1/traces (последние MAX_SPANS)
+        self.spans: List[Dict[str, Any]] = []
+
+    def _usage(self, messages: List[Dict[str, Any]], content: str) -> Dict[str, Any]:
+        prompt_tokens = sum(estimate_tokens(message_text(m)) for m in messages)
+        completion_tokens = estimate_tokens(content)
+
+        cached_tokens = 0
+        prefix = cached_prefix(messages)
+        if prefix:
+            key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+            if key in self._prompt_cache:
+                cached_tokens = estimate_tokens(prefix)
+                self.stats["prompt_cache_hits"] += 1
+            self._prompt_cache.add(key)
+
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+
+    def _injected_error(self) -> Optional[web.Response]:
+        """429 / 5xx по заданным вероятностям"""
+        settings = self.settings
+
+        over_capacity = settings.max_concurrency and self.in_flight > settings.max_concurrency
+        if over_capacity or self.rng.random() < settings.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            return web.json_response(
+                {"error": {"code": 429, "message": "Rate limit exceeded"}},
+                status=429,
+                headers={"Retry-After": f"{settings.retry_after:g}"}
+            )
+
+        if self.rng.random() < settings.error_rate:
+            self.stats["errors"] += 1
+            status = self.rng.choice([500, 502, 503])
+            return web.json_response(
+                {"error": {"code": status, "message": "Upstream provider error"}},
+                status=status
+            )
+
+        return None
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "fake/model")
+        messages = body.get("messages", [])
+
+        self.stats["requests"] += 1
+        self.in_flight += 1
+        try:
+            error = self._injected_error()
+            if error is not None:
+                return error
+
+            latency = self._model_latency.get(model, self._latency)
+            await asyncio.sleep(latency(self.rng))
+
+            content = canned_response(messages, self.rng, self.settings.unsafe_rate)
+            usage = self._usage(messages, content)
+
+            if body.get("stream"):
+                try:
+                    return await self._stream(request, model, content, usage)
+                except ConnectionResetError:
+                    # Клиент ушёл по своему таймауту / дедлайну
+                    self.stats["disconnected"] += 1
+                    return web.Response(status=499)
+
+            return web.json_response({
+                "id": f"gen-fake-{self.stats['requests']}",
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(
+        self,
+        request: web.Request,
+        model: str,
+        content: str,
+        usage: Dict[str, int]
+    ) -> web.StreamResponse:
+        """SSE-ответ в формате OpenRouter"""
+        self.stats["streams"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(payload: Any):
+            data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+            await response.write(f"data: {data}\n\n".encode("utf-8"))
+
+        await response.write(b": OPENROUTER PROCESSING\n\n")
+
+        abort_at = None
+        if self.rng.random() < self.settings.stream_abort_rate:
+            abort_at = self.rng.randrange(0, len(content), self.settings.chunk_size)
+
+        size = self.settings.chunk_size
+        for start in range(0, len(content), size):
+            if start == abort_at:
+                self.stats["aborted"] += 1
+                await send({"error": {"code": 502, "message": "Provider disconnected mid-stream"}})
+                return response
+
+            await send({"model": model, "choices": [{"index": 0, "delta": {"content": content[start:start + size]}}]})
+            await asyncio.sleep(self.settings.chunk_delay)
+
+        await send({"model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage})
+        await send("[DONE]")
+        return response
+
+    async def root(self, request: web.Request) -> web.Response:
+        """HEAD/GET на базовый URL — прогрев пула соединений"""
+        return web.Response(text="fake openrouter")
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({**self.stats, "in_flight": self.in_flight, "spans": len(self.spans)})
+
+    async def receive_traces(self, request: web.Request) -> web.Response:
+        """OTLP/HTTP JSON: resourceSpans → scopeSpans → spans"""
+        body = await request.json()
+        for resource_spans in body.get("resourceSpans", []):
+            for scope_spans in resource_spans.get("scopeSpans", []):
+                self.spans.extend(scope_spans.get("spans", []))
+        del self.spans[:-MAX_SPANS]
+        return web.json_response({"partialSuccess": {}})
+
+    async def list_traces(self, request: web.Request) -> web.Response:
+        return web.json_response({"spans": self.spans})
+
+
+def create_app(settings: FakeSettings = None) -> web.Application:
+    """
+    aiohttp-приложение заглушки
+
+    Маршруты:
+        POST /api/v1/chat/completions
+        GET  /api/v1/stats — счётчики запросов
+        POST /v1/traces — приём спанов (OTLP/HTTP JSON)
+        GET  /v1/traces — принятые спаны
+    """
+    fake = FakeOpenRouter(settings or FakeSettings())
+    app = web.Application()
+    app["fake"] = fake
+    app.router.add_route("*", "/api/v1", fake.root)
+    app.router.add_post("/api/v1/chat/completions", fake.chat_completions)
+    app.router.add_get("/api/v1/stats", fake.get_stats)
+    app.router.add_post("/v1/traces", fake.receive_traces)
+    app.router.add_get("/v1/traces", fake.list_traces)
+    return app
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Заглушка OpenRouter API для офлайн-бенчмарков")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", default="fixed:0.3",
+                        help="Задержка первого байта: fixed:0.5 | uniform:a,b | normal:μ,σ | lognormal:μ,σ | exp:mean")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SPEC",
+                        help="Отдельная задержка для модели (можно несколько раз)")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="Пауза между фрагментами потока, сек")
+    parser.add_argument("--chunk-size", type=int, default=40, help="Символов во фрагменте потока")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 5xx")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After для 429, сек")
+    parser.add_argument("--max-concurrency", type=int, default=0,
+                        help="429 при большем числе одновременных запросов (0 — без лимита)")
+    parser.add_argument("--stream-abort-rate", type=float, default=0.0, help="Доля потоков, оборванных ошибкой")
+    parser.add_argument("--unsafe-rate", type=float, default=0.0, help="Доля вердиктов «небезопасно»")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def settings_from_args(args: argparse.Namespace) -> FakeSettings:
+    return FakeSettings(
+        latency=args.latency,
+        model_latency=dict(item.split("=", 1) for item in args.model_latency),
+        chunk_delay=args.chunk_delay,
+        chunk_size=args.chunk_size,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        max_concurrency=args.max_concurrency,
+        stream_abort_rate=args.stream_abort_rate,
+        unsafe_rate=args.unsafe_rate,
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    print(f"🧪 Заглушка OpenRouter: http://{arguments.host}:{arguments.port}/api/v1")
+    web.run_app(create_app(settings_from_args(arguments)), host=arguments.host, port=arguments.port, print=None)
@@ -0,0 +1,172 @@
+"""
+Отчёт по трассам из JSONL (TRACING_EXPORTER=jsonl)
+
+Для каждой трассы — дерево спанов (смещение от начала, длительность,
+атрибуты) и разбивка времени: модель, сеть, ожидание лимитера, повторы
+и всё остальное — наш код и Telegram. Сводка по всем трассам —
+p50/p95 по именам спанов.
+
+Примеры:
+    python scripts/trace_report.py                      # последняя трасса
+    python scripts/trace_report.py --last 5
+    python scripts/trace_report.py --trace 4bf92f3577b34da6a3ce929d0e0e4736
+    python scripts/trace_report.py --summary
+"""
+
+import sys
+import json
+import argparse
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from src.core.config import config  # noqa: E402
+
+# Этапы, время которых — не наш код
+CATEGORIES = {
+    "http.ttfb": "модель",
+    "model.first_token": "модель",
+    "http.body_read": "модель",
+    "http.dns": "сеть",
+    "http.connect": "сеть",
+    "http.pool_wait": "сеть",
+    "queue_wait": "лимитер",
+    "retry_backoff": "повторы",
+}
+OWN_CODE = "наш код и Telegram"
+
+
+def load_spans(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Спаны по trace_id в порядке начала"""
+    traces = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                span = json.loads(line)
+                traces[span["trace_id"]].append(span)
+    for spans in traces.values():
+        spans.sort(key=lambda s: s["start_ns"])
+    return traces
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def union_ms(intervals: List[Tuple[int, int]]) -> float:
+    """Суммарная длина объединения интервалов (параллельные запросы не считаются дважды)"""
+    total = 0
+    current_start = current_end = None
+    for start, end in sorted(intervals):
+        if current_end is None or start > current_end:
+            if current_end is not None:
+                total += current_end - current_start
+            current_start, current_end = start, end
+        else:
+            current_end = max(current_end, end)
+    if current_end is not None:
+        total += current_end - current_start
+    return total / 1e6
+
+
+def breakdown(spans: List[Dict[str, Any]], root: Dict[str, Any]) -> Dict[str, float]:
+    """Время трассы по категориям, мс"""
+    intervals = defaultdict(list)
+    for span in spans:
+        category = CATEGORIES.get(span["name"])
+        if category:
+            intervals[category].append((span["start_ns"], span["end_ns"]))
+
+    result = {category: union_ms(items) for category, items in intervals.items()}
+    external = union_ms([item for items in intervals.values() for item in items])
+    result[OWN_CODE] = max(0.0, root["duration_ms"] - external)
+    return result
+
+
+def print_trace(spans: List[Dict[str, Any]]):
+    children = defaultdict(list)
+    ids = {span["span_id"] for span in spans}
+    roots = []
+    for span in spans:
+        if span["parent_id"] in ids:
+            children[span["parent_id"]].append(span)
+        else:
+            roots.append(span)
+
+    origin = spans[0]["start_ns"]
+
+    def walk(span: Dict[str, Any], depth: int):
+        attributes = " ".join(f"{k}={v}" for k, v in span["attributes"].items())
+        status = f" ❌ {span['error']}" if span["status"] == "error" else ""
+        print(
+            f"{(span['start_ns'] - origin) / 1e6:>9.1f} {span['duration_ms']:>9.1f}  "
+            f"{'  ' * depth}{span['name']}  {attributes}{status}"
+        )
+        for child in children[span["span_id"]]:
+            walk(child, depth + 1)
+
+    print(f"\n🔭 trace {spans[0]['trace_id']}")
+    print(f"{'старт, мс':>9} {'мс':>9}  этап")
+    for root in roots:
+        walk(root, 0)
+
+    root = max(roots, key=lambda s: s["duration_ms"])
+    print(f"\n  Разбивка {root['name']} ({root['duration_ms']:.0f} мс):")
+    for category, ms in sorted(breakdown(spans, root).items(), key=lambda item: -item[1]):
+        print(f"    {category:<22}{ms:>9.0f} мс  {ms / max(root['duration_ms'], 1e-9):>5.0%}")
+
+
+def print_summary(traces: Dict[str, List[Dict[str, Any]]]):
+    durations = defaultdict(list)
+    errors = defaultdict(int)
+    for spans in traces.values():
+        for span in spans:
+            durations[span["name"]].append(span["duration_ms"])
+            errors[span["name"]] += span["status"] == "error"
+
+    print(f"\n📊 {len(traces)} трасс")
+    print(f"{'этап':<28}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}{'ошибок':>8}")
+    for name, samples in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        print(
+            f"{name:<28}{len(samples):>8}{percentile(samples, 0.5):>10.1f}"
+            f"{percentile(samples, 0.95):>10.1f}{errors[name]:>8}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Отчёт по трассам из JSONL")
+    parser.add_argument("path", nargs="?", default=config.TRACING_PATH, help="Файл спанов (по умолчанию TRACING_PATH)")
+    parser.add_argument("--trace", help="trace_id для вывода")
+    parser.add_argument("--last", type=int, default=1, help="Сколько последних трасс вывести")
+    parser.add_argument("--summary", action="store_true", help="Сводка p50/p95 по этапам вместо деревьев")
+    args = parser.parse_args()
+
+    if not Path(args.path).exists():
+        print(f"❌ Нет файла {args.path}: включите TRACING_EXPORTER=jsonl")
+        return 1
+
+    traces = load_spans(args.path)
+    if not traces:
+        print("Трасс нет")
+        return 0
+
+    if args.summary:
+        print_summary(traces)
+    elif args.trace:
+        if args.trace not in traces:
+            print(f"❌ Трасса {args.trace} не найдена")
+            return 1
+        print_trace(traces[args.trace])
+    else:
+        recent = sorted(traces.values(), key=lambda spans: spans[0]["start_ns"])[-args.last:]
+        for spans in recent:
+            print_trace(spans)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
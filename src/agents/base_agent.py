@@ -2,10 +2,17 @@
 Базовый класс для AI-агентов
 """
 
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Callable, Awaitable
 from abc import ABC, abstractmethod
 
-from src.services.openrouter import OpenRouterService
+from src.core.config import config
+from src.core.deadline import Deadline
+from src.core.logger import logger
+from src.core.tracing import activated, span
+from src.services.cache import PersistentCache, make_cache_key
+from src.services.openrouter import CompletionStream, OpenRouterService, build_messages
+from src.utils.helpers import gather_bounded, hash_content, normalize_content
+from src.utils.tokens import max_tokens_for_length
 
 
 class BaseAgent(ABC):
@@ -13,12 +20,18 @@ class BaseAgent(ABC):
     Базовый класс для всех AI-агентов
     """
     
-    def __init__(self, openrouter: OpenRouterService):
+    # Версия промптов агента: входит в ключ кэша вердиктов, чтобы правка
+    # промпта не возвращала вердикты, полученные по старому
+    PROMPT_VERSION = ""
+    
+    def __init__(self, openrouter: OpenRouterService, verdict_cache: Optional[PersistentCache] = None):
         """
         Args:
             openrouter: Сервис OpenRouter для AI-генерации
+            verdict_cache: Кэш вердиктов проверяющих агентов по хешу контента
         """
         self.openrouter = openrouter
+        self.verdict_cache = verdict_cache
     
     @abstractmethod
     def get_system_prompt(self) -> str:
@@ -34,8 +47,17 @@ class BaseAgent(ABC):
         self,
         user_prompt: str,
         temperature: float = 0.7,
-        max_tokens: int = 2000
-    ) -> Dict[str, Any]:
+        max_tokens: int = 2000,
+        stream: bool = False,
+        use_cache: Optional[bool] = None,
+        specialty: Optional[str] = None,
+        system_context: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        system_prompt: Optional[str] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        max_length: Optional[int] = None,
+        refresh_cache: bool = False
+    ):
         """
         Генерирует ответ через OpenRouter
         
@@ -43,21 +65,88 @@ class BaseAgent(ABC):
             user_prompt: Пользовательский промпт
             temperature: Температура генерации
             max_tokens: Максимум токенов
+            stream: Потоковый режим (вернётся CompletionStream)
+            use_cache: Кэш ответов (None — по температуре, False — обойти)
+            refresh_cache: Не читать кэш, но перезаписать ответ в нём
+            specialty: Специализация (для журнала токенов и её бюджета)
+            system_context: Статичное дополнение к системному промпту
+                (промпт специализации) — попадает в кэшируемый префикс
+            deadline: Срок выполнения (остаток бюджета этапа)
+            system_prompt: Замена get_system_prompt() для этого вызова
+                (например, короткий промпт для простых случаев)
+            response_format: Структурированный ответ (json_schema_format);
+                модели без поддержки получат обычный запрос
+            max_length: Длина ответа в символах — вместо max_tokens
+                (max_tokens считается из неё с запасом)
+        
+        Промпт, не помещающийся в окно контекста моделей, отклоняется
+        до запроса к API ({"context_overflow": True}), а max_tokens
+        урезается до остатка окна (см. src/utils/tokens.py).
         
         Returns:
-            Результат генерации
+            Результат генерации или CompletionStream при stream=True
+        
+        Спан agent.generate потокового вызова закрывается вместе с потоком,
+        после дочернего openrouter.generate.
         """
-        messages = [
-            {"role": "system", "content": self.get_system_prompt()},
-            {"role": "user", "content": user_prompt}
-        ]
+        generate_span = span("agent.generate", agent=type(self).__name__, specialty=specialty, stream=stream)
+        try:
+            with activated(generate_span):
+                # Системный промпт агента и промпт специализации не меняются от вызова
+                # к вызову — провайдер кэширует их как префикс
+                with span("prompt.build"):
+                    messages = build_messages(user_prompt, [system_prompt or self.get_system_prompt(), system_context])
+                
+                if max_length:
+                    max_tokens = max_tokens_for_length(max_length)
+                
+                result = await self.openrouter.generate(
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=stream,
+                    use_cache=use_cache,
+                    metadata={"agent": type(self).__name__, "specialty": specialty},
+                    deadline=deadline,
+                    response_format=response_format,
+                    refresh_cache=refresh_cache
+                )
+        except BaseException as error:
+            generate_span.end(error=error)
+            raise
         
-        return await self.openrouter.generate(
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens
+        if isinstance(result, CompletionStream):
+            result.end_with(generate_span)
+        else:
+            generate_span.end()
+        return result
+    
+    def verdict_key(self, content: str, specialty: Optional[str] = None) -> str:
+        """Ключ вердикта: агент + хеш нормализованного текста + специализация + версия промпта + модель"""
+        return make_cache_key(
+            type(self).__name__,
+            hash_content(normalize_content(content)),
+            specialty,
+            self.PROMPT_VERSION,
+            config.DEFAULT_MODEL
         )
     
+    async def cached_verdict(self, content: str, specialty: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Сохранённый вердикт для этого текста (None — проверять заново)"""
+        if self.verdict_cache is None:
+            return None
+        verdict = await self.verdict_cache.get(self.verdict_key(content, specialty))
+        if verdict is not None:
+            logger.info(f"⚡ {type(self).__name__}: вердикт из кэша")
+            return {**verdict, "cached": True}
+        return None
+    
+    async def store_verdict(self, content: str, verdict: Dict[str, Any], specialty: Optional[str] = None):
+        """Запоминает вердикт для этого текста"""
+        if self.verdict_cache is None:
+            return
+        await self.verdict_cache.set(self.verdict_key(content, specialty), verdict)
+    
     @abstractmethod
     async def execute(self, **kwargs) -> Dict[str, Any]:
         """
@@ -71,5 +160,36 @@ class BaseAgent(ABC):
         """
         pass
 
+    async def execute_many(
+        self,
+        items: List[Dict[str, Any]],
+        concurrency: int = None,
+        on_progress: Optional[Callable[[int, int, int, Dict[str, Any]], Awaitable[None]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Выполняет execute() для пачки входов с ограничением параллельности
+
+        Args:
+            items: Аргументы execute() для каждого элемента
+                (например, [{"news": ..., "channel": ...}, ...])
+            concurrency: Максимум одновременных вызовов
+                (по умолчанию OPENROUTER_BATCH_CONCURRENCY)
+            on_progress: Корутина (done, total, index, result)
+
+        Returns:
+            Результаты в порядке items; исключение в одном элементе
+            превращается в {"success": False, "error": ...}
+        """
+        concurrency = concurrency or config.OPENROUTER_BATCH_CONCURRENCY
+        logger.info(f"📦 {type(self).__name__}: пакет из {len(items)}, параллельно до {concurrency}")
+
+        return await gather_bounded(
+            items,
+            lambda item: self.execute(**item),
+            concurrency=concurrency,
+            on_progress=on_progress,
+            on_error=lambda item, e: {"success": False, "error": str(e) or type(e).__name__}
+        )
+
 
 __all__ = ["BaseAgent"]
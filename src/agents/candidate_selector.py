@@ -0,0 +1,113 @@
+"""
+Выбор лучшего из нескольких черновиков поста
+
+Черновики ранжируются по вердикту SafetyAgent (безопасность важнее всего),
+затем по попаданию в целевую длину и соответствию стилю канала.
+"""
+
+from typing import Dict, Any, List, Tuple
+
+from src.agents.safety_pipeline import SEVERITY_ORDER
+from src.services.validator import PostValidator
+
+# Целевая длина из GENERATOR_SYSTEM_PROMPT / USER_PROMPT_TEMPLATE
+TARGET_LENGTH = (500, 800)
+
+# Маркеры структуры, которых требует USER_PROMPT_TEMPLATE
+STRUCTURE_MARKERS = ("📌", "✅", "🔹", "❗️")
+
+validator = PostValidator()
+
+
+def length_score(content: str, target: Tuple[int, int] = TARGET_LENGTH) -> float:
+    """1.0 внутри целевого диапазона, линейно до 0 при пустом тексте или двойной длине"""
+    low, high = target
+    length = len(content)
+    if low <= length <= high:
+        return 1.0
+    if length < low:
+        return length / low
+    return max(0.0, 1 - (length - high) / high)
+
+
+def style_score(content: str, channel: Dict[str, Any]) -> float:
+    """
+    Доля выполненных требований к оформлению поста (0..1)
+
+    Эмодзи канала в заголовке, жирный заголовок, маркеры структуры,
+    ссылка на канал в конце и отсутствие стоп-слов PostValidator.
+    """
+    lines = content.strip().splitlines()
+    first_line = lines[0] if lines else ""
+    last_line = lines[-1] if lines else ""
+
+    checks = [
+        bool(channel.get("emoji")) and channel["emoji"] in first_line,
+        "<b>" in first_line,
+        sum(marker in content for marker in STRUCTURE_MARKERS) >= 2,
+        "<a href=" in last_line and (not channel.get("link") or channel["link"] in last_line),
+        validator.validate_post(content)["valid"]
+    ]
+    return sum(checks) / len(checks)
+
+
+def severity_rank(safety: Dict[str, Any]) -> int:
+    """Чем больше, тем хуже; проверка, которая не удалась, — хуже любого вердикта"""
+    if not safety or not safety.get("success"):
+        return len(SEVERITY_ORDER) + 1
+    severity = safety.get("severity")
+    return SEVERITY_ORDER.index(severity) if severity in SEVERITY_ORDER else len(SEVERITY_ORDER)
+
+
+def score_candidate(candidate: Dict[str, Any], channel: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Оценивает черновик
+
+    Args:
+        candidate: {"content": ..., "safety": результат SafetyAgent.execute()}
+        channel: Данные канала (emoji, link)
+
+    Returns:
+        Dict с компонентами оценки; score — длина и стиль поровну (0..1)
+    """
+    content = candidate.get("content", "")
+    safety = candidate.get("safety") or {}
+
+    length = length_score(content)
+    style = style_score(content, channel)
+
+    return {
+        "is_safe": bool(safety.get("is_safe")),
+        "severity_rank": severity_rank(safety),
+        "length": round(length, 3),
+        "style": round(style, 3),
+        "score": round((length + style) / 2, 3)
+    }
+
+
+def select_best(candidates: List[Dict[str, Any]], channel: Dict[str, Any]) -> int:
+    """
+    Индекс лучшего черновика (-1, если ни один не сгенерирован)
+
+    Порядок: безопасный → меньшая severity → выше score. Оценка
+    записывается в candidate["score"].
+    """
+    best_index, best_key = -1, None
+
+    for index, candidate in enumerate(candidates):
+        if not candidate.get("success"):
+            continue
+
+        candidate["score"] = score_candidate(candidate, channel)
+        key = (
+            candidate["score"]["is_safe"],
+            -candidate["score"]["severity_rank"],
+            candidate["score"]["score"]
+        )
+        if best_key is None or key > best_key:
+            best_index, best_key = index, key
+
+    return best_index
+
+
+__all__ = ["select_best", "score_candidate", "length_score", "style_score"]
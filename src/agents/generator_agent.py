@@ -2,15 +2,25 @@
 Агент генерации медицинского контента
 """
 
-from typing import Dict, Any
+import time
+import asyncio
+from contextlib import aclosing
+from typing import Dict, Any, List, Callable, Awaitable, Optional
 
 from src.agents.base_agent import BaseAgent
-from src.agents.generator_prompts import (
-    GENERATOR_SYSTEM_PROMPT,
-    USER_PROMPT_TEMPLATE
-)
-from src.agents.specialty_loader import get_specialty_config
+from src.agents.generator_prompts import GENERATOR_SYSTEM_PROMPT, USER_PROMPT_TEMPLATE, STYLE_EXAMPLES_TEMPLATE
+from src.agents.prompt_templates import specialty_context, generator_user_template
+from src.agents.candidate_selector import select_best
+from src.agents.safety_agent import SafetyAgent
+from src.core.config import config
+from src.core.deadline import Deadline
+from src.core.exceptions import GenerationAborted
 from src.core.logger import logger
+from src.core.tracing import current_span, span, traced
+from src.services.examples_index import ExamplesIndex
+from src.services.openrouter import OpenRouterService
+from src.utils.helpers import hash_content
+from src.utils.tokens import trim_to_tokens
 
 
 class ContentGeneratorAgent(BaseAgent):
@@ -18,14 +28,30 @@ class ContentGeneratorAgent(BaseAgent):
     Агент для генерации медицинского контента
     """
     
+    # Версия промптов: входит в ключ кэша принятых черновиков (DraftCache)
+    PROMPT_VERSION = hash_content(GENERATOR_SYSTEM_PROMPT + USER_PROMPT_TEMPLATE + STYLE_EXAMPLES_TEMPLATE)[:12]
+    
+    def __init__(self, openrouter: OpenRouterService, examples_index: Optional[ExamplesIndex] = None):
+        """
+        Args:
+            openrouter: Сервис OpenRouter для AI-генерации
+            examples_index: Индекс постов каналов для few-shot примеров стиля
+        """
+        super().__init__(openrouter)
+        self.examples_index = examples_index
+    
     def get_system_prompt(self) -> str:
         """Возвращает системный промпт генератора"""
         return GENERATOR_SYSTEM_PROMPT
     
+    @traced("generator.execute")
     async def execute(
         self,
         news: Dict[str, Any],
-        channel: Dict[str, Any]
+        channel: Dict[str, Any],
+        on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+        deadline: Optional[Deadline] = None,
+        temperature: float = 0.7
     ) -> Dict[str, Any]:
         """
         Генерирует пост на основе новости
@@ -41,45 +67,90 @@ class ContentGeneratorAgent(BaseAgent):
                 - specialty: Специализация
                 - emoji: Эмодзи канала
                 - link: Ссылка на канал
+            on_chunk: Корутина, вызываемая с текущим черновиком по мере
+                потоковой генерации (для живого превью в боте). Может
+                бросить GenerationAborted, чтобы остановить генерацию
+            deadline: Срок генерации (по умолчанию OPENROUTER_TIMEOUT)
+            temperature: Температура генерации
         
         Returns:
             Dict с результатом генерации
         """
         logger.info(f"🤖 Генерация поста для {channel.get('name')}")
         
-        # Получаем специализированные инструкции
+        # Промпт специализации (сотни строк) уходит в кэшируемый системный
+        # префикс, в user prompt — только ссылка на него
         specialty = channel.get("specialty", "")
-        specialty_config = get_specialty_config(specialty)
-        
-        custom_instructions = ""
-        if specialty_config:
-            custom_instructions = specialty_config.get("prompt", "")
-        
-        # Формируем user prompt
-        user_prompt = USER_PROMPT_TEMPLATE.format(
-            news_title=news.get("title", ""),
-            news_content=news.get("content", ""),
-            news_source=news.get("source_name", ""),
-            news_url=news.get("source_url", ""),
-            channel_name=channel.get("name", ""),
-            specialty=channel.get("specialty", ""),
-            channel_emoji=channel.get("emoji", ""),
-            channel_link=channel.get("link", ""),
-            custom_instructions=custom_instructions
-        )
+        specialty_prompt = specialty_context(specialty)
+        execute_span = current_span().set(specialty=specialty, stream=on_chunk is not None)
+        
+        with span("prompt.build"):
+            # Данные канала подставлены в шаблон заранее, здесь — только новость
+            template = generator_user_template(
+                specialty,
+                channel.get("name", ""),
+                channel.get("emoji", ""),
+                channel.get("link", "")
+            )
+            # Длинная новость (полный текст статьи) обрезается до бюджета
+            user_prompt = template.render(
+                news_title=news.get("title", ""),
+                news_content=trim_to_tokens(news.get("content", ""), config.NEWS_CONTENT_MAX_TOKENS),
+                news_source=news.get("source_name", ""),
+                news_url=news.get("source_url", ""),
+                style_examples=self._style_examples(news, specialty)
+            )
         
         # Генерируем контент
-        result = await self.generate(
-            user_prompt=user_prompt,
-            temperature=0.7,
-            max_tokens=2000
-        )
+        if on_chunk:
+            stream = await self.generate(
+                user_prompt=user_prompt,
+                temperature=temperature,
+                max_length=config.POST_MAX_LENGTH,
+                stream=True,
+                specialty=specialty,
+                system_context=specialty_prompt,
+                deadline=deadline
+            )
+            # Время в on_chunk (правки превью в Telegram, проверка абзацев) —
+            # наш код, а не модель: видно в атрибуте on_chunk_ms
+            on_chunk_ns = 0
+            try:
+                # aclosing: при остановке соединение с моделью закрывается сразу
+                async with aclosing(stream.__aiter__()) as deltas:
+                    async for _ in deltas:
+                        chunk_started_ns = time.time_ns()
+                        await on_chunk(stream.content)
+                        on_chunk_ns += time.time_ns() - chunk_started_ns
+            except GenerationAborted as e:
+                logger.warning(f"🛑 Генерация остановлена: {e}")
+                execute_span.set(aborted=True)
+                return {
+                    "success": False,
+                    "aborted": True,
+                    "error": str(e),
+                    "content": stream.content
+                }
+            finally:
+                execute_span.set(on_chunk_ms=round(on_chunk_ns / 1e6, 3))
+            result = stream.to_result()
+        else:
+            result = await self.generate(
+                user_prompt=user_prompt,
+                temperature=temperature,
+                max_length=config.POST_MAX_LENGTH,
+                specialty=specialty,
+                system_context=specialty_prompt,
+                deadline=deadline
+            )
         
         if not result["success"]:
             logger.error(f"❌ Ошибка генерации: {result.get('error')}")
+            execute_span.fail(result.get("error"))
             return result
         
         content = result["content"].strip()
+        execute_span.set(chars=len(content))
         
         logger.info(f"✅ Пост сгенерирован ({len(content)} символов)")
         
@@ -89,9 +160,118 @@ class ContentGeneratorAgent(BaseAgent):
             "metadata": {
                 "specialty": specialty,
                 "channel": channel.get("name"),
-                "length": len(content)
+                "length": len(content),
+                "temperature": temperature
             }
         }
+    
+    def _style_examples(self, news: Dict[str, Any], specialty: str) -> str:
+        """Блок few-shot примеров: популярные посты канала, близкие к теме новости"""
+        if self.examples_index is None or config.FEW_SHOT_EXAMPLES <= 0:
+            return ""
+        
+        query = f"{news.get('title', '')}\n{news.get('content', '')}"
+        with span("examples.search"):
+            examples = self.examples_index.search(query, specialty, k=config.FEW_SHOT_EXAMPLES)
+        if not examples:
+            return ""
+        
+        logger.info(f"📚 Few-shot: посты {[example['id'] for example in examples]}")
+        return STYLE_EXAMPLES_TEMPLATE.format(examples="\n\n".join(
+            f"## Пример {number}\n{trim_to_tokens(example['text'], config.FEW_SHOT_EXAMPLE_MAX_TOKENS)}"
+            for number, example in enumerate(examples, start=1)
+        ))
+    
+    async def execute_candidates(
+        self,
+        news: Dict[str, Any],
+        channel: Dict[str, Any],
+        safety_agent: SafetyAgent,
+        count: int = None,
+        temperatures: Optional[List[float]] = None,
+        deadline: Optional[Deadline] = None,
+        on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Генерирует несколько черновиков параллельно и выбирает лучший
+        
+        Каждый черновик сразу после генерации проверяется SafetyAgent,
+        не дожидаясь остальных. Лучший выбирается candidate_selector'ом:
+        безопасность, затем длина и стиль.
+        
+        Args:
+            news: Словарь с новостью (как в execute)
+            channel: Словарь с данными канала (как в execute)
+            safety_agent: SafetyAgent для проверки черновиков
+            count: Число черновиков (по умолчанию GENERATION_CANDIDATES)
+            temperatures: Температуры черновиков (по умолчанию
+                GENERATION_CANDIDATE_TEMPERATURES, по кругу)
+            deadline: Общий срок; генерация оставляет SAFETY_RESERVE проверке
+            on_progress: Корутина (done, total) по мере готовности черновиков
+        
+        Returns:
+            Dict как у execute() для лучшего черновика + safety (его вердикт)
+            и candidates (все черновики с оценками)
+        """
+        count = count or config.GENERATION_CANDIDATES
+        temperatures = temperatures or config.GENERATION_CANDIDATE_TEMPERATURES
+        # Одинаковые запросы OpenRouterService объединяет в один,
+        # поэтому повторяющиеся температуры слегка сдвигаются
+        temperatures = [
+            round(temperatures[i % len(temperatures)] + 0.01 * (i // len(temperatures)), 2)
+            for i in range(count)
+        ]
+        
+        logger.info(f"🤖 {count} черновиков для {channel.get('name')}, температуры {temperatures}")
+        done = 0
+        
+        async def candidate(temperature: float) -> Dict[str, Any]:
+            nonlocal done
+            result = await self.execute(
+                news=news,
+                channel=channel,
+                deadline=deadline.reserve(config.SAFETY_RESERVE) if deadline else None,
+                temperature=temperature
+            )
+            if result["success"]:
+                result["safety"] = await safety_agent.execute(
+                    content=result["content"],
+                    specialty=channel.get("specialty", ""),
+                    channel_name=channel.get("name", ""),
+                    deadline=deadline
+                )
+            done += 1
+            if on_progress:
+                try:
+                    await on_progress(done, count)
+                except Exception as e:
+                    logger.warning(f"Progress callback failed: {e}")
+            return result
+        
+        candidates = list(await asyncio.gather(
+            *[candidate(t) for t in temperatures],
+            return_exceptions=True
+        ))
+        candidates = [
+            c if isinstance(c, dict) else {"success": False, "error": str(c) or type(c).__name__}
+            for c in candidates
+        ]
+        
+        best_index = select_best(candidates, channel)
+        if best_index < 0:
+            logger.error("❌ Ни один черновик не сгенерирован")
+            return {
+                "success": False,
+                "error": candidates[0].get("error") if candidates else "нет черновиков",
+                "candidates": candidates
+            }
+        
+        best = candidates[best_index]
+        logger.info(
+            f"🏆 Выбран черновик {best_index + 1}/{count} "
+            f"(t={temperatures[best_index]}, {best['safety'].get('severity')}, score={best['score']['score']})"
+        )
+        return {**best, "best_index": best_index, "candidates": candidates}
 
 
 __all__ = ["ContentGeneratorAgent"]
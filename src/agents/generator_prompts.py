@@ -104,7 +104,7 @@ USER_PROMPT_TEMPLATE = """
 # СПЕЦИАЛИЗИРОВАННЫЕ ИНСТРУКЦИИ
 
 {custom_instructions}
-
+{style_examples}
 ---
 
 # ТВОЯ ЗАДАЧА
@@ -127,6 +127,18 @@ USER_PROMPT_TEMPLATE = """
 **Верни только текст поста без комментариев и пояснений.**
 """
 
+# Few-shot примеры постов канала (подставляется в {style_examples})
+STYLE_EXAMPLES_TEMPLATE = """
+---
+
+# ПРИМЕРЫ ПОСТОВ КАНАЛА
+
+Удачные посты этого канала на близкие темы. Возьми из них тон, подачу
+и оформление, но не копируй текст и факты — пост пишется по новости выше.
+
+{examples}
+"""
+
 # ==============================================================================
 # REGENERATION PROMPT
 # ==============================================================================
@@ -163,8 +175,41 @@ REGENERATION_PROMPT_TEMPLATE = """
 **Верни только исправленный текст поста.**
 """
 
+# ==============================================================================
+# ГЕНЕРАЦИЯ ПО ТЕМЕ (ContentGeneratorService.generate_from_topic)
+# ==============================================================================
+
+TOPIC_SYSTEM_PROMPT_TEMPLATE = """ДОПОЛНИТЕЛЬНЫЕ ТРЕБОВАНИЯ:
+- Длина поста: максимум {max_length} символов
+- Обязательно используй эмодзи {emoji} в начале
+- Добавь ссылку на канал {channel_link} в конце
+- Следуй шаблону "{post_type}" из промпта
+- Пиши понятно и для врачей, и для пациентов
+- Используй актуальные данные (февраль 2026)
+"""
+
+TOPIC_USER_PROMPT_TEMPLATE = """Создай пост для медицинского Telegram-канала на тему:
+
+📌 ТЕМА: {topic}
+
+ТИП ПОСТА: {post_type}
+
+ТРЕБОВАНИЯ:
+1. Используй актуальные данные и исследования (2026 год)
+2. Укажи конкретные источники (клинрекомендации, исследования)
+3. Добавь практическую ценность для врачей
+4. Структурируй по шаблону из промпта специализации
+5. Не превышай {max_length} символов
+6. Обязательно начни с эмодзи {emoji}
+7. В конце добавь ссылку: {channel_link}
+
+Создай готовый к публикации пост."""
+
 __all__ = [
     "GENERATOR_SYSTEM_PROMPT",
     "USER_PROMPT_TEMPLATE",
-    "REGENERATION_PROMPT_TEMPLATE"
+    "STYLE_EXAMPLES_TEMPLATE",
+    "REGENERATION_PROMPT_TEMPLATE",
+    "TOPIC_SYSTEM_PROMPT_TEMPLATE",
+    "TOPIC_USER_PROMPT_TEMPLATE"
 ]
@@ -0,0 +1,228 @@
+"""
+Конвейер поста: генерация → дубликаты → безопасность → статус
+
+Один и тот же граф этапов используют интерактивный сценарий бота,
+пакетный прогон (scripts/bench_generation.py) и ContentGeneratorService:
+
+    generate ──► dedup ──► safety ──► review
+
+Публикуется ровно тот текст, который проверен: run["generate"]["content"].
+Лимиты одновременных генераций и проверок (PIPELINE_*_CONCURRENCY) общие
+для всех прогонов процесса; проверки абзацев во время генерации занимают
+слоты того же этапа safety.
+
+Входные данные прогона (ctx.inputs):
+    news, channel      — как у ContentGeneratorAgent.execute()
+    deadline           — общий Deadline генерации и проверки
+    on_chunk           — корутина (черновик) для живого превью
+    on_progress        — корутина (done, total) в режиме нескольких черновиков
+    candidates         — число черновиков (по умолчанию GENERATION_CANDIDATES)
+    pipelined          — проверять абзацы во время генерации (по умолчанию SAFETY_PIPELINING)
+    fragment_min_chars — минимальный фрагмент конвейерной проверки
+    check_duplicates   — искать почти-дубликат черновика (по умолчанию да)
+
+Пример:
+    pipeline = build_post_pipeline(generator_agent, safety_agent, duplicates=duplicate_index)
+    run = await pipeline.run(news=news, channel=channel, deadline=Deadline(config.GENERATION_SLA))
+    if run.ok:
+        text, review = run["generate"]["content"], run["review"]
+    elif run.stopped:
+        match = run.stop_details["match"]    # почти-дубликат
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from src.agents.safety_pipeline import PipelinedSafetyCheck
+from src.core.config import config
+from src.core.exceptions import GenerationAborted, GenerationError
+from src.core.logger import logger
+from src.core.pipeline import Pipeline, PipelineContext, Stage
+
+# Причина остановки прогона: черновик почти совпадает с существующим постом
+STOP_DUPLICATE = "duplicate"
+
+# Статус поста для редактора по вердикту безопасности
+STATUS_SAFE = {"emoji": "✅", "text": "БЕЗОПАСНО", "color": "🟢"}
+STATUS_ATTENTION = {"emoji": "⚠️", "text": "ТРЕБУЕТ ВНИМАНИЯ", "color": "🟡"}
+STATUS_FIX = {"emoji": "❌", "text": "ТРЕБУЕТ ПРАВКИ", "color": "🔴"}
+STATUS_UNCHECKED = {"emoji": "❔", "text": "НЕ ПРОВЕРЕН", "color": "⚪"}
+
+# severity поста, чей этап safety пропущен (конвейер без агента проверки)
+SEVERITY_UNCHECKED = "unchecked"
+
+
+def review_status(is_safe: bool, severity: str) -> Dict[str, str]:
+    """Статус для превью: безопасно / требует внимания / требует правки / не проверен"""
+    if severity == SEVERITY_UNCHECKED:
+        return STATUS_UNCHECKED
+    if is_safe and severity == "safe":
+        return STATUS_SAFE
+    if severity in ["low", "medium"]:
+        return STATUS_ATTENTION
+    return STATUS_FIX
+
+
+def build_post_pipeline(
+    generator_agent=None,
+    safety_agent=None,
+    duplicates=None,
+    generate: Optional[Callable[[PipelineContext], Awaitable[Dict[str, Any]]]] = None,
+    name: str = "post",
+    generate_concurrency: int = None,
+    safety_concurrency: int = None
+) -> Pipeline:
+    """
+    Собирает конвейер поста
+
+    Args:
+        generator_agent: ContentGeneratorAgent (этап generate по умолчанию)
+        safety_agent: SafetyAgent / VerificationAgent; без него этап safety пропускается,
+            а review отдаёт severity=SEVERITY_UNCHECKED
+        duplicates: DuplicateIndex; без него этап dedup пропускается
+        generate: Свой этап генерации ctx → {"success", "content", ...}
+            (например, ContentGeneratorService.generate_from_topic)
+        name: Имя конвейера (в логах, спанах и статистике)
+        generate_concurrency: Одновременных генераций (по умолчанию PIPELINE_GENERATE_CONCURRENCY)
+        safety_concurrency: Одновременных проверок (по умолчанию PIPELINE_SAFETY_CONCURRENCY)
+    """
+    if generate is None and generator_agent is None:
+        raise ValueError("Нужен generator_agent или свой этап generate")
+
+    async def generate_with_agent(ctx: PipelineContext) -> Dict[str, Any]:
+        inputs = ctx.inputs
+        channel = inputs["channel"]
+        deadline = inputs.get("deadline")
+
+        if safety_agent is not None and inputs.get("candidates", config.GENERATION_CANDIDATES) > 1:
+            # Несколько черновиков параллельно, каждый сразу проверяется —
+            # вердикт лучшего этап safety берёт готовым
+            return await generator_agent.execute_candidates(
+                news=inputs["news"],
+                channel=channel,
+                safety_agent=safety_agent,
+                count=inputs.get("candidates"),
+                deadline=deadline,
+                on_progress=inputs.get("on_progress")
+            )
+
+        # Абзацы проверяются, пока пост ещё пишется; критичная проблема останавливает генерацию
+        safety_check = None
+        if safety_agent is not None and inputs.get("pipelined", config.SAFETY_PIPELINING):
+            safety_check = PipelinedSafetyCheck(
+                safety_agent,
+                specialty=channel["specialty"],
+                channel_name=channel["name"],
+                deadline=deadline,
+                min_chars=inputs.get("fragment_min_chars"),
+                slot=safety_step.slot
+            )
+            ctx.state["safety_check"] = safety_check
+            ctx.on_abort(safety_check.cancel)
+
+        on_chunk = inputs.get("on_chunk")
+
+        async def feed(draft: str):
+            if safety_check:
+                safety_check.feed(draft)
+            if on_chunk:
+                await on_chunk(draft)
+
+        return await generator_agent.execute(
+            news=inputs["news"],
+            channel=channel,
+            on_chunk=feed if on_chunk or safety_check else None,
+            deadline=deadline.reserve(config.SAFETY_RESERVE) if deadline else None
+        )
+
+    async def generate_stage(ctx: PipelineContext) -> Dict[str, Any]:
+        result = await (generate or generate_with_agent)(ctx)
+        if result.get("aborted"):
+            raise GenerationAborted(f"Генерация остановлена проверкой безопасности: {result.get('error')}")
+        if not result["success"]:
+            raise GenerationError(f"Ошибка генерации: {result.get('error')}")
+        return result
+
+    async def dedup_stage(ctx: PipelineContext):
+        """Повтор существующего поста не стоит проверки безопасности"""
+        match = duplicates.find_post(ctx.results["generate"]["content"], ctx.inputs["channel"]["specialty"])
+        if match:
+            logger.info(f"♻️ Черновик похож на {match['key']} ({match['similarity']})")
+            ctx.stop(STOP_DUPLICATE, match=match)
+
+    async def safety_stage(ctx: PipelineContext) -> Dict[str, Any]:
+        generated = ctx.results["generate"]
+        channel = ctx.inputs["channel"]
+        safety_check = ctx.state.get("safety_check")
+
+        if "safety" in generated:
+            result = generated["safety"]
+        elif safety_check:
+            result = await safety_check.finish(generated["content"])
+        else:
+            result = await safety_agent.execute(
+                content=generated["content"],
+                specialty=channel["specialty"],
+                channel_name=channel["name"],
+                deadline=ctx.inputs.get("deadline")
+            )
+
+        if not result["success"]:
+            raise GenerationError(f"Ошибка проверки безопасности: {result.get('error')}")
+        return result
+
+    async def review_stage(ctx: PipelineContext) -> Dict[str, Any]:
+        safety = ctx.results["safety"]
+        if safety is None:
+            # Проверки не было — это не «требует правки», а «не проверен»
+            return {
+                "is_safe": False,
+                "severity": SEVERITY_UNCHECKED,
+                "issues": [],
+                "suggestions": [],
+                "status": STATUS_UNCHECKED
+            }
+
+        # Советы редактора приходят при совмещённой проверке (COMBINED_VERIFICATION)
+        is_safe = safety.get("is_safe", False)
+        severity = safety.get("severity", "unknown")
+        return {
+            "is_safe": is_safe,
+            "severity": severity,
+            "issues": safety.get("issues", []),
+            "suggestions": safety.get("review", {}).get("suggestions", []),
+            "status": review_status(is_safe, severity)
+        }
+
+    generate_concurrency = config.PIPELINE_GENERATE_CONCURRENCY if generate_concurrency is None else generate_concurrency
+    safety_concurrency = config.PIPELINE_SAFETY_CONCURRENCY if safety_concurrency is None else safety_concurrency
+
+    safety_step = Stage(
+        "safety",
+        safety_stage,
+        after=("generate", "dedup"),
+        concurrency=safety_concurrency,
+        max_pending=config.PIPELINE_MAX_PENDING,
+        timeout=config.PIPELINE_STAGE_TIMEOUT,
+        when=lambda ctx: safety_agent is not None
+    )
+
+    return Pipeline(name, [
+        Stage(
+            "generate",
+            generate_stage,
+            concurrency=generate_concurrency,
+            max_pending=config.PIPELINE_MAX_PENDING,
+            timeout=config.PIPELINE_STAGE_TIMEOUT
+        ),
+        Stage(
+            "dedup",
+            dedup_stage,
+            after=("generate",),
+            when=lambda ctx: duplicates is not None and ctx.inputs.get("check_duplicates", True)
+        ),
+        safety_step,
+        Stage("review", review_stage, after=("safety",))
+    ])
+
+
+__all__ = ["build_post_pipeline", "review_status", "STOP_DUPLICATE", "SEVERITY_UNCHECKED"]
@@ -0,0 +1,216 @@
+"""
+Предкомпилированные шаблоны промптов
+
+str.format() при каждом вызове заново разбирает шаблон и копирует все
+его литералы. PromptTemplate разбирает шаблон один раз при импорте,
+а статичные для канала/специализации поля подставляются один раз
+и запоминаются (partial + lru_cache) — на каждый пост остаётся
+склеить несколько строк с темой или новостью.
+
+Пример:
+    template = generator_user_template("педиатрия", "Профессия – педиатрия", "👶", "https://t.me/...")
+    user_prompt = template.render(news_title=..., news_content=..., news_source=..., news_url=...)
+"""
+
+from functools import lru_cache
+from string import Formatter
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from src.agents.generator_prompts import (
+    USER_PROMPT_TEMPLATE,
+    TOPIC_SYSTEM_PROMPT_TEMPLATE,
+    TOPIC_USER_PROMPT_TEMPLATE
+)
+from src.agents.specialty_loader import get_specialty_config
+
+# Поле шаблона: (позиция в списке частей, имя, conversion, format_spec)
+_Field = Tuple[int, str, Optional[str], str]
+
+_formatter = Formatter()
+
+
+class PromptTemplate:
+    """
+    Шаблон в синтаксисе str.format, разобранный один раз
+
+    render() даёт тот же результат, что и source.format(**values).
+    Поддерживаются именованные поля с conversion и format_spec
+    ({name!r}, {count:>3}); позиционные и составные ({a.b}, {a[0]}) — нет.
+    """
+
+    __slots__ = ("source", "fields", "_parts", "_slots")
+
+    def __init__(self, source: str):
+        self.source = source
+        parts: List[Optional[str]] = []
+        slots: List[_Field] = []
+
+        for literal, name, spec, conversion in _formatter.parse(source):
+            if literal:
+                parts.append(literal)
+            if name is None:
+                continue
+            if not name.isidentifier():
+                raise ValueError(f"Поле шаблона не поддерживается: {{{name}}}")
+            if spec and "{" in spec:
+                raise ValueError(f"Вложенные поля в format_spec не поддерживаются: {{{name}:{spec}}}")
+            slots.append((len(parts), name, conversion, spec or ""))
+            parts.append(None)
+
+        self._init(parts, slots)
+
+    def _init(self, parts: List[Optional[str]], slots: List[_Field]):
+        self._parts = parts
+        self._slots = slots
+        self.fields: FrozenSet[str] = frozenset(name for _, name, _, _ in slots)
+
+    @staticmethod
+    def _format(value: Any, conversion: Optional[str], spec: str) -> str:
+        if conversion == "r":
+            value = repr(value)
+        elif conversion == "s":
+            value = str(value)
+        elif conversion == "a":
+            value = ascii(value)
+        return format(value, spec) if spec else str(value)
+
+    def render(self, **values: Any) -> str:
+        """
+        Подставляет значения полей
+
+        Raises:
+            KeyError: Не передано значение для поля (как str.format)
+        """
+        parts = self._parts.copy()
+        for index, name, conversion, spec in self._slots:
+            parts[index] = self._format(values[name], conversion, spec)
+        return "".join(parts)
+
+    def partial(self, **values: Any) -> "PromptTemplate":
+        """
+        Новый шаблон с подставленными полями
+
+        Соседние литералы склеиваются, так что render() частичного
+        шаблона собирает столько строк, сколько в нём осталось полей.
+        Значения для полей, которых нет в шаблоне, игнорируются.
+        """
+        merged: List[Optional[str]] = []
+        slots: List[_Field] = []
+
+        def append_literal(text: str):
+            if merged and merged[-1] is not None:
+                merged[-1] += text
+            else:
+                merged.append(text)
+
+        slot_at = {index: (name, conversion, spec) for index, name, conversion, spec in self._slots}
+        for index, part in enumerate(self._parts):
+            if part is not None:
+                append_literal(part)
+                continue
+            name, conversion, spec = slot_at[index]
+            if name in values:
+                append_literal(self._format(values[name], conversion, spec))
+            else:
+                slots.append((len(merged), name, conversion, spec))
+                merged.append(None)
+
+        template = PromptTemplate.__new__(PromptTemplate)
+        template.source = self.source
+        template._init(merged, slots)
+        return template
+
+    def __repr__(self) -> str:
+        return f"PromptTemplate(fields={sorted(self.fields)})"
+
+
+# Шаблоны разбираются один раз при импорте
+GENERATOR_USER = PromptTemplate(USER_PROMPT_TEMPLATE)
+TOPIC_SYSTEM = PromptTemplate(TOPIC_SYSTEM_PROMPT_TEMPLATE)
+TOPIC_USER = PromptTemplate(TOPIC_USER_PROMPT_TEMPLATE)
+
+
+@lru_cache(maxsize=None)
+def specialty_context(specialty: str) -> str:
+    """
+    Промпт специализации для кэшируемого системного префикса
+
+    Уже без пробелов по краям: build_messages() тогда не копирует
+    многокилобайтную строку при каждом вызове. Пустая строка для
+    неизвестной специализации.
+    """
+    specialty_config = get_specialty_config(specialty)
+    return specialty_config["prompt"].strip() if specialty_config else ""
+
+
+@lru_cache(maxsize=256)
+def generator_user_template(
+    specialty: str,
+    channel_name: str,
+    channel_emoji: str,
+    channel_link: str
+) -> PromptTemplate:
+    """
+    USER_PROMPT_TEMPLATE с подставленными данными канала
+
+    Остаются поля новости (news_title, news_content, news_source,
+    news_url) и style_examples.
+    """
+    # Сам промпт специализации (сотни строк) — в системном префиксе,
+    # в user prompt — только ссылка на него
+    custom_instructions = (
+        f"Следуй инструкциям специализации «{specialty}» из системного промпта."
+        if specialty_context(specialty) else ""
+    )
+    return GENERATOR_USER.partial(
+        specialty=specialty,
+        channel_name=channel_name,
+        channel_emoji=channel_emoji,
+        channel_link=channel_link,
+        custom_instructions=custom_instructions
+    )
+
+
+@lru_cache(maxsize=256)
+def topic_system_prompt(specialty: str, post_type: str, max_length: int) -> str:
+    """Изменчивая часть системного промпта generate_from_topic (после кэшируемого префикса)"""
+    specialty_config = get_specialty_config(specialty) or {}
+    return TOPIC_SYSTEM.render(
+        max_length=max_length,
+        emoji=specialty_config.get("emoji", ""),
+        channel_link=specialty_config.get("link", ""),
+        post_type=post_type
+    )
+
+
+@lru_cache(maxsize=256)
+def topic_user_template(specialty: str, post_type: str, max_length: int) -> PromptTemplate:
+    """TOPIC_USER_PROMPT_TEMPLATE, в котором осталось только поле topic"""
+    specialty_config = get_specialty_config(specialty) or {}
+    return TOPIC_USER.partial(
+        post_type=post_type,
+        max_length=max_length,
+        emoji=specialty_config.get("emoji", ""),
+        channel_link=specialty_config.get("link", "")
+    )
+
+
+def cache_info() -> Dict[str, Any]:
+    """Статистика мемоизации (для бенчмарка)"""
+    return {
+        func.__name__: func.cache_info()._asdict()
+        for func in (specialty_context, generator_user_template, topic_system_prompt, topic_user_template)
+    }
+
+
+__all__ = [
+    "PromptTemplate",
+    "GENERATOR_USER",
+    "TOPIC_SYSTEM",
+    "TOPIC_USER",
+    "specialty_context",
+    "generator_user_template",
+    "topic_system_prompt",
+    "topic_user_template",
+    "cache_info"
+]
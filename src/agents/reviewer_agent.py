@@ -2,11 +2,13 @@
 Агент проверки контента на медицинскую безопасность
 """
 
-import json
 from typing import Dict, Any
 
 from src.agents.base_agent import BaseAgent
 from src.core.logger import logger
+from src.services.openrouter import json_schema_format
+from src.utils.helpers import hash_content
+from src.utils.json_stream import extract_json
 
 
 REVIEWER_SYSTEM_PROMPT = """Ты — медицинский эксперт, проверяющий контент на безопасность и соответствие этическим нормам.
@@ -25,12 +27,25 @@ REVIEWER_SYSTEM_PROMPT = """Ты — медицинский эксперт, пр
 }
 """
 
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "safe": {"type": "boolean"},
+        "issues": {"type": "array", "items": {"type": "string"}},
+        "suggestions": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["safe", "issues", "suggestions"],
+    "additionalProperties": False
+}
+
 
 class ReviewerAgent(BaseAgent):
     """
     Агент для проверки медицинского контента
     """
     
+    PROMPT_VERSION = hash_content(REVIEWER_SYSTEM_PROMPT)[:12]
+    
     def get_system_prompt(self) -> str:
         """Возвращает системный промпт"""
         return REVIEWER_SYSTEM_PROMPT
@@ -47,6 +62,10 @@ class ReviewerAgent(BaseAgent):
         """
         logger.info("🔍 Проверка контента на безопасность...")
         
+        cached = await self.cached_verdict(content)
+        if cached is not None:
+            return cached
+        
         user_prompt = f"""Проверь этот медицинский пост на безопасность:
 
 {content}
@@ -56,34 +75,38 @@ class ReviewerAgent(BaseAgent):
         result = await self.generate(
             user_prompt=user_prompt,
             temperature=0.3,
-            max_tokens=500
+            max_tokens=500,
+            response_format=json_schema_format("review", REVIEW_SCHEMA)
         )
         
         if not result["success"]:
             logger.error(f"❌ Ошибка проверки: {result.get('error')}")
             return {
-                "safe": True,  # По умолчанию считаем безопасным
-                "issues": [],
-                "suggestions": []
+                "safe": False,
+                "issues": ["Проверка не выполнена"],
+                "suggestions": [],
+                "error": result.get("error")
             }
         
-        try:
-            review_data = json.loads(result["content"])
-            
-            if review_data.get("safe"):
-                logger.info("✅ Контент безопасен")
-            else:
-                logger.warning(f"⚠️ Найдены проблемы: {review_data.get('issues')}")
-            
-            return review_data
+        review_data = extract_json(result["content"] or "")
         
-        except json.JSONDecodeError:
-            logger.warning("⚠️ Не удалось распарсить JSON, считаем безопасным")
+        if review_data is None or "safe" not in review_data:
+            # Непроверенный пост не считается безопасным
+            logger.error(f"❌ Не удалось разобрать ответ ревьюера: {(result['content'] or '')[:500]}")
             return {
-                "safe": True,
-                "issues": [],
-                "suggestions": []
+                "safe": False,
+                "issues": ["Не удалось разобрать ответ проверки"],
+                "suggestions": [],
+                "error": "invalid_json"
             }
-
+        
+        await self.store_verdict(content, review_data)
+        
+        if review_data.get("safe"):
+            logger.info("✅ Контент безопасен")
+        else:
+            logger.warning(f"⚠️ Найдены проблемы: {review_data.get('issues')}")
+        
+        return review_data
 
 __all__ = ["ReviewerAgent"]
@@ -2,11 +2,29 @@
 Агент проверки медицинской безопасности
 """
 
-import json
-from typing import Dict, Any
+from contextlib import aclosing
+from typing import Dict, Any, Callable, Optional
 from src.agents.base_agent import BaseAgent
-from src.agents.safety_prompts import SAFETY_SYSTEM_PROMPT, SAFETY_USER_PROMPT_TEMPLATE
+from src.core.deadline import Deadline
+from src.agents.safety_prompts import (
+    SAFETY_SYSTEM_PROMPT,
+    SAFETY_SHORT_SYSTEM_PROMPT,
+    SAFETY_VERDICT_SCHEMA,
+    SAFETY_USER_PROMPT_TEMPLATE,
+    SAFETY_FRAGMENT_PROMPT_TEMPLATE,
+    SAFETY_FRAGMENT_SCOPE_PARTIAL,
+    SAFETY_FRAGMENT_SCOPE_FINAL
+)
+from src.core.config import config
 from src.core.logger import logger
+from src.core.tracing import current_span, traced
+from src.services.openrouter import json_schema_format
+from src.services.safety_prescreen import prescreen, rejection_verdict
+from src.utils.helpers import hash_content
+from src.utils.json_stream import IncrementalJSONParser, extract_json
+
+# Ответ модели не удалось разобрать как вердикт
+INVALID_JSON = "invalid_json"
 
 
 class SafetyAgent(BaseAgent):
@@ -14,15 +32,28 @@ class SafetyAgent(BaseAgent):
     Агент проверки медицинской безопасности контента
     """
     
+    # Фрагментные промпты тоже в версии: PipelinedSafetyCheck кэширует
+    # сведённый по фрагментам вердикт под ключом всего поста
+    PROMPT_VERSION = hash_content(
+        SAFETY_SYSTEM_PROMPT + SAFETY_SHORT_SYSTEM_PROMPT + SAFETY_USER_PROMPT_TEMPLATE
+        + SAFETY_FRAGMENT_PROMPT_TEMPLATE + SAFETY_FRAGMENT_SCOPE_PARTIAL + SAFETY_FRAGMENT_SCOPE_FINAL
+    )[:12]
+    
+    # Подклассы (VerificationAgent) расширяют промпт и схему ответа
+    SHORT_SYSTEM_PROMPT = SAFETY_SHORT_SYSTEM_PROMPT
+    VERDICT_SCHEMA = SAFETY_VERDICT_SCHEMA
+    
     def get_system_prompt(self) -> str:
         """Возвращает системный промпт для проверки безопасности"""
         return SAFETY_SYSTEM_PROMPT
     
+    @traced("safety.execute")
     async def execute(
         self,
         content: str,
         specialty: str,
-        channel_name: str
+        channel_name: str,
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
         """
         Проверяет контент на медицинскую безопасность
@@ -31,12 +62,21 @@ class SafetyAgent(BaseAgent):
             content: Текст поста для проверки
             specialty: Специализация (гинекология, педиатрия и т.д.)
             channel_name: Название канала
+            deadline: Срок проверки (остаток общего SLA после генерации)
         
         Returns:
             Dict с результатами проверки
         """
         
         logger.info(f"🔍 Проверка безопасности: {specialty}")
+        execute_span = current_span().set(agent=type(self).__name__, specialty=specialty, chars=len(content))
+        
+        # Уже проверенный текст (повторная проверка перед публикацией,
+        # правка с откатом) не идёт в LLM повторно
+        cached = await self.cached_verdict(content, specialty)
+        if cached is not None:
+            execute_span.set(cached=True)
+            return cached
         
         # Формируем user prompt
         user_prompt = SAFETY_USER_PROMPT_TEMPLATE.format(
@@ -45,12 +85,144 @@ class SafetyAgent(BaseAgent):
             channel_name=channel_name
         )
         
-        # Генерируем проверку
-        result = await self.generate(
-            user_prompt=user_prompt,
-            temperature=0.3  # Низкая температура для консистентности
+        verdict = await self._check(user_prompt, content, specialty, deadline)
+        execute_span.set(severity=verdict.get("severity"), prescreen=verdict.get("prescreen"))
+        if not verdict["success"]:
+            execute_span.fail(verdict.get("error"))
+        # Отказ предскрининга дешевле пересчитать, чем хранить;
+        # частично разобранный вердикт может быть неполным
+        if verdict["success"] and not verdict.get("prescreen") and not verdict.get("partial"):
+            await self.store_verdict(content, verdict, specialty)
+        return verdict
+    
+    async def check_fragment(
+        self,
+        fragment: str,
+        specialty: str,
+        channel_name: str,
+        index: int = 1,
+        content: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Проверяет фрагмент поста, пока остальной текст ещё генерируется
+        
+        Args:
+            fragment: Завершённые абзацы поста
+            specialty: Специализация
+            channel_name: Название канала
+            index: Порядковый номер фрагмента (для промпта и логов)
+            content: Полный текст поста — только для финального фрагмента;
+                тогда проверяются и требования ко всему посту (дисклеймер и т.п.)
+            deadline: Срок проверки
+            on_partial: Вызывается с частью вердикта по мере потокового
+                ответа (для досрочной реакции на severity=critical)
+        
+        Returns:
+            Dict в том же формате, что execute()
+        """
+        logger.debug(f"🔍 Проверка фрагмента {index} ({len(fragment)} символов): {specialty}")
+        
+        if content is None:
+            scope = SAFETY_FRAGMENT_SCOPE_PARTIAL.format(index=index)
+        else:
+            scope = SAFETY_FRAGMENT_SCOPE_FINAL.format(content=content)
+        
+        user_prompt = SAFETY_FRAGMENT_PROMPT_TEMPLATE.format(
+            fragment=fragment,
+            specialty=specialty,
+            channel_name=channel_name,
+            scope=scope
+        )
+        
+        return await self._check(
+            user_prompt, fragment, specialty, deadline,
+            whole_post=content is not None,
+            on_partial=on_partial
         )
+    
+    async def _check(
+        self,
+        user_prompt: str,
+        text: str,
+        specialty: str,
+        deadline: Optional[Deadline],
+        whole_post: bool = True,
+        on_partial: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Предскрининг и, если он не отклонил текст, проверка через LLM
+        
+        Явные нарушения отклоняются без запроса к модели; тексты с низким
+        риском проверяются с коротким системным промптом. Если ответ не
+        разобрать даже частично, запрос повторяется один раз в обход кэша,
+        и новый ответ заменяет непригодный в кэше.
         
+        Args:
+            on_partial: Вызывается с уже известной частью вердикта по мере
+                потокового ответа (is_safe/severity — до конца генерации)
+        """
+        system_prompt = None
+        
+        if config.SAFETY_PRESCREEN_ENABLED:
+            screen = prescreen(text, whole_post=whole_post)
+            if screen["reject"]:
+                logger.warning(f"🚫 Предскрининг отклонил текст: {len(screen['issues'])} нарушений")
+                return rejection_verdict(screen)
+            if screen["risk"] < config.SAFETY_PRESCREEN_LOW_RISK:
+                system_prompt = self.SHORT_SYSTEM_PROMPT
+            logger.debug(f"🔍 Предскрининг: риск {screen['risk']:.2f}, промпт {'короткий' if system_prompt else 'полный'}")
+        
+        request = {
+            "user_prompt": user_prompt,
+            "temperature": 0.3,  # Низкая температура для консистентности
+            "specialty": specialty,
+            "deadline": deadline,
+            "system_prompt": system_prompt,
+            "response_format": json_schema_format("safety_verdict", self.VERDICT_SCHEMA)
+        }
+        
+        if on_partial:
+            result = await self._generate_streaming(request, on_partial)
+        else:
+            result = await self.generate(**request)
+        
+        verdict = self._parse_verdict(result)
+        if verdict.get("error") == INVALID_JSON:
+            logger.warning("🔁 Повторяю проверку безопасности: ответ не разобран")
+            # Непригодный ответ остался в кэше: повтор не читает его, а перезаписывает
+            verdict = self._parse_verdict(await self.generate(**request, refresh_cache=True))
+        return verdict
+    
+    async def _generate_streaming(
+        self,
+        request: Dict[str, Any],
+        on_partial: Callable[[Dict[str, Any]], None]
+    ) -> Dict[str, Any]:
+        """Потоковый запрос: вердикт разбирается по мере генерации"""
+        stream = await self.generate(**request, stream=True)
+        parser = IncrementalJSONParser()
+        known = {}
+        
+        async with aclosing(stream.__aiter__()) as deltas:
+            async for delta in deltas:
+                parser.feed(delta)
+                partial = parser.partial()
+                if len(partial) > len(known):
+                    known = partial
+                    on_partial(partial)
+        
+        return stream.to_result()
+    
+    def _parse_verdict(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Разбирает JSON-вердикт модели
+        
+        Ответ, оборванный на max_tokens, принимается, если в нём уже есть
+        is_safe и severity (помечается partial). Неразобранный ответ — ошибка
+        (error=INVALID_JSON), а не «безопасно по умолчанию».
+        """
         if not result["success"]:
             logger.error(f"❌ Ошибка проверки безопасности: {result.get('error')}")
             return {
@@ -60,78 +232,51 @@ class SafetyAgent(BaseAgent):
                 "error": result.get("error")
             }
         
-        # Парсим JSON ответ
-        try:
-            response_content = result["content"].strip()
-
-            # Логируем сырой ответ для отладки (увеличен размер до 1000 символов)
-            logger.debug(f"Safety Agent raw response: {response_content[:1000]}...")
-
-            # Пытаемся извлечь JSON из markdown блоков (```json ... ```)
-            if "```json" in response_content:
-                start = response_content.find("```json") + 7
-                end = response_content.find("```", start)
-                if end != -1:
-                    response_content = response_content[start:end].strip()
-            elif "```" in response_content:
-                # Просто ```  без json
-                start = response_content.find("```") + 3
-                end = response_content.find("```", start)
-                if end != -1:
-                    response_content = response_content[start:end].strip()
-
-            # Дополнительная очистка: ищем первую { и последнюю }
-            # Это помогает избавиться от текста до и после JSON
-            first_brace = response_content.find('{')
-            last_brace = response_content.rfind('}')
-
-            if first_brace != -1 and last_brace != -1 and last_brace > first_brace:
-                response_content = response_content[first_brace:last_brace + 1]
-
-            safety_data = json.loads(response_content)
-
-            is_safe = safety_data.get("is_safe", False)
-            severity = safety_data.get("severity", "unknown")
-
-            if is_safe:
-                logger.info(f"✅ Контент безопасен: {severity}")
-            else:
-                logger.warning(f"⚠️ Контент требует проверки: {severity}")
-
-            return {
-                "success": True,
-                "is_safe": is_safe,
-                "severity": severity,
-                "issues": safety_data.get("issues", []),
-                "recommendations": safety_data.get("recommendations", []),
-                "statistics": safety_data.get("statistics", {})
-            }
-
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Не удалось распарсить JSON ответ от Safety Agent: {e}")
-            logger.error(f"Raw response: {result['content'][:1000]}...")
-
-            # Fallback: базовая проверка
-            return {
-                "success": True,
-                "is_safe": True,  # По умолчанию считаем безопасным
-                "severity": "low",
-                "issues": [],
-                "recommendations": ["Не удалось выполнить полную проверку"],
-                "statistics": {}
-            }
-        except KeyError as e:
-            logger.error(f"❌ Отсутствует ключ в ответе Safety Agent: {e}")
-
-            # Fallback
+        response_content = result["content"] or ""
+        logger.debug(f"Safety Agent raw response: {response_content[:1000]}...")
+        
+        safety_data = extract_json(response_content)
+        partial = False
+        
+        if safety_data is None:
+            parser = IncrementalJSONParser()
+            parser.feed(response_content)
+            safety_data = parser.partial()
+            partial = True
+        
+        if "is_safe" not in safety_data or "severity" not in safety_data:
+            logger.error(f"❌ Не удалось разобрать вердикт Safety Agent: {response_content[:1000]}...")
             return {
-                "success": True,
-                "is_safe": True,
-                "severity": "low",
-                "issues": [],
-                "recommendations": ["Неполный ответ от проверки безопасности"],
-                "statistics": {}
+                "success": False,
+                "is_safe": False,
+                "severity": "unknown",
+                "error": INVALID_JSON
             }
-
+        
+        is_safe = bool(safety_data["is_safe"])
+        severity = safety_data["severity"]
+        
+        if partial:
+            logger.warning(f"⚠️ Вердикт разобран частично (ответ оборван): {severity}")
+        elif is_safe:
+            logger.info(f"✅ Контент безопасен: {severity}")
+        else:
+            logger.warning(f"⚠️ Контент требует проверки: {severity}")
+        
+        verdict = {
+            "success": True,
+            "is_safe": is_safe,
+            "severity": severity,
+            "issues": safety_data.get("issues", []),
+            "recommendations": safety_data.get("recommendations", []),
+            "statistics": safety_data.get("statistics", {})
+        }
+        if partial:
+            verdict["partial"] = True
+        return self._extend_verdict(verdict, safety_data)
+    
+    def _extend_verdict(self, verdict: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        """Дополнительные поля вердикта из ответа модели (для подклассов)"""
+        return verdict
 
 __all__ = ["SafetyAgent"]
@@ -0,0 +1,272 @@
+"""
+Конвейерная проверка безопасности потокового черновика
+
+Пока ContentGeneratorAgent пишет пост, завершённые абзацы уходят
+в SafetyAgent, не дожидаясь конца генерации. После генерации остаётся
+проверить только последний фрагмент — итоговый вердикт готов почти сразу.
+Критичная проблема в любом фрагменте останавливает генерацию.
+"""
+
+import asyncio
+from typing import Any, AsyncContextManager, Callable, Dict, List, Optional, Set
+
+from src.agents.safety_agent import SafetyAgent
+from src.core.config import config
+from src.core.deadline import Deadline
+from src.core.exceptions import GenerationAborted, PipelineOverloaded
+from src.core.logger import logger
+
+SEVERITY_ORDER = ["safe", "low", "medium", "high", "critical"]
+
+PARAGRAPH_SEPARATOR = "\n\n"
+
+
+def merge_verdicts(verdicts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Сводит вердикты фрагментов в один в формате SafetyAgent.execute()
+
+    Пост безопасен, только если безопасен каждый фрагмент; severity —
+    наихудшая из фрагментов. Редакторские suggestions (VerificationAgent)
+    собираются из всех фрагментов в общий review.
+    """
+    severity = max(
+        (v.get("severity", "safe") for v in verdicts),
+        key=lambda s: SEVERITY_ORDER.index(s) if s in SEVERITY_ORDER else len(SEVERITY_ORDER),
+        default="safe"
+    )
+
+    issues = [issue for v in verdicts for issue in v.get("issues", [])]
+
+    recommendations = []
+    for v in verdicts:
+        for recommendation in v.get("recommendations", []):
+            if recommendation not in recommendations:
+                recommendations.append(recommendation)
+
+    statistics = {"total_issues": len(issues)}
+    for level in ("critical", "high", "medium", "low"):
+        statistics[f"{level}_issues"] = sum(1 for i in issues if i.get("severity") == level)
+
+    result = {
+        "success": True,
+        "is_safe": all(v.get("is_safe", False) for v in verdicts),
+        "severity": severity,
+        "issues": issues,
+        "recommendations": recommendations,
+        "statistics": statistics
+    }
+
+    reviews = [v["review"] for v in verdicts if "review" in v]
+    if reviews:
+        suggestions = []
+        for review in reviews:
+            for suggestion in review.get("suggestions", []):
+                if suggestion not in suggestions:
+                    suggestions.append(suggestion)
+        result["review"] = {
+            "safe": result["is_safe"],
+            "issues": [issue.get("description", "") for issue in issues],
+            "suggestions": suggestions
+        }
+    return result
+
+
+class PipelinedSafetyCheck:
+    """
+    Проверка безопасности, идущая параллельно с потоковой генерацией
+
+    С параметром slot проверки фрагментов ограничены тем же лимитом, что и
+    этап safety конвейера; без него (прямой вызов) они ничем не ограничены.
+
+    Пример:
+        checker = PipelinedSafetyCheck(safety_agent, specialty, channel_name, deadline)
+
+        async def on_chunk(draft):
+            checker.feed(draft)        # GenerationAborted при критичной проблеме
+            ...
+
+        gen = await generator_agent.execute(..., on_chunk=on_chunk)
+        safety = await checker.finish(gen["content"])
+    """
+
+    def __init__(
+        self,
+        safety_agent: SafetyAgent,
+        specialty: str,
+        channel_name: str,
+        deadline: Optional[Deadline] = None,
+        min_chars: int = None,
+        slot: Optional[Callable[[], AsyncContextManager]] = None
+    ):
+        """
+        Args:
+            safety_agent: Агент проверки безопасности
+            specialty: Специализация
+            channel_name: Название канала
+            deadline: Общий срок (проверки фрагментов укладываются в него же)
+            min_chars: Минимальный размер фрагмента, отправляемого на проверку
+                (по умолчанию SAFETY_FRAGMENT_MIN_CHARS) — мелкие абзацы склеиваются
+            slot: Слот этапа safety конвейера (Stage.slot) — проверки фрагментов
+                во время генерации делят лимит PIPELINE_SAFETY_CONCURRENCY с полными
+                проверками. Фрагмент, не получивший слот до finish(), проверяется
+                вместе с хвостом: finish() вызывается из этапа safety, который свой
+                слот уже держит
+        """
+        self.safety_agent = safety_agent
+        self.specialty = specialty
+        self.channel_name = channel_name
+        self.deadline = deadline
+        self.min_chars = min_chars or config.SAFETY_FRAGMENT_MIN_CHARS
+        self._slot = slot
+
+        # Последний черновик и сколько его символов уже отправлено на проверку
+        self._draft = ""
+        self._checked_upto = 0
+        self._tasks: List[asyncio.Task] = []
+        # Начало каждого фрагмента в черновике и номера фрагментов, чья проверка началась
+        self._offsets: List[int] = []
+        self._started: Set[int] = set()
+        self._critical: Optional[Dict[str, Any]] = None
+
+    @property
+    def critical_verdict(self) -> Optional[Dict[str, Any]]:
+        """Первый (возможно, ещё неполный) вердикт фрагмента с severity=critical"""
+        return self._critical
+
+    def feed(self, draft: str):
+        """
+        Принимает текущий черновик и запускает проверку новых завершённых абзацев
+
+        Raises:
+            GenerationAborted: если в уже проверенном фрагменте найдена
+                критичная проблема — генерацию пора останавливать
+        """
+        if self._critical is not None:
+            raise GenerationAborted(self._abort_reason())
+
+        self._draft = draft
+
+        # Последний абзац ещё дописывается — проверяем только до последнего разделителя
+        complete_upto = draft.rfind(PARAGRAPH_SEPARATOR)
+        if complete_upto <= self._checked_upto:
+            return
+
+        fragment = draft[self._checked_upto:complete_upto].strip()
+        if len(fragment) < self.min_chars:
+            return
+
+        offset = self._checked_upto
+        self._checked_upto = complete_upto
+        self._start(fragment, offset=offset)
+
+    async def finish(self, content: str) -> Dict[str, Any]:
+        """
+        Проверяет хвост поста и сводит вердикты всех фрагментов
+
+        Если проверка какого-то фрагмента не удалась, пост проверяется
+        целиком обычным SafetyAgent.execute() — если срок ещё не истёк;
+        после дедлайна возвращается вердикт неудавшейся проверки.
+        """
+        # Фрагменты, так и не дождавшиеся слота, уходят в хвост
+        tail_from = self._checked_upto
+        waiting = [index for index in range(1, len(self._tasks) + 1) if index not in self._started]
+        if waiting:
+            first = waiting[0] - 1
+            tail_from = self._offsets[first]
+            dropped = self._tasks[first:]
+            for task in dropped:
+                task.cancel()
+            await asyncio.gather(*dropped, return_exceptions=True)
+            del self._tasks[first:], self._offsets[first:]
+            logger.debug(f"🔍 Фрагментов без слота проверки: {len(dropped)}, проверяю их с хвостом")
+
+        # Финальный фрагмент проверяется вместе с требованиями ко всему посту;
+        # текст после последнего черновика тоже входит в хвост
+        text = content if content.startswith(self._draft) else self._draft
+        tail = text[tail_from:].strip()
+        self._start(tail or content, content=content, offset=tail_from)
+
+        verdicts = await asyncio.gather(*self._tasks, return_exceptions=True)
+
+        failed = [v for v in verdicts if not (isinstance(v, dict) and v["success"])]
+        if failed and self.deadline is not None and self.deadline.expired:
+            # Полная проверка после дедлайна только отодвинет ответ редактору
+            logger.warning("⏰ Проверка фрагментов не уложилась в срок, пост целиком не перепроверяю")
+            return next((v for v in failed if isinstance(v, dict)), {
+                "success": False,
+                "is_safe": False,
+                "severity": "unknown",
+                "error": "Превышено время ожидания проверки"
+            })
+
+        if failed:
+            logger.warning("⚠️ Проверка фрагментов не удалась, проверяю пост целиком")
+            return await self.safety_agent.execute(
+                content=content,
+                specialty=self.specialty,
+                channel_name=self.channel_name,
+                deadline=self.deadline
+            )
+
+        result = merge_verdicts(verdicts)
+        result["fragments"] = len(verdicts)
+        logger.info(f"🔍 Вердикт по {len(verdicts)} фрагментам: {result['severity']}")
+
+        # Повторная проверка того же поста (например, перед публикацией) возьмёт его из кэша
+        if not any(v.get("prescreen") or v.get("partial") for v in verdicts):
+            await self.safety_agent.store_verdict(content, result, self.specialty)
+        return result
+
+    def cancel(self):
+        """Отменяет незавершённые проверки (генерация прервана или упала)"""
+        for task in self._tasks:
+            task.cancel()
+
+    def _start(self, fragment: str, content: str = None, offset: int = 0):
+        index = len(self._tasks) + 1
+        if self._slot is None or content is not None:
+            self._started.add(index)
+        task = asyncio.create_task(self._check(index, fragment, content))
+        task.add_done_callback(
+            lambda t: None if t.cancelled() or t.exception() is not None or t.result() is None
+            else self._on_verdict(index, t.result())
+        )
+        self._tasks.append(task)
+        self._offsets.append(offset)
+
+    async def _check(self, index: int, fragment: str, content: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Проверка фрагмента в слоте этапа safety; None — слота не досталось (очередь полна)"""
+        if index in self._started:
+            return await self._check_fragment(index, fragment, content)
+        try:
+            async with self._slot():
+                self._started.add(index)
+                return await self._check_fragment(index, fragment, content)
+        except PipelineOverloaded:
+            return None
+
+    async def _check_fragment(self, index: int, fragment: str, content: Optional[str]) -> Dict[str, Any]:
+        return await self.safety_agent.check_fragment(
+            fragment=fragment,
+            specialty=self.specialty,
+            channel_name=self.channel_name,
+            index=index,
+            content=content,
+            deadline=self.deadline,
+            # severity приходит в начале ответа — останавливаем генерацию, не дожидаясь конца вердикта
+            on_partial=lambda partial: self._on_verdict(index, partial)
+        )
+
+    def _on_verdict(self, index: int, verdict: Dict[str, Any]):
+        if verdict.get("severity") == "critical" and self._critical is None:
+            self._critical = verdict
+            logger.warning(f"🛑 Критичная проблема во фрагменте {index}, останавливаю генерацию")
+
+    def _abort_reason(self) -> str:
+        issues = [i for i in self._critical.get("issues", []) if i.get("severity") == "critical"]
+        if not issues:
+            return "критичная проблема медицинской безопасности"
+        return "; ".join(i.get("description", "") for i in issues[:3])
+
+
+__all__ = ["PipelinedSafetyCheck", "merge_verdicts"]
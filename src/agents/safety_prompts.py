@@ -399,6 +399,82 @@ SAFETY_SYSTEM_PROMPT = """# ТВОЯ РОЛЬ
 **Помни:** Цель — защитить здоровье читателей, а не создать препятствия для публикации качественного контента.
 """
 
+# ==============================================================================
+# КОРОТКИЙ СИСТЕМНЫЙ ПРОМПТ (черновики с низким риском по предскринингу)
+# ==============================================================================
+
+SAFETY_SHORT_SYSTEM_PROMPT = """Ты — эксперт по медицинской безопасности контента для публичных Telegram-каналов.
+Локальный предскрининг не нашёл в тексте явных нарушений; проверь его по существу.
+
+Проблемы:
+- critical: прямые назначения и дозировки ("принимайте X 500 мг"), опасные советы
+  ("можете не обращаться к врачу", "прекратите лечение"), ложные обещания
+  ("гарантированно вылечит"), медицинские ошибки
+- high: категоричные утверждения без источников, нет оговорок про врача,
+  некорректная или устаревшая терминология
+- medium/low: стиль, запугивание, неполная информация
+
+Не придирайся к мелочам стиля и не блокируй контент без веских причин.
+
+Верни ТОЛЬКО валидный JSON без текста до и после:
+{
+  "is_safe": true/false,
+  "severity": "safe/low/medium/high/critical",
+  "issues": [
+    {"type": "...", "severity": "...", "description": "...", "location": "...", "recommendation": "..."}
+  ],
+  "recommendations": ["..."],
+  "statistics": {"total_issues": 0, "critical_issues": 0, "high_issues": 0, "medium_issues": 0, "low_issues": 0}
+}
+
+is_safe = false, если есть critical, или high вместе с critical, или 3+ high.
+"""
+
+# ==============================================================================
+# JSON-СХЕМА ВЕРДИКТА (response_format для моделей со структурированным выводом)
+# ==============================================================================
+
+_SEVERITIES = ["safe", "low", "medium", "high", "critical"]
+
+# is_safe и severity идут первыми — при потоковом разборе они известны раньше всего
+SAFETY_VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "is_safe": {"type": "boolean"},
+        "severity": {"type": "string", "enum": _SEVERITIES},
+        "issues": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {"type": "string"},
+                    "severity": {"type": "string", "enum": _SEVERITIES[1:]},
+                    "description": {"type": "string"},
+                    "location": {"type": "string"},
+                    "recommendation": {"type": "string"}
+                },
+                "required": ["type", "severity", "description", "location", "recommendation"],
+                "additionalProperties": False
+            }
+        },
+        "recommendations": {"type": "array", "items": {"type": "string"}},
+        "statistics": {
+            "type": "object",
+            "properties": {
+                "total_issues": {"type": "integer"},
+                "critical_issues": {"type": "integer"},
+                "high_issues": {"type": "integer"},
+                "medium_issues": {"type": "integer"},
+                "low_issues": {"type": "integer"}
+            },
+            "required": ["total_issues", "critical_issues", "high_issues", "medium_issues", "low_issues"],
+            "additionalProperties": False
+        }
+    },
+    "required": ["is_safe", "severity", "issues", "recommendations", "statistics"],
+    "additionalProperties": False
+}
+
 # ==============================================================================
 # USER PROMPT TEMPLATE
 # ==============================================================================
@@ -433,8 +509,66 @@ SAFETY_USER_PROMPT_TEMPLATE = """
 Проверь СЕЙЧАС и верни JSON:
 """
 
+# ==============================================================================
+# ПРОВЕРКА ФРАГМЕНТА (пока пост ещё генерируется)
+# ==============================================================================
+
+SAFETY_FRAGMENT_PROMPT_TEMPLATE = """
+# ЗАДАНИЕ: ПРОВЕРКА МЕДИЦИНСКОЙ БЕЗОПАСНОСТИ ФРАГМЕНТА
+
+---
+
+# ФРАГМЕНТ ДЛЯ ПРОВЕРКИ
+
+```
+{fragment}
+```
+
+---
+
+# КОНТЕКСТ
+
+**Специализация:** {specialty}
+**Целевой канал:** {channel_name}
+**Аудитория:** Медицинские специалисты + пациенты
+
+{scope}
+
+---
+
+# ТВОЯ ЗАДАЧА
+
+Проверь фрагмент на соответствие требованиям медицинской безопасности.
+Отмечай только проблемы, найденные в самом фрагменте.
+
+**ВАЖНО:** Верни ТОЛЬКО валидный JSON с детальным отчётом. Никакого дополнительного текста до или после JSON.
+
+Проверь СЕЙЧАС и верни JSON:
+"""
+
+# Фрагмент из середины поста: требования ко всему посту проверяются по финальному
+SAFETY_FRAGMENT_SCOPE_PARTIAL = """**Это фрагмент {index} поста, который ещё пишется.**
+Отсутствие дисклеймера, призыва обратиться к врачу, ссылки на канал и
+источников в этом фрагменте НЕ считай проблемой — это проверяется
+по финальному фрагменту."""
+
+SAFETY_FRAGMENT_SCOPE_FINAL = """**Это финальный фрагмент поста.** Полный текст — для контекста:
+
+```
+{content}
+```
+
+Проверь финальный фрагмент и требования ко всему посту (дисклеймер,
+призыв обратиться к врачу, источники). Проблемы в остальных фрагментах
+уже проверены — не повторяй их."""
+
 
 __all__ = [
     "SAFETY_SYSTEM_PROMPT",
-    "SAFETY_USER_PROMPT_TEMPLATE"
+    "SAFETY_SHORT_SYSTEM_PROMPT",
+    "SAFETY_VERDICT_SCHEMA",
+    "SAFETY_USER_PROMPT_TEMPLATE",
+    "SAFETY_FRAGMENT_PROMPT_TEMPLATE",
+    "SAFETY_FRAGMENT_SCOPE_PARTIAL",
+    "SAFETY_FRAGMENT_SCOPE_FINAL"
 ]
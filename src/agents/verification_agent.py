@@ -0,0 +1,111 @@
+"""
+Агент совмещённой проверки: медицинская безопасность + редакторское ревью за один вызов
+"""
+
+from typing import Dict, Any, Optional
+
+from src.agents.reviewer_agent import REVIEWER_SYSTEM_PROMPT
+from src.agents.safety_agent import SafetyAgent
+from src.agents.safety_prompts import (
+    SAFETY_SYSTEM_PROMPT,
+    SAFETY_SHORT_SYSTEM_PROMPT,
+    SAFETY_USER_PROMPT_TEMPLATE,
+    SAFETY_FRAGMENT_PROMPT_TEMPLATE,
+    SAFETY_FRAGMENT_SCOPE_PARTIAL,
+    SAFETY_FRAGMENT_SCOPE_FINAL,
+    SAFETY_VERDICT_SCHEMA
+)
+from src.core.deadline import Deadline
+from src.utils.helpers import hash_content
+
+
+# Дополнение к промпту безопасности: то, что раньше проверял ReviewerAgent
+VERIFICATION_REVIEW_ADDENDUM = """
+---
+
+# РЕДАКТОРСКОЕ РЕВЬЮ (в том же ответе)
+
+Помимо безопасности, оцени пост как редактор:
+- Тон профессиональный, но понятный пациентам
+- Нет призывов к самолечению, есть призыв обратиться к врачу, где нужно
+- Изложение ясное, без лишней сложности
+
+Добавь в тот же JSON поле "suggestions" — список конкретных редакторских
+рекомендаций по улучшению текста (пустой список, если улучшать нечего).
+Проблемы безопасности в suggestions не дублируй — они в issues.
+"""
+
+VERIFICATION_SYSTEM_PROMPT = SAFETY_SYSTEM_PROMPT + VERIFICATION_REVIEW_ADDENDUM
+VERIFICATION_SHORT_SYSTEM_PROMPT = SAFETY_SHORT_SYSTEM_PROMPT + VERIFICATION_REVIEW_ADDENDUM
+
+# Схема вердикта безопасности + suggestions ревьюера
+VERIFICATION_SCHEMA = {
+    **SAFETY_VERDICT_SCHEMA,
+    "properties": {
+        **SAFETY_VERDICT_SCHEMA["properties"],
+        "suggestions": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": SAFETY_VERDICT_SCHEMA["required"] + ["suggestions"]
+}
+
+
+class VerificationAgent(SafetyAgent):
+    """
+    Проверка безопасности и редакторское ревью одним запросом
+
+    Возвращает вердикт в формате SafetyAgent.execute() и дополнительно
+    review в формате ReviewerAgent.execute() — может заменить SafetyAgent
+    везде, где он используется, вдвое сокращая вызовы проверки.
+    """
+
+    PROMPT_VERSION = hash_content(
+        VERIFICATION_SYSTEM_PROMPT + VERIFICATION_SHORT_SYSTEM_PROMPT + SAFETY_USER_PROMPT_TEMPLATE
+        + SAFETY_FRAGMENT_PROMPT_TEMPLATE + SAFETY_FRAGMENT_SCOPE_PARTIAL + SAFETY_FRAGMENT_SCOPE_FINAL
+        + REVIEWER_SYSTEM_PROMPT
+    )[:12]
+
+    SHORT_SYSTEM_PROMPT = VERIFICATION_SHORT_SYSTEM_PROMPT
+    VERDICT_SCHEMA = VERIFICATION_SCHEMA
+
+    def get_system_prompt(self) -> str:
+        """Возвращает системный промпт совмещённой проверки"""
+        return VERIFICATION_SYSTEM_PROMPT
+
+    async def execute(
+        self,
+        content: str,
+        specialty: str,
+        channel_name: str,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """
+        Проверяет безопасность и даёт редакторские рекомендации
+
+        Args:
+            content: Текст поста для проверки
+            specialty: Специализация
+            channel_name: Название канала
+            deadline: Срок проверки
+
+        Returns:
+            Dict как у SafetyAgent.execute() + review:
+                {"safe": bool, "issues": [str], "suggestions": [str]}
+        """
+        verdict = await super().execute(content, specialty, channel_name, deadline)
+
+        # Отказ предскрининга и ошибки проходят мимо _extend_verdict
+        if verdict["success"] and "review" not in verdict:
+            verdict = self._extend_verdict(verdict, {})
+        return verdict
+
+    def _extend_verdict(self, verdict: Dict[str, Any], data: Dict[str, Any]) -> Dict[str, Any]:
+        """Редакторская часть в формате ReviewerAgent"""
+        verdict["review"] = {
+            "safe": verdict["is_safe"],
+            "issues": [issue.get("description", "") for issue in verdict.get("issues", [])],
+            "suggestions": data.get("suggestions", [])
+        }
+        return verdict
+
+
+__all__ = ["VerificationAgent"]
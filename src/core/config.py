@@ -27,13 +27,166 @@ class Config:
     
     # OpenRouter API
     OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-    OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+    # Можно направить на локальную заглушку: scripts/fake_openrouter.py
+    OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+    # Бюджет одного вызова, если вызывающий не передал свой Deadline
+    OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "60"))
+    OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10"))
+    # Ожидание первого байта ответа (и максимальная пауза между фрагментами потока)
+    OPENROUTER_TTFB_TIMEOUT = float(os.getenv("OPENROUTER_TTFB_TIMEOUT", "30"))
+    
+    # SLA редактора: генерация + проверка безопасности, сек
+    GENERATION_SLA = float(os.getenv("GENERATION_SLA", "45"))
+    # Сколько из SLA оставить проверке безопасности
+    SAFETY_RESERVE = float(os.getenv("SAFETY_RESERVE", "12"))
+    # Проверять завершённые абзацы, пока пост ещё генерируется
+    SAFETY_PIPELINING = os.getenv("SAFETY_PIPELINING", "true").lower() == "true"
+    # Мелкие абзацы склеиваются во фрагменты не короче этого размера
+    SAFETY_FRAGMENT_MIN_CHARS = int(os.getenv("SAFETY_FRAGMENT_MIN_CHARS", "300"))
+    # Локальный предскрининг: явные нарушения отклоняются без LLM,
+    # тексты с риском ниже порога проверяются коротким промптом (0 — всегда полный)
+    SAFETY_PRESCREEN_ENABLED = os.getenv("SAFETY_PRESCREEN_ENABLED", "true").lower() == "true"
+    SAFETY_PRESCREEN_LOW_RISK = float(os.getenv("SAFETY_PRESCREEN_LOW_RISK", "0.3"))
+    # Безопасность + редакторское ревью одним вызовом (VerificationAgent вместо SafetyAgent);
+    # сверка с раздельным режимом: scripts/compare_verification.py
+    COMBINED_VERIFICATION = os.getenv("COMBINED_VERIFICATION", "false").lower() == "true"
+    # Конвейер поста: одновременных генераций и проверок на процесс, сколько
+    # прогонов может ждать слота (0 — без лимита) и предельное время этапа поверх Deadline
+    PIPELINE_GENERATE_CONCURRENCY = int(os.getenv("PIPELINE_GENERATE_CONCURRENCY", "8"))
+    PIPELINE_SAFETY_CONCURRENCY = int(os.getenv("PIPELINE_SAFETY_CONCURRENCY", "8"))
+    PIPELINE_MAX_PENDING = int(os.getenv("PIPELINE_MAX_PENDING", "50"))
+    PIPELINE_STAGE_TIMEOUT = float(os.getenv("PIPELINE_STAGE_TIMEOUT", "120"))
+    
+    # HTTP-пул соединений к OpenRouter
+    OPENROUTER_POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "100"))
+    OPENROUTER_POOL_PER_HOST = int(os.getenv("OPENROUTER_POOL_PER_HOST", "20"))
+    OPENROUTER_KEEPALIVE_TIMEOUT = float(os.getenv("OPENROUTER_KEEPALIVE_TIMEOUT", "75"))
+    OPENROUTER_DNS_CACHE_TTL = int(os.getenv("OPENROUTER_DNS_CACHE_TTL", "300"))
+    OPENROUTER_WARMUP_CONNECTIONS = int(os.getenv("OPENROUTER_WARMUP_CONNECTIONS", "4"))
     
     # AI Models
     DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "anthropic/claude-3.5-sonnet")
+    # Запасные модели по порядку: хедж при медленном ответе и fallback при сбое
+    FALLBACK_MODELS = [m.strip() for m in os.getenv("FALLBACK_MODELS", "").split(",") if m.strip()]
     TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))
     MAX_TOKENS = int(os.getenv("MAX_TOKENS", "2000"))
+    # Сколько черновиков поста генерировать параллельно (1 — один черновик с живым превью)
+    GENERATION_CANDIDATES = int(os.getenv("GENERATION_CANDIDATES", "1"))
+    GENERATION_CANDIDATE_TEMPERATURES = [
+        float(t) for t in os.getenv("GENERATION_CANDIDATE_TEMPERATURES", "0.7,0.85,1.0").split(",") if t.strip()
+    ]
+    # Кэширование префикса промпта у провайдера (cache_control): статичные
+    # системные промпты не обрабатываются заново при каждом вызове
+    PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+    # Модели, понимающие явные cache_control (остальным метки не отправляются)
+    PROMPT_CACHE_MODEL_PREFIXES = [
+        p.strip() for p in os.getenv("PROMPT_CACHE_MODEL_PREFIXES", "anthropic/,google/gemini").split(",") if p.strip()
+    ]
+    # Модели, которым отправляется response_format с JSON-схемой (вердикты агентов)
+    STRUCTURED_OUTPUT_MODEL_PREFIXES = [
+        p.strip() for p in os.getenv("STRUCTURED_OUTPUT_MODEL_PREFIXES", "openai/,google/gemini").split(",") if p.strip()
+    ]
+    # Окна контекста моделей в токенах: "префикс:токены", выигрывает самый длинный префикс
+    MODEL_CONTEXT_WINDOWS = {
+        prefix.strip(): int(tokens)
+        for prefix, tokens in (
+            item.rsplit(":", 1) for item in os.getenv(
+                "MODEL_CONTEXT_WINDOWS",
+                "anthropic/:200000,openai/gpt-4o:128000,openai/gpt-4-turbo:128000,"
+                "google/gemini:1000000,meta-llama/llama-3.1:128000,mistralai/:32000"
+            ).split(",") if ":" in item
+        )
+    }
+    # Окно для моделей, которых нет в MODEL_CONTEXT_WINDOWS
+    DEFAULT_CONTEXT_WINDOW = int(os.getenv("DEFAULT_CONTEXT_WINDOW", "16000"))
+    # Длинный текст новости обрезается до этого числа токенов перед генерацией
+    NEWS_CONTENT_MAX_TOKENS = int(os.getenv("NEWS_CONTENT_MAX_TOKENS", "3000"))
+    # Максимальная длина поста ContentGeneratorAgent (символы) — из неё считается max_tokens
+    POST_MAX_LENGTH = int(os.getenv("POST_MAX_LENGTH", "1500"))
+    # Few-shot: посты каналов из data/examples, близкие к теме и популярные (0 — выключено)
+    FEW_SHOT_EXAMPLES = int(os.getenv("FEW_SHOT_EXAMPLES", "2"))
+    # Доля вовлечённости (просмотры, репосты) в оценке примера, остальное — близость к теме
+    FEW_SHOT_ENGAGEMENT_WEIGHT = float(os.getenv("FEW_SHOT_ENGAGEMENT_WEIGHT", "0.3"))
+    # Длинный пример обрезается до этого числа токенов
+    FEW_SHOT_EXAMPLE_MAX_TOKENS = int(os.getenv("FEW_SHOT_EXAMPLE_MAX_TOKENS", "500"))
+    EXAMPLES_DIR = os.getenv("EXAMPLES_DIR", "./data/examples")
+    # Кэш индекса примеров (токенизированные посты); пусто — без кэша
+    EXAMPLES_INDEX_PATH = os.getenv("EXAMPLES_INDEX_PATH", "./data/cache/examples_index.json")
+    # Почти-дубликаты тем и постов (MinHash + LSH) по опубликованному, очереди и data/examples
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+    DEDUP_DB_PATH = os.getenv("DEDUP_DB_PATH", "./data/cache/dedup.db")
+    # Пороги сходства Жаккара: тема — по основам слов заголовка, текст — по тройкам слов
+    DEDUP_TOPIC_THRESHOLD = float(os.getenv("DEDUP_TOPIC_THRESHOLD", "0.5"))
+    DEDUP_POST_THRESHOLD = float(os.getenv("DEDUP_POST_THRESHOLD", "0.5"))
+    
+    # Лимиты запросов к OpenRouter (на каждую модель)
+    OPENROUTER_RPS = float(os.getenv("OPENROUTER_RPS", "2"))
+    OPENROUTER_BURST = int(os.getenv("OPENROUTER_BURST", "5"))
+    OPENROUTER_INITIAL_CONCURRENCY = int(os.getenv("OPENROUTER_INITIAL_CONCURRENCY", "4"))
+    OPENROUTER_MIN_CONCURRENCY = int(os.getenv("OPENROUTER_MIN_CONCURRENCY", "1"))
+    OPENROUTER_MAX_CONCURRENCY = int(os.getenv("OPENROUTER_MAX_CONCURRENCY", "16"))
+    OPENROUTER_TARGET_LATENCY = float(os.getenv("OPENROUTER_TARGET_LATENCY", "30"))
+    # Сколько запросов пакетной генерации (generate_many / execute_many) в полёте одновременно
+    OPENROUTER_BATCH_CONCURRENCY = int(os.getenv("OPENROUTER_BATCH_CONCURRENCY", "8"))
+    
+    # Повторы и circuit breaker для OpenRouter
+    OPENROUTER_RETRY_ATTEMPTS = int(os.getenv("OPENROUTER_RETRY_ATTEMPTS", "3"))
+    OPENROUTER_RETRY_BASE_DELAY = float(os.getenv("OPENROUTER_RETRY_BASE_DELAY", "1"))
+    OPENROUTER_RETRY_MAX_DELAY = float(os.getenv("OPENROUTER_RETRY_MAX_DELAY", "20"))
+    OPENROUTER_BREAKER_THRESHOLD = int(os.getenv("OPENROUTER_BREAKER_THRESHOLD", "5"))
+    OPENROUTER_BREAKER_RECOVERY = float(os.getenv("OPENROUTER_BREAKER_RECOVERY", "30"))
     
+    # Хеджирование: если основная модель не ответила за p95 её TTFB,
+    # параллельно запускается запрос к следующей модели
+    OPENROUTER_HEDGING = os.getenv("OPENROUTER_HEDGING", "true").lower() == "true"
+    OPENROUTER_HEDGE_PERCENTILE = float(os.getenv("OPENROUTER_HEDGE_PERCENTILE", "0.95"))
+    OPENROUTER_HEDGE_MIN_SAMPLES = int(os.getenv("OPENROUTER_HEDGE_MIN_SAMPLES", "20"))
+    # Задержка хеджа, пока замеров меньше OPENROUTER_HEDGE_MIN_SAMPLES
+    OPENROUTER_HEDGE_DELAY = float(os.getenv("OPENROUTER_HEDGE_DELAY", "15"))
+    
+    # Кэш ответов LLM (SQLite + LRU в памяти)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./data/cache/llm_responses.db")
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+    LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "512"))
+    LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+    # Вызовы с temperature выше порога недетерминированы и не кэшируются
+    LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+    # Кэш вердиктов SafetyAgent/ReviewerAgent по хешу нормализованного текста
+    # (таблица в файле LLM_CACHE_PATH)
+    VERDICT_CACHE_ENABLED = os.getenv("VERDICT_CACHE_ENABLED", "true").lower() == "true"
+    VERDICT_CACHE_TTL = int(os.getenv("VERDICT_CACHE_TTL", str(30 * 24 * 3600)))
+    # Принятые черновики по нормализованной теме: повторная тема — пост
+    # сразу, без генерации (таблица в файле LLM_CACHE_PATH)
+    DRAFT_CACHE_ENABLED = os.getenv("DRAFT_CACHE_ENABLED", "true").lower() == "true"
+    DRAFT_CACHE_TTL = int(os.getenv("DRAFT_CACHE_TTL", str(14 * 24 * 3600)))
+    DRAFT_CACHE_MEMORY_ITEMS = int(os.getenv("DRAFT_CACHE_MEMORY_ITEMS", "128"))
+
+    # Учёт токенов и бюджеты LLM (0 — без лимита)
+    LLM_LEDGER_PATH = os.getenv("LLM_LEDGER_PATH", "./data/usage/llm_usage.db")
+    LLM_DAILY_BUDGET_USD = float(os.getenv("LLM_DAILY_BUDGET_USD", "0"))
+    LLM_MONTHLY_BUDGET_USD = float(os.getenv("LLM_MONTHLY_BUDGET_USD", "0"))
+    # Дневные лимиты по специализациям: "гинекология:2,педиатрия:1.5"
+    LLM_SPECIALTY_DAILY_BUDGETS = {
+        name.strip(): float(limit)
+        for name, limit in (
+            item.rsplit(":", 1) for item in os.getenv("LLM_SPECIALTY_DAILY_BUDGETS", "").split(",") if ":" in item
+        )
+    }
+    # Модель, на которую переключаемся при превышении лимита (пусто — сразу отказ)
+    LLM_BUDGET_CHEAP_MODEL = os.getenv("LLM_BUDGET_CHEAP_MODEL", "")
+    # Во сколько раз можно превысить лимит на дешёвой модели, прежде чем отказывать
+    LLM_BUDGET_HARD_FACTOR = float(os.getenv("LLM_BUDGET_HARD_FACTOR", "1.5"))
+
+    # Трассировка этапов (спаны от апдейта Telegram до превью): jsonl — файл
+    # TRACING_PATH (отчёт: scripts/trace_report.py), otlp — OTLP/HTTP JSON на
+    # TRACING_OTLP_ENDPOINT, none — выключено (по умолчанию: в спанах chat_id и
+    # user_id, а файл jsonl не ротируется — включать осознанно)
+    TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+    TRACING_PATH = os.getenv("TRACING_PATH", "./data/traces/spans.jsonl")
+    TRACING_OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+    TRACING_FLUSH_INTERVAL = float(os.getenv("TRACING_FLUSH_INTERVAL", "5"))
+
     # Database
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./data/database/medical_smm.db")
     
@@ -0,0 +1,65 @@
+"""
+Дедлайн запроса: общий бюджет времени, который передаётся по цепочке
+обработчик → агенты → OpenRouterService
+"""
+
+import time
+
+from src.core.config import config
+
+
+class Deadline:
+    """
+    Абсолютный срок выполнения + раздельные лимиты на соединение и первый байт
+
+    Каждый этап (генерация, проверка безопасности, отдельный HTTP-запрос)
+    получает не фиксированный таймаут, а остаток общего бюджета.
+
+    Пример:
+        deadline = Deadline(config.GENERATION_SLA)
+        gen = await generator_agent.execute(..., deadline=deadline.reserve(config.SAFETY_RESERVE))
+        safety = await safety_agent.execute(..., deadline=deadline)
+    """
+
+    def __init__(
+        self,
+        total: float,
+        connect: float = None,
+        ttfb: float = None,
+        expires_at: float = None
+    ):
+        """
+        Args:
+            total: Бюджет от текущего момента, сек
+            connect: Лимит на установку соединения (по умолчанию OPENROUTER_CONNECT_TIMEOUT)
+            ttfb: Лимит ожидания первого байта / паузы в потоке
+                (по умолчанию OPENROUTER_TTFB_TIMEOUT)
+            expires_at: Абсолютный срок по time.monotonic() (вместо total)
+        """
+        self.expires_at = expires_at if expires_at is not None else time.monotonic() + total
+        self.connect = connect or config.OPENROUTER_CONNECT_TIMEOUT
+        self.ttfb = ttfb or config.OPENROUTER_TTFB_TIMEOUT
+
+    def remaining(self) -> float:
+        """Сколько секунд осталось (не меньше 0)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def reserve(self, seconds: float) -> "Deadline":
+        """
+        Дедлайн этапа, оставляющий seconds следующим этапам
+
+        Если общего бюджета меньше резерва, этап получает половину остатка.
+        """
+        budget = self.remaining()
+        share = budget - seconds if budget > seconds * 2 else budget / 2
+        return Deadline(0, self.connect, self.ttfb, expires_at=time.monotonic() + share)
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining():.1f}s, connect={self.connect}s, ttfb={self.ttfb}s)"
+
+
+__all__ = ["Deadline"]
@@ -23,6 +23,25 @@ class GenerationError(MedicalSMMError):
     pass
 
 
+class GenerationAborted(GenerationError):
+    """Генерация остановлена досрочно (например, критичная проблема безопасности в черновике)"""
+    pass
+
+
+class PipelineStopped(MedicalSMMError):
+    """Этап конвейера остановил прогон досрочно (не ошибка: например, найден дубликат)"""
+
+    def __init__(self, reason: str, **details):
+        super().__init__(reason)
+        self.reason = reason
+        self.details = details
+
+
+class PipelineOverloaded(MedicalSMMError):
+    """Очередь этапа конвейера переполнена — новый прогон отклонён"""
+    pass
+
+
 class ConfigError(MedicalSMMError):
     """Ошибка конфигурации"""
     pass
@@ -48,6 +67,9 @@ __all__ = [
     "BotError",
     "PublishError",
     "GenerationError",
+    "GenerationAborted",
+    "PipelineStopped",
+    "PipelineOverloaded",
     "ConfigError",
     "ValidationError",
     "APIError",
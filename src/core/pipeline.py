@@ -0,0 +1,492 @@
+"""
+Декларативный асинхронный конвейер этапов
+
+Этапы объявляются с зависимостями (after), лимитом одновременных
+выполнений на весь процесс (concurrency), очередью ожидающих прогонов
+(max_pending — backpressure: лишний прогон отклоняется PipelineOverloaded,
+а не копится в памяти) и таймаутом. Независимые этапы одного прогона
+выполняются параллельно: этап стартует, как только готовы его зависимости.
+
+Ошибка любого этапа отменяет остальные (fail-fast), этап может остановить
+прогон без ошибки через ctx.stop() — например, найден дубликат.
+По каждому этапу прогона доступны тайминги (ожидание слота, выполнение),
+по конвейеру в целом — накопленная статистика (get_stats), каждый этап
+пишет спан stage.<имя>.
+
+Пример:
+    pipeline = Pipeline("post", [
+        Stage("generate", generate, concurrency=8),
+        Stage("safety", check, after=("generate",), timeout=30),
+        Stage("format", format_post, after=("generate",)),
+    ])
+    run = await pipeline.run(news=news, channel=channel)
+    if run.ok:
+        print(run.results["format"], run.timings)
+"""
+
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from src.core.config import config
+from src.core.exceptions import PipelineOverloaded, PipelineStopped
+from src.core.logger import logger
+from src.core.tracing import span
+from src.utils.helpers import gather_bounded
+
+# Статусы этапа в прогоне
+STAGE_PENDING = "pending"
+STAGE_RUNNING = "running"
+STAGE_OK = "ok"
+STAGE_SKIPPED = "skipped"        # условие when не выполнено
+STAGE_STOPPED = "stopped"        # этап остановил прогон (ctx.stop)
+STAGE_FAILED = "failed"
+STAGE_TIMEOUT = "timeout"
+STAGE_REJECTED = "rejected"      # очередь этапа переполнена (max_pending)
+STAGE_CANCELLED = "cancelled"    # прогон завершился раньше, чем этап успел выполниться (или закончил)
+
+# Статусы прогона
+RUN_OK = "ok"
+RUN_STOPPED = "stopped"
+RUN_FAILED = "failed"
+
+
+class PipelineContext:
+    """
+    Данные прогона, доступные этапам
+
+    inputs — входные параметры run(), results — результаты завершённых
+    этапов, state — общий черновик этапов одного прогона.
+    """
+
+    def __init__(self, inputs: Dict[str, Any], results: Dict[str, Any]):
+        self.inputs = inputs
+        self.results = results
+        self.state: Dict[str, Any] = {}
+        self._on_abort: List[Callable[[], Any]] = []
+
+    def stop(self, reason: str, **details: Any):
+        """Останавливает прогон без ошибки; details доступны в PipelineRun.stop_details"""
+        raise PipelineStopped(reason, **details)
+
+    def on_abort(self, callback: Callable[[], Any]):
+        """Синхронная очистка, если прогон не дошёл до конца (ошибка, остановка, отмена)"""
+        self._on_abort.append(callback)
+
+    def abort(self):
+        for callback in self._on_abort:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка очистки прогона: {e}")
+
+
+class PipelineRun:
+    """Итог прогона: результаты и тайминги этапов"""
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+        self.status = RUN_OK
+        self.error: Optional[str] = None
+        self.exception: Optional[BaseException] = None
+        self.failed_stage: Optional[str] = None
+        self.stop_reason: Optional[str] = None
+        self.stop_details: Dict[str, Any] = {}
+        self.started_at = time.monotonic()
+        self.duration_ms = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.status == RUN_OK
+
+    @property
+    def stopped(self) -> bool:
+        return self.status == RUN_STOPPED
+
+    def __getitem__(self, stage: str) -> Any:
+        return self.results[stage]
+
+    def summary(self) -> str:
+        """Тайминги одной строкой: generate 1840 мс, safety 310 мс (+120 мс ожидания)"""
+        parts = []
+        for name, timing in self.timings.items():
+            if timing["status"] in (STAGE_SKIPPED, STAGE_CANCELLED, STAGE_PENDING, STAGE_REJECTED):
+                continue
+            part = f"{name} {timing['duration_ms']:.0f} мс"
+            if timing["wait_ms"] >= 1:
+                part += f" (+{timing['wait_ms']:.0f} мс ожидания)"
+            parts.append(part)
+        return ", ".join(parts)
+
+
+class Stage:
+    """
+    Этап конвейера
+
+    Лимит concurrency и очередь max_pending общие для всех прогонов
+    конвейера: при concurrency=4 пятый одновременный прогон ждёт слота,
+    при заполненной очереди — отклоняется.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[PipelineContext], Awaitable[Any]],
+        after: Iterable[str] = (),
+        concurrency: int = 0,
+        timeout: Optional[float] = None,
+        max_pending: int = 0,
+        when: Optional[Callable[[PipelineContext], bool]] = None
+    ):
+        """
+        Args:
+            name: Имя этапа (ключ в results и timings)
+            func: Корутина func(ctx) → результат этапа
+            after: Этапы, результаты которых нужны этому
+            concurrency: Одновременных выполнений на конвейер (0 — без лимита)
+            timeout: Таймаут выполнения, сек (ожидание слота не считается)
+            max_pending: Сколько прогонов может ждать слота (0 — без лимита)
+            when: Условие выполнения; иначе этап пропускается (результат None)
+        """
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.when = when
+
+        self._semaphore = asyncio.Semaphore(concurrency) if concurrency > 0 else None
+        self.waiting = 0
+        self.running = 0
+        self.stats = {
+            "runs": 0,
+            "ok": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "skipped": 0,
+            "rejected": 0,
+            "cancelled": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "wait_ms": 0.0,
+            "max_waiting": 0
+        }
+
+    @asynccontextmanager
+    async def slot(self):
+        """Слот выполнения с учётом concurrency и max_pending"""
+        if self._semaphore is not None:
+            if self.max_pending and self.waiting >= self.max_pending and self._semaphore.locked():
+                self.stats["rejected"] += 1
+                raise PipelineOverloaded(f"Этап «{self.name}» перегружен: {self.waiting} прогонов в очереди")
+
+            self.waiting += 1
+            self.stats["max_waiting"] = max(self.stats["max_waiting"], self.waiting)
+            try:
+                await self._semaphore.acquire()
+            finally:
+                self.waiting -= 1
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def record(self, status: str, duration_ms: float, wait_ms: float):
+        self.stats["runs"] += 1
+        if status == STAGE_SKIPPED:
+            self.stats["skipped"] += 1
+            return
+        if status == STAGE_CANCELLED:
+            # Оборванное выполнение не искажает среднее время этапа
+            self.stats["cancelled"] += 1
+            return
+        if status == STAGE_TIMEOUT:
+            self.stats["timeouts"] += 1
+        elif status in (STAGE_OK, STAGE_STOPPED):
+            self.stats["ok"] += 1
+        else:
+            self.stats["failed"] += 1
+        self.stats["total_ms"] += duration_ms
+        self.stats["wait_ms"] += wait_ms
+        self.stats["max_ms"] = max(self.stats["max_ms"], duration_ms)
+
+
+class Pipeline:
+    """
+    Граф этапов; один экземпляр на приложение, прогонов — сколько угодно
+
+    Пример пакетного запуска (не больше 5 прогонов одновременно):
+        runs = await pipeline.map([{"news": n, "channel": c} for n in items], concurrency=5)
+    """
+
+    def __init__(self, name: str, stages: List[Stage]):
+        self.name = name
+        self.stages = {stage.name: stage for stage in stages}
+        if len(self.stages) != len(stages):
+            raise ValueError(f"Конвейер {name}: повторяющиеся имена этапов")
+        self._order = self._topological_order()
+
+        self.stats = {"runs": 0, "ok": 0, "stopped": 0, "failed": 0, "total_ms": 0.0}
+
+    def _topological_order(self) -> List[Stage]:
+        """Этапы в порядке зависимостей; ValueError при неизвестной зависимости или цикле"""
+        for stage in self.stages.values():
+            unknown = [name for name in stage.after if name not in self.stages]
+            if unknown:
+                raise ValueError(f"Конвейер {self.name}: этап {stage.name} зависит от неизвестных {unknown}")
+
+        order = []
+        ready = [stage for stage in self.stages.values() if not stage.after]
+        remaining = {stage.name: set(stage.after) for stage in self.stages.values() if stage.after}
+        while ready:
+            stage = ready.pop(0)
+            order.append(stage)
+            for name, deps in list(remaining.items()):
+                deps.discard(stage.name)
+                if not deps:
+                    ready.append(self.stages[name])
+                    del remaining[name]
+
+        if remaining:
+            raise ValueError(f"Конвейер {self.name}: цикл зависимостей между {sorted(remaining)}")
+        return order
+
+    async def run(
+        self,
+        on_stage: Optional[Callable[[str], Awaitable[None]]] = None,
+        **inputs: Any
+    ) -> PipelineRun:
+        """
+        Один прогон конвейера
+
+        Args:
+            on_stage: Корутина (имя этапа), вызываемая перед выполнением этапа
+                (прогресс в интерфейсе)
+            **inputs: Входные данные, доступные этапам как ctx.inputs
+
+        Returns:
+            PipelineRun; ошибки этапов не выбрасываются, а попадают в
+            status / error / exception
+        """
+        result = PipelineRun(self.name)
+        ctx = PipelineContext(inputs, result.results)
+        started_at = result.started_at
+
+        with span(f"pipeline.{self.name}") as run_span:
+            tasks: Dict[str, asyncio.Task] = {}
+            for stage in self._order:
+                tasks[stage.name] = asyncio.create_task(
+                    self._run_stage(stage, ctx, result, tasks, started_at, on_stage)
+                )
+
+            try:
+                await self._wait(tasks, result)
+            except asyncio.CancelledError:
+                result.status = RUN_FAILED
+                result.error = "прогон отменён"
+                raise
+            finally:
+                # Fail-fast и отмена самого прогона: незавершённые этапы снимаются
+                for task in tasks.values():
+                    task.cancel()
+                await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+                result.duration_ms = (time.monotonic() - started_at) * 1000
+                if not result.ok:
+                    ctx.abort()
+                self._record(result)
+                run_span.set(status=result.status, stage=result.failed_stage, stop=result.stop_reason)
+
+        if result.status == RUN_FAILED:
+            logger.warning(f"⚠️ Конвейер {self.name}: этап {result.failed_stage} — {result.error}")
+        else:
+            logger.info(f"⏱ Конвейер {self.name} ({result.status}): {result.summary()}")
+        return result
+
+    async def map(
+        self,
+        items: Iterable[Dict[str, Any]],
+        concurrency: int = None,
+        on_progress: Optional[Callable[[int, int, int, PipelineRun], Awaitable[None]]] = None
+    ) -> List[PipelineRun]:
+        """
+        Пакетный запуск: по прогону на набор входных данных
+
+        Args:
+            items: Входные данные run() для каждого прогона
+            concurrency: Прогонов одновременно (по умолчанию OPENROUTER_BATCH_CONCURRENCY) —
+                пакет не упирается в max_pending этапов
+            on_progress: Корутина (done, total, index, run)
+
+        Returns:
+            PipelineRun в порядке items
+        """
+        return await gather_bounded(
+            items,
+            lambda inputs: self.run(**inputs),
+            concurrency=concurrency or config.OPENROUTER_BATCH_CONCURRENCY,
+            on_progress=on_progress
+        )
+
+    async def _wait(self, tasks: Dict[str, asyncio.Task], result: PipelineRun):
+        """Ждёт этапы до первой ошибки или остановки"""
+        names = {task: name for name, task in tasks.items()}
+        pending = set(tasks.values())
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.cancelled() or task.exception() is None:
+                    continue
+                error = task.exception()
+                if isinstance(error, PipelineStopped):
+                    result.status = RUN_STOPPED
+                    result.stop_reason = error.reason
+                    result.stop_details = error.details
+                else:
+                    result.status = RUN_FAILED
+                    result.error = str(error) or type(error).__name__
+                    result.exception = error
+                    result.failed_stage = names[task]
+                return
+
+    async def _run_stage(
+        self,
+        stage: Stage,
+        ctx: PipelineContext,
+        result: PipelineRun,
+        tasks: Dict[str, asyncio.Task],
+        started_at: float,
+        on_stage: Optional[Callable[[str], Awaitable[None]]]
+    ):
+        timing = result.timings[stage.name] = {
+            "status": STAGE_PENDING,
+            "started_ms": 0.0,
+            "wait_ms": 0.0,
+            "duration_ms": 0.0
+        }
+
+        try:
+            if stage.after:
+                deps = [tasks[name] for name in stage.after]
+                await asyncio.wait(deps)
+                if any(dep.cancelled() or dep.exception() is not None for dep in deps):
+                    timing["status"] = STAGE_CANCELLED
+                    return
+
+            if stage.when is not None and not stage.when(ctx):
+                result.results[stage.name] = None
+                timing["status"] = STAGE_SKIPPED
+                stage.record(STAGE_SKIPPED, 0.0, 0.0)
+                return
+
+            queued_at = time.monotonic()
+            async with stage.slot():
+                stage_started = time.monotonic()
+                timing["wait_ms"] = (stage_started - queued_at) * 1000
+                timing["started_ms"] = (stage_started - started_at) * 1000
+                timing["status"] = STAGE_RUNNING
+                if on_stage is not None:
+                    await on_stage(stage.name)
+
+                stopped = None
+                limit = asyncio.timeout(stage.timeout)
+                try:
+                    with span(f"stage.{stage.name}", wait_ms=round(timing["wait_ms"], 1)) as stage_span:
+                        try:
+                            async with limit:
+                                value = await stage.func(ctx)
+                        except PipelineStopped as stop:
+                            stage_span.set(stopped=stop.reason)
+                            stopped = stop
+                except TimeoutError:
+                    if not limit.expired():
+                        raise
+                    timing["status"] = STAGE_TIMEOUT
+                    raise TimeoutError(f"этап «{stage.name}» не уложился в {stage.timeout:g} с")
+                finally:
+                    timing["duration_ms"] = (time.monotonic() - stage_started) * 1000
+
+            if stopped is not None:
+                timing["status"] = STAGE_STOPPED
+                raise stopped
+
+            result.results[stage.name] = value
+            timing["status"] = STAGE_OK
+
+        except asyncio.CancelledError:
+            if timing["status"] == STAGE_RUNNING:
+                # Снят во время выполнения (fail-fast соседнего этапа, отмена прогона)
+                timing["status"] = STAGE_CANCELLED
+                stage.record(STAGE_CANCELLED, timing["duration_ms"], timing["wait_ms"])
+            elif timing["status"] == STAGE_PENDING:
+                timing["status"] = STAGE_CANCELLED
+            raise
+        except PipelineStopped:
+            raise
+        except PipelineOverloaded:
+            timing["status"] = STAGE_REJECTED
+            raise
+        except Exception:
+            if timing["status"] != STAGE_TIMEOUT:
+                timing["status"] = STAGE_FAILED
+            raise
+        finally:
+            if timing["status"] not in (STAGE_PENDING, STAGE_SKIPPED, STAGE_CANCELLED, STAGE_REJECTED):
+                stage.record(timing["status"], timing["duration_ms"], timing["wait_ms"])
+
+    def _record(self, result: PipelineRun):
+        self.stats["runs"] += 1
+        self.stats[result.status] += 1
+        self.stats["total_ms"] += result.duration_ms
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика прогонов и этапов: среднее/максимальное время, ожидание слота, очередь"""
+        stages = {}
+        for stage in self._order:
+            stats = stage.stats
+            executed = stats["runs"] - stats["skipped"] - stats["cancelled"]
+            stages[stage.name] = {
+                "runs": stats["runs"],
+                "ok": stats["ok"],
+                "failed": stats["failed"],
+                "timeouts": stats["timeouts"],
+                "skipped": stats["skipped"],
+                "rejected": stats["rejected"],
+                "cancelled": stats["cancelled"],
+                "avg_ms": round(stats["total_ms"] / executed, 1) if executed else 0.0,
+                "max_ms": round(stats["max_ms"], 1),
+                "avg_wait_ms": round(stats["wait_ms"] / executed, 1) if executed else 0.0,
+                "running": stage.running,
+                "waiting": stage.waiting,
+                "max_waiting": stats["max_waiting"],
+                "concurrency": stage.concurrency
+            }
+
+        runs = self.stats["runs"]
+        return {
+            "runs": runs,
+            "ok": self.stats["ok"],
+            "stopped": self.stats["stopped"],
+            "failed": self.stats["failed"],
+            "avg_ms": round(self.stats["total_ms"] / runs, 1) if runs else 0.0,
+            "stages": stages
+        }
+
+
+__all__ = [
+    "Pipeline",
+    "Stage",
+    "PipelineContext",
+    "PipelineRun",
+    "RUN_OK",
+    "RUN_STOPPED",
+    "RUN_FAILED"
+]
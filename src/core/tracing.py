@@ -0,0 +1,489 @@
+"""
+Трассировка этапов обработки: спаны с общим trace_id
+
+Апдейт Telegram открывает корневой спан (TracingMiddleware), всё, что
+выполняется внутри обработчика — агенты, запросы к OpenRouter, разбор
+JSON, — пишет дочерние спаны с тем же trace_id. По ним видно, куда
+ушло время медленной генерации: ожидание слота лимитера, соединение,
+первый байт модели, чтение ответа или наш собственный код.
+
+Текущий спан передаётся через contextvars, поэтому задачи
+asyncio.create_task() наследуют его автоматически. Внутри асинхронных
+генераторов (потоки SSE) спаны не активируются — дочерние спаны
+создаются от явно переданного родителя (Span.child / Span.record).
+
+Экспорт (TRACING_EXPORTER):
+    jsonl — строка JSON на спан в TRACING_PATH (разбор: scripts/trace_report.py)
+    otlp  — OTLP/HTTP с JSON-кодированием на TRACING_OTLP_ENDPOINT
+    none  — выключено (по умолчанию): span() возвращает пустой спан без накладных расходов
+
+Пример:
+    with span("safety.execute", specialty=specialty) as s:
+        ...
+        s.set(cached=True)
+"""
+
+import os
+import json
+import time
+import asyncio
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+from src.core.config import config
+from src.core.logger import logger
+
+SERVICE_NAME = "medical-smm-bot"
+
+# Спанов в буфере между сбросами; лишние отбрасываются (считаются в dropped)
+MAX_BUFFERED_SPANS = 10000
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+_current: ContextVar[Optional["Span"]] = ContextVar("tracing_span", default=None)
+
+
+class Span:
+    """
+    Этап обработки: имя, время начала и конца, атрибуты
+
+    Как контекстный менеджер спан становится текущим (родителем для
+    span()) и закрывается на выходе; исключение помечает его ошибкой.
+    """
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns",
+        "attributes", "status", "error", "_token"
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str = None,
+        parent_id: str = None,
+        start_ns: int = None,
+        attributes: Dict[str, Any] = None
+    ):
+        self.name = name
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = {k: v for k, v in (attributes or {}).items() if v is not None}
+        self.status = STATUS_OK
+        self.error: Optional[str] = None
+        self._token = None
+
+    def set(self, **attributes: Any) -> "Span":
+        """Добавляет атрибуты (None пропускаются)"""
+        self.attributes.update((k, v) for k, v in attributes.items() if v is not None)
+        return self
+
+    def fail(self, error: str) -> "Span":
+        """Помечает этап неудачным (ошибка вернулась результатом, а не исключением)"""
+        self.status = STATUS_ERROR
+        self.error = str(error)[:300]
+        return self
+
+    def child(self, name: str, **attributes: Any) -> "Span":
+        """Дочерний спан, начатый сейчас (не становится текущим)"""
+        return Span(name, self.trace_id, self.span_id, attributes=attributes)
+
+    def record(self, name: str, start_ns: int, end_ns: int = None, **attributes: Any) -> "Span":
+        """Уже завершившийся дочерний этап по отметкам time.time_ns()"""
+        child = Span(name, self.trace_id, self.span_id, start_ns, attributes)
+        child.end(end_ns=end_ns)
+        return child
+
+    def end(self, error: BaseException = None, end_ns: int = None):
+        """Закрывает спан и передаёт его на экспорт (повторный вызов ничего не делает)"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if error is not None:
+            self.fail(f"{type(error).__name__}: {error}")
+        tracer.submit(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end(error=exc)
+        return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class _NullSpan(Span):
+    """Спан при выключенной трассировке: все операции — пустые"""
+
+    def __init__(self):
+        super().__init__("null", trace_id="", parent_id=None, start_ns=1)
+        self.span_id = ""
+
+    def set(self, **attributes: Any) -> "Span":
+        return self
+
+    def fail(self, error: str) -> "Span":
+        return self
+
+    def child(self, name: str, **attributes: Any) -> "Span":
+        return self
+
+    def record(self, name: str, start_ns: int, end_ns: int = None, **attributes: Any) -> "Span":
+        return self
+
+    def end(self, error: BaseException = None, end_ns: int = None):
+        pass
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+# ----------------------------------------------------------------------------
+# Экспорт
+# ----------------------------------------------------------------------------
+
+class JsonlSpanExporter:
+    """Спаны построчно в JSONL-файл (дописывается)"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def _write(self, lines: str):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def export(self, spans: List[Span]):
+        lines = "".join(json.dumps(s.to_dict(), ensure_ascii=False) + "\n" for s in spans)
+        await asyncio.to_thread(self._write, lines)
+
+    async def close(self):
+        pass
+
+
+class OtlpSpanExporter:
+    """
+    OTLP/HTTP с JSON-кодированием (POST resourceSpans)
+
+    Подходит любой OpenTelemetry Collector с приёмником otlp/http
+    (обычно http://host:4318/v1/traces) или заглушка
+    scripts/fake_openrouter.py (/v1/traces).
+    """
+
+    def __init__(self, endpoint: str, service_name: str = SERVICE_NAME, timeout: float = 5.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @staticmethod
+    def _value(value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def _span(self, span: Span) -> Dict[str, Any]:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": k, "value": self._value(v)} for k, v in span.attributes.items()],
+            "status": {"code": 2, "message": span.error or ""} if span.status == STATUS_ERROR else {"code": 1}
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        return otlp_span
+
+    def payload(self, spans: List[Span]) -> Dict[str, Any]:
+        """Тело запроса ExportTraceServiceRequest"""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "medical_smm"},
+                    "spans": [self._span(s) for s in spans]
+                }]
+            }]
+        }
+
+    async def export(self, spans: List[Span]):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        async with self._session.post(self.endpoint, json=self.payload(spans)) as response:
+            if response.status >= 300:
+                logger.warning(f"⚠️ Трассировка: коллектор ответил {response.status}: {(await response.text())[:200]}")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+def exporter_from_config():
+    """Экспортёр по TRACING_EXPORTER (None — трассировка выключена)"""
+    kind = config.TRACING_EXPORTER
+    if kind == "jsonl":
+        return JsonlSpanExporter(config.TRACING_PATH)
+    if kind == "otlp":
+        return OtlpSpanExporter(config.TRACING_OTLP_ENDPOINT)
+    if kind not in ("", "none"):
+        logger.warning(f"⚠️ Неизвестный TRACING_EXPORTER={kind!r}, трассировка выключена")
+    return None
+
+
+class Tracer:
+    """
+    Буфер завершённых спанов и фоновый сброс в экспортёр
+
+    Спан при завершении только кладётся в очередь; экспорт идёт раз
+    в flush_interval секунд, ошибки экспорта не влияют на обработку.
+    """
+
+    def __init__(self):
+        self.exporter = None
+        self.dropped = 0
+        self._buffer: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def submit(self, span: Span):
+        if self.exporter is None:
+            return
+        if len(self._buffer) >= MAX_BUFFERED_SPANS:
+            self.dropped += 1
+            return
+        self._buffer.append(span)
+
+    async def start(self, exporter=None, flush_interval: float = None):
+        """
+        Включает трассировку
+
+        Args:
+            exporter: Экспортёр (по умолчанию — по TRACING_EXPORTER)
+            flush_interval: Период сброса, сек (по умолчанию TRACING_FLUSH_INTERVAL)
+        """
+        self.exporter = exporter or exporter_from_config()
+        if self.exporter is None:
+            return
+        interval = flush_interval or config.TRACING_FLUSH_INTERVAL
+        self._task = asyncio.create_task(self._flush_loop(interval))
+        logger.info(f"🔭 Трассировка: {type(self.exporter).__name__}, сброс каждые {interval:g}s")
+
+    async def _flush_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    async def flush(self):
+        """Отправляет накопленные спаны"""
+        if self.exporter is None or not self._buffer:
+            return
+        spans = list(self._buffer)
+        self._buffer.clear()
+        try:
+            await self.exporter.export(spans)
+        except Exception as e:
+            logger.warning(f"⚠️ Трассировка: {len(spans)} спанов не экспортированы: {e}")
+
+    async def close(self):
+        """Сбрасывает остаток и выключает трассировку"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.exporter is None:
+            return
+        await self.flush()
+        await self.exporter.close()
+        if self.dropped:
+            logger.warning(f"⚠️ Трассировка: отброшено {self.dropped} спанов (буфер переполнен)")
+        self.exporter = None
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes: Any) -> Span:
+    """
+    Новый спан — дочерний для текущего или корень новой трассы
+
+    Используется как контекстный менеджер: with span("stage") as s: ...
+    """
+    if not tracer.enabled:
+        return NULL_SPAN
+    parent = _current.get()
+    if parent is None or parent is NULL_SPAN:
+        return Span(name, attributes=attributes)
+    return parent.child(name, **attributes)
+
+
+@contextmanager
+def activated(active: Span):
+    """
+    Делает спан текущим, не закрывая его на выходе
+
+    Для вызовов, чей спан живёт дольше блока (например, до конца потока):
+    закрыть его нужно самому — span.end().
+    """
+    token = _current.set(active)
+    try:
+        yield active
+    finally:
+        _current.reset(token)
+
+
+def current_span() -> Span:
+    """Текущий спан (NULL_SPAN вне трассы)"""
+    return _current.get() or NULL_SPAN
+
+
+def current_trace_id() -> str:
+    """trace_id текущей трассы (пустая строка вне трассы)"""
+    return current_span().trace_id
+
+
+def traced(name: str):
+    """
+    Декоратор корутины: вызов целиком — спан name
+
+    Атрибуты, известные только внутри, добавляются через current_span().set(...).
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ----------------------------------------------------------------------------
+# HTTP-этапы aiohttp: DNS, соединение, первый байт
+# ----------------------------------------------------------------------------
+
+def _request_span(ctx) -> Span:
+    """Спан запроса: trace_request_ctx={"span": ...} или текущий"""
+    request_ctx = ctx.trace_request_ctx
+    if isinstance(request_ctx, dict) and request_ctx.get("span") is not None:
+        return request_ctx["span"]
+    return current_span()
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.span = _request_span(ctx)
+    ctx.started = {}
+    ctx.sent_ns = None
+
+
+def _on_stage_start(name: str):
+    async def handler(session, ctx, params):
+        ctx.started[name] = time.time_ns()
+    return handler
+
+
+def _on_stage_end(name: str):
+    async def handler(session, ctx, params):
+        started_ns = ctx.started.pop(name, None)
+        if started_ns is not None:
+            ctx.span.record(name, started_ns)
+    return handler
+
+
+async def _on_connection_reuse(session, ctx, params):
+    ctx.span.set(connection="reused")
+
+
+async def _on_headers_sent(session, ctx, params):
+    ctx.sent_ns = time.time_ns()
+
+
+async def _on_request_end(session, ctx, params):
+    # Заголовки ответа получены: от отправки запроса — ожидание модели и сети
+    if ctx.sent_ns is not None:
+        ctx.span.record("http.ttfb", ctx.sent_ns, status=params.response.status)
+
+
+async def _on_request_exception(session, ctx, params):
+    ctx.span.set(http_exception=type(params.exception).__name__)
+
+
+def http_trace_config() -> aiohttp.TraceConfig:
+    """
+    TraceConfig для aiohttp.ClientSession: этапы запроса — дочерние спаны
+
+    http.pool_wait — ожидание свободного соединения пула,
+    http.dns, http.connect (TCP + TLS; у переиспользованного соединения
+    его нет, а у спана запроса connection=reused), http.ttfb — от
+    отправки запроса до заголовков ответа.
+    """
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_connection_queued_start.append(_on_stage_start("http.pool_wait"))
+    trace_config.on_connection_queued_end.append(_on_stage_end("http.pool_wait"))
+    trace_config.on_dns_resolvehost_start.append(_on_stage_start("http.dns"))
+    trace_config.on_dns_resolvehost_end.append(_on_stage_end("http.dns"))
+    trace_config.on_connection_create_start.append(_on_stage_start("http.connect"))
+    trace_config.on_connection_create_end.append(_on_stage_end("http.connect"))
+    trace_config.on_connection_reuseconn.append(_on_connection_reuse)
+    trace_config.on_request_headers_sent.append(_on_headers_sent)
+    trace_config.on_request_end.append(_on_request_end)
+    trace_config.on_request_exception.append(_on_request_exception)
+    return trace_config
+
+
+__all__ = [
+    "Span",
+    "NULL_SPAN",
+    "Tracer",
+    "tracer",
+    "span",
+    "activated",
+    "current_span",
+    "current_trace_id",
+    "traced",
+    "http_trace_config",
+    "JsonlSpanExporter",
+    "OtlpSpanExporter"
+]
@@ -0,0 +1,291 @@
+"""
+Двухуровневый кэш: LRU в памяти с TTL + SQLite на диске
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.core.logger import logger
+
+
+# Сколько ждать, пока файл держит запись другой процесс (например, scripts/bench_generation.py), сек
+SQLITE_BUSY_TIMEOUT = 30.0
+
+
+class _SharedConnection:
+    """Соединение с файлом SQLite, общее для всех кэшей этого файла"""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+# Кэши в одном файле (LLM-ответы, вердикты, черновики) пишут через одно
+# соединение под одной блокировкой — отдельные соединения мешали бы друг
+# другу и падали с «database is locked»
+_connections: Dict[str, _SharedConnection] = {}
+_connections_lock = threading.Lock()
+
+
+def _acquire_connection(db_path: str) -> _SharedConnection:
+    path = str(Path(db_path).resolve())
+    with _connections_lock:
+        shared = _connections.get(path)
+        if shared is None:
+            shared = _connections[path] = _SharedConnection(path)
+        shared.users += 1
+        return shared
+
+
+def _release_connection(db_path: str):
+    path = str(Path(db_path).resolve())
+    with _connections_lock:
+        shared = _connections[path]
+        shared.users -= 1
+        if shared.users == 0:
+            del _connections[path]
+            with shared.lock:
+                shared.conn.close()
+
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    Стабильный ключ кэша по содержимому
+
+    Части сериализуются в канонический JSON (сортировка ключей), поэтому
+    одинаковые по смыслу словари дают одинаковый ключ.
+
+    Args:
+        *parts: JSON-сериализуемые значения
+
+    Returns:
+        SHA-256 в hex
+    """
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class PersistentCache:
+    """
+    Кэш JSON-значений с in-memory LRU перед SQLite
+
+    - Память: OrderedDict на memory_items записей, попадание — микросекунды
+    - Диск: таблица SQLite, переживает перезапуск бота
+    - TTL: просроченные записи не возвращаются и удаляются при чтении
+    - Вытеснение: при превышении max_bytes удаляются давно не читанные записи
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        table: str = "cache",
+        ttl: float = 7 * 24 * 3600,
+        memory_items: int = 512,
+        max_bytes: int = 50 * 1024 * 1024
+    ):
+        """
+        Args:
+            db_path: Путь к файлу SQLite (папка создаётся автоматически)
+            table: Имя таблицы (несколько кэшей могут делить один файл —
+                и одно соединение с ним)
+            ttl: Время жизни записи, сек
+            memory_items: Размер LRU в памяти
+            max_bytes: Лимит суммарного размера значений на диске
+        """
+        self.db_path = db_path
+        self.table = table
+        self.ttl = ttl
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evicted": 0}
+
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        shared = _acquire_connection(db_path)
+        self._conn = shared.conn
+        self._db_lock = shared.lock
+        self._closed = False
+
+        with self._db_lock:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+            self._conn.commit()
+
+            self._disk_bytes = self._conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM {table}"
+            ).fetchone()[0]
+
+    # ------------------------------------------------------------------ memory
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._memory[key]
+            return None
+
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_set(self, key: str, value: Any, created_at: float):
+        self._memory[key] = (created_at + self.ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # -------------------------------------------------------------------- disk
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        with self._db_lock:
+            row = self._conn.execute(
+                f"SELECT value, size, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, size, created_at = row
+            now = time.time()
+
+            if created_at + self.ttl < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                self._disk_bytes -= size
+                return None
+
+            self._conn.execute(
+                f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return json.loads(value), created_at
+
+    def _disk_set(self, key: str, raw: str, created_at: float):
+        size = len(raw.encode("utf-8"))
+
+        with self._db_lock:
+            old = self._conn.execute(
+                f"SELECT size FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, raw, size, created_at, created_at)
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+
+            if self._disk_bytes > self.max_bytes:
+                self._evict()
+
+            self._conn.commit()
+
+    def _evict(self):
+        """Удаляет просроченные, затем давно не читанные записи до лимита (под _db_lock)"""
+        cutoff = time.time() - self.ttl
+        cursor = self._conn.execute(
+            f"DELETE FROM {self.table} WHERE created_at < ? RETURNING size", (cutoff,)
+        )
+        freed = sum(row[0] for row in cursor.fetchall())
+        evicted = 0
+
+        for key, size in self._conn.execute(
+            f"SELECT key, size FROM {self.table} ORDER BY accessed_at"
+        ).fetchall():
+            if self._disk_bytes - freed <= self.max_bytes * 0.9:
+                break
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            freed += size
+            evicted += 1
+
+        self._disk_bytes -= freed
+        self._stats["evicted"] += evicted
+        logger.info(f"🧹 Кэш {self.table}: вытеснено {evicted} записей, освобождено {freed} байт")
+
+    # ------------------------------------------------------------------ public
+
+    async def get(self, key: str) -> Optional[Any]:
+        """
+        Получить значение по ключу
+
+        Returns:
+            Значение или None (промах / запись просрочена)
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            self._stats["memory_hits"] += 1
+            return value
+
+        found = await asyncio.to_thread(self._disk_get, key)
+        if found is None:
+            self._stats["misses"] += 1
+            return None
+
+        value, created_at = found
+        self._memory_set(key, value, created_at)
+        self._stats["disk_hits"] += 1
+        return value
+
+    async def set(self, key: str, value: Any):
+        """
+        Сохранить JSON-сериализуемое значение
+
+        Args:
+            key: Ключ (см. make_cache_key)
+            value: Значение
+        """
+        created_at = time.time()
+        raw = json.dumps(value, ensure_ascii=False)
+        self._memory_set(key, value, created_at)
+
+        try:
+            await asyncio.to_thread(self._disk_set, key, raw, created_at)
+        except sqlite3.Error as e:
+            # Диск — только второй уровень, работаем дальше с памятью
+            logger.warning(f"⚠️ Кэш {self.table}: не удалось записать на диск: {e}")
+
+    async def delete(self, key: str):
+        """Удалить запись"""
+        self._memory.pop(key, None)
+
+        def _delete():
+            with self._db_lock:
+                row = self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key = ? RETURNING size", (key,)
+                ).fetchone()
+                self._conn.commit()
+                if row:
+                    self._disk_bytes -= row[0]
+
+        await asyncio.to_thread(_delete)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика попаданий и размеров"""
+        return {
+            **self._stats,
+            "memory_items": len(self._memory),
+            "disk_bytes": self._disk_bytes
+        }
+
+    def close(self):
+        """Отпустить соединение с SQLite (закрывается вместе с последним кэшем файла)"""
+        if not self._closed:
+            self._closed = True
+            _release_connection(self.db_path)
+
+
+__all__ = ["PersistentCache", "make_cache_key"]
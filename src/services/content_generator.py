@@ -5,11 +5,15 @@
 
 from typing import Optional, Dict
 
-from src.agents.specialty_loader import get_specialty_config, get_specialty_prompt
+from src.agents.post_pipeline import build_post_pipeline
+from src.agents.specialty_loader import get_specialty_config
+from src.agents.prompt_templates import specialty_context, topic_system_prompt, topic_user_template
 from src.services.openrouter import OpenRouterService
 from src.services.validator import PostValidator
 from src.core.logger import logger
 from src.core.config import config
+from src.core.pipeline import PipelineContext, PipelineRun
+from src.utils.tokens import max_tokens_for_length, trim_to_tokens
 
 
 class ContentGeneratorService:
@@ -17,16 +21,30 @@ class ContentGeneratorService:
 
     def __init__(
         self,
-        openrouter: Optional[OpenRouterService] = None,
+        openrouter: OpenRouterService,
         validator: Optional[PostValidator] = None,
-        auto_validate: bool = True
+        auto_validate: bool = True,
+        safety_agent=None
     ):
-        self.openrouter = openrouter or OpenRouterService(
-            api_key=config.openrouter_api_key,
-        )
+        """
+        Args:
+            openrouter: Общий сервис OpenRouter приложения (создаётся и
+                закрывается в main.py, свою сессию сервис не открывает)
+            validator: Валидатор постов
+            auto_validate: Проверять ли посты после генерации
+            safety_agent: SafetyAgent для generate_checked (без него проверка пропускается)
+        """
+        self.openrouter = openrouter
         self.validator = validator
         self.auto_validate = auto_validate
 
+        # Тот же конвейер, что у бота, с генерацией по теме вместо ContentGeneratorAgent
+        self.pipeline = build_post_pipeline(
+            safety_agent=safety_agent,
+            generate=self._generate_stage,
+            name="topic"
+        )
+
         self.stats = {
             "total_generated": 0,
             "successful": 0,
@@ -56,46 +74,51 @@ class ContentGeneratorService:
         logger.info(f"Генерация поста из новости для {specialty}")
 
         # Получаем специализированный промпт
-        specialty_prompt = get_specialty_prompt(specialty)
+        specialty_prompt = specialty_context(specialty)
         if not specialty_prompt:
             raise ValueError(f"Неизвестная специализация: {specialty}")
 
-        # Формируем промпт
-        system_prompt = f"""{specialty_prompt}
+        # Промпт специализации — кэшируемый префикс, задание — после него
+        system_prompt = "Создай пост на основе медицинской новости."
 
-Создай пост на основе медицинской новости.
-"""
+        # Полный текст статьи обрезается до бюджета, чтобы не упереться в окно модели
+        news_content = trim_to_tokens(news.get('content', ''), config.NEWS_CONTENT_MAX_TOKENS)
 
         user_prompt = f"""Новость:
 Заголовок: {news.get('title', 'Без заголовка')}
-Текст: {news.get('content', '')}
+Текст: {news_content}
 Источник: {news.get('source', 'Неизвестно')}
 
 Создай качественный пост для канала, используя шаблоны из промпта специализации.
 """
 
-        # Генерируем
-        result = await self.openrouter.generate_with_prompts(
-            system_prompt=system_prompt,
-            user_prompt=user_prompt,
-            temperature=0.7
-        )
+        # Сетевые сбои повторяет сам OpenRouterService (backoff + circuit breaker),
+        # здесь перегенерируем только посты, не прошедшие валидацию
+        for attempt in range(max_retries + 1):
+            result = await self.openrouter.generate_with_prompts(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                temperature=0.7,
+                max_tokens=max_tokens_for_length(config.POST_MAX_LENGTH),
+                metadata={"agent": type(self).__name__, "specialty": specialty},
+                system_context=specialty_prompt
+            )
+
+            if not result["success"]:
+                self._update_stats(specialty, success=False)
+                raise Exception(f"Ошибка генерации: {result.get('error')}")
 
-        if result["success"]:
             post_content = result["content"]
 
             # Валидация если включена
             if self.auto_validate and self.validator:
-                is_valid = self.validator.validate_post(post_content)
-                if not is_valid and max_retries > 0:
-                    logger.warning("Пост не прошёл валидацию, перегенерация...")
-                    return await self.generate_post(news, channel_key, specialty, max_retries - 1)
+                validation = self.validator.validate_post(post_content)
+                if not validation["valid"] and attempt < max_retries:
+                    logger.warning(f"Пост не прошёл валидацию ({validation['error']}), перегенерация...")
+                    continue
 
             self._update_stats(specialty, success=True)
             return post_content
-        else:
-            self._update_stats(specialty, success=False)
-            raise Exception(f"Ошибка генерации: {result.get('error')}")
 
     async def generate_from_topic(
         self,
@@ -123,45 +146,21 @@ class ContentGeneratorService:
         if not specialty_config:
             raise ValueError(f"Неизвестная специализация: {specialty}")
 
-        specialty_prompt = specialty_config["prompt"]
-        emoji = specialty_config["emoji"]
-        channel_link = specialty_config["link"]
-
-        # Формируем системный промпт
-        system_prompt = f"""{specialty_prompt}
-
-ДОПОЛНИТЕЛЬНЫЕ ТРЕБОВАНИЯ:
-- Длина поста: максимум {max_length} символов
-- Обязательно используй эмодзи {emoji} в начале
-- Добавь ссылку на канал {channel_link} в конце
-- Следуй шаблону "{post_type}" из промпта
-- Пиши понятно и для врачей, и для пациентов
-- Используй актуальные данные (февраль 2026)
-"""
-
-        user_prompt = f"""Создай пост для медицинского Telegram-канала на тему:
-
-📌 ТЕМА: {topic}
-
-ТИП ПОСТА: {post_type}
-
-ТРЕБОВАНИЯ:
-1. Используй актуальные данные и исследования (2026 год)
-2. Укажи конкретные источники (клинрекомендации, исследования)
-3. Добавь практическую ценность для врачей
-4. Структурируй по шаблону из промпта специализации
-5. Не превышай {max_length} символов
-6. Обязательно начни с эмодзи {emoji}
-7. В конце добавь ссылку: {channel_link}
-
-Создай готовый к публикации пост."""
+        # Промпт специализации — кэшируемый префикс, требования к посту — после него.
+        # Статичные части собраны заранее, на каждый вызов подставляется только тема
+        specialty_prompt = specialty_context(specialty)
+        system_prompt = topic_system_prompt(specialty.lower(), post_type, max_length)
+        user_prompt = topic_user_template(specialty.lower(), post_type, max_length).render(topic=topic)
 
         try:
             # Генерируем через OpenRouter
             result = await self.openrouter.generate_with_prompts(
                 system_prompt=system_prompt,
                 user_prompt=user_prompt,
-                temperature=0.7
+                temperature=0.7,
+                max_tokens=max_tokens_for_length(max_length),
+                metadata={"agent": type(self).__name__, "specialty": specialty},
+                system_context=specialty_prompt
             )
 
             if result["success"]:
@@ -181,6 +180,46 @@ class ContentGeneratorService:
             self._update_stats(specialty, success=False)
             raise
 
+    async def generate_checked(
+        self,
+        topic: str,
+        specialty: str,
+        post_type: str = "клинрекомендации",
+        max_length: int = 2000
+    ) -> PipelineRun:
+        """
+        Пост по теме через конвейер: проверка безопасности и статус
+
+        Returns:
+            PipelineRun: run["generate"]["content"] — пост, run["review"] — вердикт;
+            ошибка генерации или проверки — в run.error
+        """
+        specialty_config = get_specialty_config(specialty)
+        if not specialty_config:
+            raise ValueError(f"Неизвестная специализация: {specialty}")
+
+        return await self.pipeline.run(
+            topic=topic,
+            post_type=post_type,
+            max_length=max_length,
+            channel={
+                "name": specialty_config["name"],
+                "specialty": specialty.lower(),
+                "emoji": specialty_config["emoji"],
+                "link": specialty_config["link"]
+            }
+        )
+
+    async def _generate_stage(self, ctx: PipelineContext) -> Dict:
+        """Этап generate конвейера: generate_from_topic"""
+        content = await self.generate_from_topic(
+            ctx.inputs["topic"],
+            ctx.inputs["channel"]["specialty"],
+            post_type=ctx.inputs["post_type"],
+            max_length=ctx.inputs["max_length"]
+        )
+        return {"success": True, "content": content}
+
     async def regenerate_post(
         self,
         post: str,
@@ -210,7 +249,8 @@ class ContentGeneratorService:
         result = await self.openrouter.generate_with_prompts(
             system_prompt=system_prompt,
             user_prompt=user_prompt,
-            temperature=0.7
+            temperature=0.7,
+            metadata={"agent": type(self).__name__}
         )
 
         if result["success"]:
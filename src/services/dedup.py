@@ -0,0 +1,365 @@
+"""
+Поиск почти-дубликатов тем и постов: MinHash + LSH
+
+Перед генерацией тема сверяется с заголовками всего, что уже есть:
+опубликованные посты, очередь TaskQueue, архив data/examples. Готовый
+черновик сверяется с текстами тех же постов — до проверки безопасности.
+
+MinHash сжимает множество шинглов текста в сигнатуру из NUM_PERM чисел;
+доля совпадающих чисел двух сигнатур оценивает сходство Жаккара. LSH
+режет сигнатуру на полосы и кладёт пост в корзину каждой полосы —
+кандидаты на сравнение только из общих корзин, поэтому поиск не
+растёт линейно с историей. Сигнатуры хранятся в SQLite и переживают
+перезапуск.
+"""
+
+import re
+import html
+import json
+import time
+import random
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.agents.specialty_loader import SPECIALTY_MAP
+from src.core.config import config
+from src.core.logger import logger
+from src.services.examples_index import MIN_POST_LENGTH, tokenize
+from src.utils.helpers import load_json_file
+
+NUM_PERM = 64
+# 16 полос по 4 числа: порог срабатывания LSH ≈ (1/16)^(1/4) ≈ 0.5
+LSH_BANDS = 16
+
+# Шинглы текста поста — тройки соседних слов
+POST_SHINGLE_SIZE = 3
+
+# Откуда пост: подписи для редактора
+SOURCE_EXAMPLE = "example"
+SOURCE_QUEUED = "queued"
+SOURCE_PUBLISHED = "published"
+SOURCE_LABELS = {
+    SOURCE_EXAMPLE: "архив канала",
+    SOURCE_QUEUED: "в очереди публикации",
+    SOURCE_PUBLISHED: "опубликован"
+}
+
+# Хеш-функции MinHash: (a * x + b) mod p, p — простое Мерсенна
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20260101)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+Signature = Tuple[int, ...]
+
+
+def _hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash(shingles: Iterable[str]) -> Signature:
+    """MinHash-сигнатура множества шинглов (пустой кортеж для пустого множества)"""
+    hashes = [_hash(shingle) for shingle in set(shingles)]
+    if not hashes:
+        return ()
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(first: Signature, second: Signature) -> float:
+    """Оценка сходства Жаккара по сигнатурам"""
+    if not first or not second:
+        return 0.0
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+
+_TAG = re.compile(r"<[^>]+>")
+
+
+def title_of(text: str) -> str:
+    """Заголовок поста: первая непустая строка без разметки"""
+    for line in text.splitlines():
+        line = html.unescape(_TAG.sub("", line)).replace("**", "").replace("__", "").strip()
+        if line:
+            return line[:150]
+    return ""
+
+
+def topic_shingles(text: str) -> Set[str]:
+    """Шинглы темы или заголовка — основы слов"""
+    return set(tokenize(text))
+
+
+def post_shingles(text: str) -> Set[str]:
+    """Шинглы текста поста — тройки основ слов"""
+    tokens = tokenize(text)
+    if len(tokens) < POST_SHINGLE_SIZE:
+        return set(tokens)
+    return {" ".join(tokens[i:i + POST_SHINGLE_SIZE]) for i in range(len(tokens) - POST_SHINGLE_SIZE + 1)}
+
+
+def specialty_of_channel(channel: str) -> Optional[str]:
+    """Специализация по ID или username канала (@profgynecologist, profgynecologist, -100…)"""
+    channel = (channel or "").lstrip("@")
+    for specialty, specialty_config in SPECIALTY_MAP.items():
+        username = specialty_config["link"].rstrip("/").rsplit("/", 1)[-1]
+        if channel in (specialty_config["channel"], username):
+            return specialty
+    return None
+
+
+class _LSH:
+    """Корзины LSH: (полоса, значения полосы) → ключи"""
+
+    def __init__(self, bands: int):
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self.signatures: Dict[str, Signature] = {}
+        self._buckets: Dict[Tuple[int, Signature], Set[str]] = {}
+
+    def _band_keys(self, signature: Signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows]
+
+    def add(self, key: str, signature: Signature):
+        if not signature:
+            return
+        self.remove(key)
+        self.signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets.setdefault(band_key, set()).add(key)
+
+    def remove(self, key: str):
+        signature = self.signatures.pop(key, None)
+        if signature is None:
+            return
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def query(self, signature: Signature) -> List[Tuple[str, float]]:
+        """Кандидаты из общих корзин с оценкой сходства, лучшие первыми"""
+        if not signature:
+            return []
+        candidates: Set[str] = set()
+        for band_key in self._band_keys(signature):
+            candidates |= self._buckets.get(band_key, set())
+        scored = [(key, similarity(signature, self.signatures[key])) for key in candidates]
+        return sorted(scored, key=lambda item: item[1], reverse=True)
+
+
+class DuplicateIndex:
+    """
+    Индекс тем и постов для поиска почти-дубликатов
+
+    Пример:
+        duplicates = DuplicateIndex().load()
+        duplicates.index_examples()
+        match = duplicates.find_topic("Новые критерии ГСД", "гинекология")
+        if match:
+            print(match["title"], match["source"], match["similarity"])
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        topic_threshold: float = None,
+        post_threshold: float = None
+    ):
+        """
+        Args:
+            db_path: Файл SQLite с сигнатурами (по умолчанию DEDUP_DB_PATH)
+            topic_threshold: Порог сходства тем (по умолчанию DEDUP_TOPIC_THRESHOLD)
+            post_threshold: Порог сходства текстов (по умолчанию DEDUP_POST_THRESHOLD)
+        """
+        self.db_path = db_path or config.DEDUP_DB_PATH
+        self.topic_threshold = topic_threshold if topic_threshold is not None else config.DEDUP_TOPIC_THRESHOLD
+        self.post_threshold = post_threshold if post_threshold is not None else config.DEDUP_POST_THRESHOLD
+
+        self._topics = _LSH(LSH_BANDS)
+        self._posts = _LSH(LSH_BANDS)
+        # key → {"specialty", "source", "title", "created_at"}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+
+        # Запись идёт из потоков asyncio.to_thread — соединение под замком
+        self._db_lock = threading.Lock()
+
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dedup ("
+            "key TEXT PRIMARY KEY, specialty TEXT, source TEXT, title TEXT, "
+            "topic_signature TEXT, post_signature TEXT, created_at REAL)"
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ------------------------------------------------------------------
+    # Наполнение
+    # ------------------------------------------------------------------
+
+    def load(self) -> "DuplicateIndex":
+        """Загружает сохранённые сигнатуры в память"""
+        started_at = time.perf_counter()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT key, specialty, source, title, topic_signature, post_signature, created_at FROM dedup"
+            ).fetchall()
+        for key, specialty, source, title, topic_signature, post_signature, created_at in rows:
+            self._remember(
+                key, specialty, source, title,
+                tuple(json.loads(topic_signature)), tuple(json.loads(post_signature)), created_at
+            )
+        logger.info(
+            f"🧬 Индекс дубликатов: {len(self)} постов ({(time.perf_counter() - started_at) * 1000:.0f} мс)"
+        )
+        return self
+
+    def _remember(
+        self,
+        key: str,
+        specialty: Optional[str],
+        source: str,
+        title: str,
+        topic_signature: Signature,
+        post_signature: Signature,
+        created_at: float
+    ):
+        self._entries[key] = {"specialty": specialty, "source": source, "title": title, "created_at": created_at}
+        self._topics.add(key, topic_signature)
+        self._posts.add(key, post_signature)
+
+    def _prepare(self, key: str, text: str, specialty: Optional[str], source: str) -> tuple:
+        title = title_of(text)
+        return (
+            key, specialty, source, title,
+            minhash(topic_shingles(title)), minhash(post_shingles(text)), time.time()
+        )
+
+    def _write(self, rows: List[tuple]):
+        with self._db_lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO dedup VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (key, specialty, source, title, json.dumps(topic_sig), json.dumps(post_sig), created_at)
+                    for key, specialty, source, title, topic_sig, post_sig, created_at in rows
+                ]
+            )
+            self._conn.commit()
+
+    def index_examples(self, examples_dir: str = None) -> int:
+        """
+        Добавляет посты data/examples, которых ещё нет в индексе
+
+        Returns:
+            Число добавленных постов
+        """
+        rows = []
+        for path in sorted(Path(examples_dir or config.EXAMPLES_DIR).glob("*_posts.json")):
+            channel = path.name[:-len("_posts.json")]
+            specialty = specialty_of_channel(channel)
+            for post in load_json_file(str(path)):
+                key = f"example:{channel}:{post.get('id')}"
+                text = (post.get("text") or "").strip()
+                if key in self._entries or len(text) < MIN_POST_LENGTH:
+                    continue
+                rows.append(self._prepare(key, text, specialty, SOURCE_EXAMPLE))
+
+        for row in rows:
+            self._remember(*row)
+        if rows:
+            self._write(rows)
+            logger.info(f"🧬 В индекс дубликатов добавлено постов из архива: {len(rows)}")
+        return len(rows)
+
+    async def add_post(self, key: str, text: str, specialty: Optional[str], source: str = SOURCE_QUEUED):
+        """Добавляет пост (или заменяет пост с тем же ключом)"""
+        row = self._prepare(key, text, specialty, source)
+        self._remember(*row)
+        await asyncio.to_thread(self._write, [row])
+
+    async def set_source(self, key: str, source: str):
+        """Меняет источник поста (например, очередь → опубликован)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry["source"] = source
+
+        def _update():
+            with self._db_lock:
+                self._conn.execute("UPDATE dedup SET source = ? WHERE key = ?", (source, key))
+                self._conn.commit()
+
+        await asyncio.to_thread(_update)
+
+    async def remove(self, key: str):
+        """Убирает пост (задача отменена или провалена)"""
+        if self._entries.pop(key, None) is None:
+            return
+        self._topics.remove(key)
+        self._posts.remove(key)
+
+        def _delete():
+            with self._db_lock:
+                self._conn.execute("DELETE FROM dedup WHERE key = ?", (key,))
+                self._conn.commit()
+
+        await asyncio.to_thread(_delete)
+
+    # ------------------------------------------------------------------
+    # Поиск
+    # ------------------------------------------------------------------
+
+    def _best(
+        self,
+        lsh: _LSH,
+        signature: Signature,
+        specialty: Optional[str],
+        threshold: float
+    ) -> Optional[Dict[str, Any]]:
+        for key, score in lsh.query(signature):
+            if score < threshold:
+                break
+            entry = self._entries[key]
+            if specialty and entry["specialty"] and entry["specialty"] != specialty.lower():
+                continue
+            return {"key": key, "similarity": round(score, 2), **entry}
+        return None
+
+    def find_topic(self, topic: str, specialty: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Самый похожий по заголовку пост той же специализации
+
+        Returns:
+            {"key", "title", "source", "specialty", "similarity", "created_at"}
+            или None, если сходство ниже topic_threshold
+        """
+        return self._best(self._topics, minhash(topic_shingles(topic)), specialty, self.topic_threshold)
+
+    def find_post(self, text: str, specialty: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Самый похожий по тексту пост той же специализации (как find_topic)"""
+        return self._best(self._posts, minhash(post_shingles(text)), specialty, self.post_threshold)
+
+    def close(self):
+        """Закрыть соединение с SQLite"""
+        with self._db_lock:
+            self._conn.close()
+
+
+__all__ = [
+    "DuplicateIndex",
+    "minhash",
+    "similarity",
+    "specialty_of_channel",
+    "SOURCE_EXAMPLE",
+    "SOURCE_QUEUED",
+    "SOURCE_PUBLISHED",
+    "SOURCE_LABELS"
+]
@@ -0,0 +1,115 @@
+"""
+Кэш принятых черновиков: тема → пост
+
+Редактор часто возвращается к той же теме («Новые критерии ГСД»,
+«критерии ГСД, новые!»). Принятый (опубликованный или запланированный)
+черновик запоминается по нормализованной теме, и при повторном вводе
+показывается сразу — без вызовов генератора и проверки безопасности.
+
+Нормализация: регистр, пунктуация и порядок слов не важны. Все слова
+темы сохраняются — числа, однобуквенные слова и предлоги («1 типа» и
+«2 типа», «витамин D» и «витамин B», «при» и «без» — разные темы):
+ошибочно выданный чужой черновик хуже лишней генерации. Ключ включает
+специализацию, тип поста и версию промптов генератора — правка промпта
+или промпта специализации делает старые черновики недоступными.
+
+Хранение — PersistentCache: LRU в памяти с TTL + SQLite на диске.
+"""
+
+import re
+import time
+from typing import Any, Dict, Optional
+
+from src.agents.prompt_templates import specialty_context
+from src.core.logger import logger
+from src.services.cache import PersistentCache, make_cache_key
+from src.utils.helpers import hash_content
+
+# Тип поста интерактивного сценария (тема редактора → пост по шаблону новости)
+POST_TYPE_NEWS = "новость"
+
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize_topic(topic: str) -> str:
+    """Тема без регистра, пунктуации и порядка слов: «ГСД критерии новые» == «Новые критерии ГСД!»"""
+    words = _WORD.findall((topic or "").casefold().replace("ё", "е"))
+    return " ".join(sorted(set(words)))
+
+
+class DraftCache:
+    """
+    Принятые черновики по (тема, специализация, тип поста, версия промптов)
+
+    Пример:
+        drafts = DraftCache(PersistentCache(db_path, table="drafts"), ContentGeneratorAgent.PROMPT_VERSION)
+        await drafts.put("Новые критерии ГСД", "гинекология", {"content": ..., "is_safe": True})
+        draft = await drafts.get("критерии ГСД: новые", "гинекология")
+    """
+
+    def __init__(self, cache: PersistentCache, prompt_version: str = ""):
+        """
+        Args:
+            cache: Хранилище (отдельная таблица PersistentCache)
+            prompt_version: Версия промптов генератора
+        """
+        self.cache = cache
+        self.prompt_version = prompt_version
+
+    def key(self, topic: str, specialty: str, post_type: str = POST_TYPE_NEWS) -> Optional[str]:
+        """Ключ черновика; None — в теме не осталось значимых слов"""
+        normalized = normalize_topic(topic)
+        if not normalized:
+            return None
+        return make_cache_key(
+            "draft",
+            normalized,
+            specialty,
+            post_type,
+            self.prompt_version,
+            hash_content(specialty_context(specialty))[:12]
+        )
+
+    async def get(self, topic: str, specialty: str, post_type: str = POST_TYPE_NEWS) -> Optional[Dict[str, Any]]:
+        """
+        Принятый ранее черновик по теме
+
+        Returns:
+            {"topic", "content", "is_safe", "severity", "issues", "accepted_at"} или None
+        """
+        key = self.key(topic, specialty, post_type)
+        if key is None:
+            return None
+        draft = await self.cache.get(key)
+        if draft is not None:
+            logger.info(f"♻️ Черновик из кэша для темы {topic!r} (исходная: {draft['topic']!r})")
+        return draft
+
+    async def put(
+        self,
+        topic: str,
+        specialty: str,
+        draft: Dict[str, Any],
+        post_type: str = POST_TYPE_NEWS
+    ):
+        """
+        Запоминает принятый черновик
+
+        Args:
+            topic: Тема, введённая редактором
+            specialty: Специализация
+            draft: content + вердикт безопасности (is_safe, severity, issues)
+            post_type: Тип поста
+        """
+        key = self.key(topic, specialty, post_type)
+        if key is None:
+            return
+        await self.cache.set(key, {**draft, "topic": topic, "accepted_at": time.time()})
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика попаданий"""
+        return self.cache.get_stats()
+
+
+__all__ = ["DraftCache", "normalize_topic", "POST_TYPE_NEWS"]
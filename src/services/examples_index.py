@@ -0,0 +1,330 @@
+"""
+Поисковый индекс по примерам постов каналов (data/examples/*_posts.json)
+
+BM25 по постам каналов: для новости находятся самые близкие по теме
+и самые популярные (просмотры, репосты) посты того же канала — они
+уходят генератору как few-shot примеры стиля.
+
+Индекс живёт в памяти (обратные списки term → {пост: tf}), поиск
+проходит только по постам, где есть слова запроса. Токенизированные
+посты сохраняются в JSON-кэш на диске, поэтому при запуске файлы
+примеров заново не разбираются; дописанные в файл посты добавляются
+в индекс без перестройки остальных.
+"""
+
+import re
+import json
+import math
+import time
+from pathlib import Path
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.agents.specialty_loader import get_specialty_config
+from src.core.config import config
+from src.core.logger import logger
+from src.utils.helpers import load_json_file
+
+# Версия формата кэша: при изменении токенизации кэш перестраивается
+INDEX_VERSION = 1
+
+# Параметры BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Слова обрезаются до этой длины — грубый, но быстрый стеммер для русского
+STEM_LENGTH = 6
+MIN_TOKEN_LENGTH = 3
+
+# Посты короче — анонсы и подписи к картинкам, как пример стиля не годятся
+MIN_POST_LENGTH = 300
+
+# Из новости для запроса берётся заголовок и начало текста
+QUERY_MAX_CHARS = 600
+
+STOPWORDS = frozenset("""
+    это как так что чтобы для при без над под про или либо также если когда
+    его она они оно был была были быть есть может могут можно нужно между
+    после перед через около более менее очень только уже еще ещё все всех
+    всё этот эта эти того тому этом том которые который которая которых
+    свой своих вас нас наш ваш них ним где тут там здесь даже лишь
+    the and for with from that this are was were have has not but
+""".split())
+
+_TOKEN = re.compile(r"[а-яёa-z0-9]+")
+
+# Разметка экспорта Telegram → HTML, как в постах генератора
+_MD_LINK = re.compile(r"\[([^\]]+)\]\((https?://[^)\s]+)\)")
+_MD_BOLD = re.compile(r"\*\*(.+?)\*\*", re.DOTALL)
+_MD_ITALIC = re.compile(r"__(.+?)__", re.DOTALL)
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова текста: нижний регистр, без стоп-слов, обрезаны до STEM_LENGTH"""
+    return [
+        token[:STEM_LENGTH]
+        for token in _TOKEN.findall(text.lower().replace("ё", "е"))
+        if len(token) >= MIN_TOKEN_LENGTH and token not in STOPWORDS
+    ]
+
+
+def markdown_to_html(text: str) -> str:
+    """**жирный**, __курсив__ и [текст](url) из экспорта Telegram → HTML"""
+    text = _MD_LINK.sub(r'<a href="\2">\1</a>', text)
+    text = _MD_BOLD.sub(r"<b>\1</b>", text)
+    return _MD_ITALIC.sub(r"<i>\1</i>", text)
+
+
+def channel_of(specialty: str) -> Optional[str]:
+    """Username канала специализации (имя файла примеров без _posts.json)"""
+    specialty_config = get_specialty_config(specialty)
+    if not specialty_config:
+        return None
+    return specialty_config["link"].rstrip("/").rsplit("/", 1)[-1]
+
+
+class ExamplesIndex:
+    """
+    BM25-индекс постов каналов с учётом вовлечённости
+
+    Пример:
+        index = ExamplesIndex()
+        index.load()
+        examples = index.search("Новые критерии ГСД", "гинекология", k=2)
+    """
+
+    def __init__(
+        self,
+        examples_dir: str = None,
+        cache_path: str = None,
+        engagement_weight: float = None
+    ):
+        """
+        Args:
+            examples_dir: Папка с *_posts.json (по умолчанию EXAMPLES_DIR)
+            cache_path: JSON-кэш токенизированных постов (по умолчанию
+                EXAMPLES_INDEX_PATH; пустая строка — без кэша)
+            engagement_weight: Доля вовлечённости в итоговой оценке 0..1
+                (по умолчанию FEW_SHOT_ENGAGEMENT_WEIGHT)
+        """
+        self.examples_dir = Path(examples_dir or config.EXAMPLES_DIR)
+        cache_path = config.EXAMPLES_INDEX_PATH if cache_path is None else cache_path
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.engagement_weight = (
+            engagement_weight if engagement_weight is not None else config.FEW_SHOT_ENGAGEMENT_WEIGHT
+        )
+
+        # Посты: doc_id → {"channel", "id", "text", "views", "forwards", "tf", "length"}
+        self._docs: Dict[int, Dict[str, Any]] = {}
+        self._next_doc_id = 0
+        # Обратные списки по каналам: channel → term → {doc_id: tf}
+        self._postings: Dict[str, Dict[str, Dict[int, int]]] = {}
+        # Суммарная длина постов канала (для средней длины в BM25)
+        self._channel_length: Counter = Counter()
+        # Идентификаторы уже проиндексированных постов канала
+        self._seen: Dict[str, set] = {}
+        # Состояние файлов: имя → (mtime, size)
+        self._files: Dict[str, Tuple[float, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # ------------------------------------------------------------------
+    # Построение
+    # ------------------------------------------------------------------
+
+    def add_post(self, channel: str, post: Dict[str, Any]) -> bool:
+        """
+        Добавляет пост в индекс
+
+        Args:
+            channel: Username канала
+            post: Пост в формате экспорта (id, text, views, forwards)
+
+        Returns:
+            True, если пост добавлен (не дубль и достаточно длинный)
+        """
+        text = (post.get("text") or "").strip()
+        seen = self._seen.setdefault(channel, set())
+        if post.get("id") in seen or len(text) < MIN_POST_LENGTH:
+            return False
+
+        tf = Counter(tokenize(text))
+        self._insert(channel, {
+            "id": post.get("id"),
+            "text": text,
+            "views": int(post.get("views") or 0),
+            "forwards": int(post.get("forwards") or 0),
+            "tf": dict(tf),
+            "length": sum(tf.values())
+        })
+        return True
+
+    def _insert(self, channel: str, doc: Dict[str, Any]):
+        doc_id = self._next_doc_id
+        self._next_doc_id += 1
+
+        doc["channel"] = channel
+        self._docs[doc_id] = doc
+        postings = self._postings.setdefault(channel, {})
+        for term, count in doc["tf"].items():
+            postings.setdefault(term, {})[doc_id] = count
+        self._channel_length[channel] += doc["length"]
+        self._seen.setdefault(channel, set()).add(doc["id"])
+
+    def _drop_channel(self, channel: str):
+        """Убирает из индекса все посты канала (файл переписан, а не дописан)"""
+        for doc_id in [d for d, doc in self._docs.items() if doc["channel"] == channel]:
+            del self._docs[doc_id]
+        self._postings.pop(channel, None)
+        self._channel_length.pop(channel, None)
+        self._seen.pop(channel, None)
+
+    def load(self) -> "ExamplesIndex":
+        """Загружает кэш с диска и досинхронизирует его с файлами примеров"""
+        started_at = time.perf_counter()
+        self._load_cache()
+        self.refresh()
+        logger.info(
+            f"📚 Индекс примеров: {len(self)} постов, {len(self._postings)} каналов "
+            f"({(time.perf_counter() - started_at) * 1000:.0f} мс)"
+        )
+        return self
+
+    def refresh(self, save: bool = True) -> int:
+        """
+        Инкрементально обновляет индекс по файлам примеров
+
+        Файл не изменился — пропускается. Файл дописан — добавляются
+        только новые посты. Пост пропал из файла — канал перестраивается.
+
+        Returns:
+            Число добавленных постов
+        """
+        added = changed = 0
+        for path in sorted(self.examples_dir.glob("*_posts.json")):
+            stat = path.stat()
+            state = (stat.st_mtime, stat.st_size)
+            if self._files.get(path.name) == state:
+                continue
+
+            channel = path.name[:-len("_posts.json")]
+            posts = load_json_file(str(path))
+            ids = {post.get("id") for post in posts}
+            if not self._seen.get(channel, set()) <= ids:
+                self._drop_channel(channel)
+
+            added += sum(self.add_post(channel, post) for post in posts)
+            self._files[path.name] = state
+            changed += 1
+
+        if changed and save:
+            self.save()
+        return added
+
+    def _load_cache(self):
+        if not self.cache_path or not self.cache_path.exists():
+            return
+        try:
+            data = json.loads(self.cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Кэш индекса примеров не прочитан, перестраиваю: {e}")
+            return
+        if data.get("version") != INDEX_VERSION:
+            return
+
+        for doc in data["docs"]:
+            channel = doc.pop("channel")
+            self._insert(channel, doc)
+        self._files = {name: tuple(state) for name, state in data["files"].items()}
+
+    def save(self):
+        """Сохраняет токенизированные посты на диск"""
+        if not self.cache_path:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "version": INDEX_VERSION,
+            "files": self._files,
+            "docs": list(self._docs.values())
+        }
+        tmp_path = self.cache_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(self.cache_path)
+
+    # ------------------------------------------------------------------
+    # Поиск
+    # ------------------------------------------------------------------
+
+    def _bm25(self, terms: List[str], channel: str) -> Dict[int, float]:
+        total = len(self._seen.get(channel, ()))
+        if not total:
+            return {}
+        channel_postings = self._postings[channel]
+        avg_length = self._channel_length[channel] / total
+
+        scores: Dict[int, float] = {}
+        for term in set(terms):
+            postings = channel_postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                length = self._docs[doc_id]["length"]
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        return scores
+
+    @staticmethod
+    def _engagement(doc: Dict[str, Any]) -> float:
+        # Репост — сильный сигнал, он ценнее десятка просмотров
+        return math.log1p(doc["views"] + 10 * doc["forwards"])
+
+    def search(self, query: str, specialty: str, k: int = 2) -> List[Dict[str, Any]]:
+        """
+        Самые подходящие посты канала специализации
+
+        Оценка: BM25 по теме (нормированный на лучший) и вовлечённость
+        (нормированная на лучшую среди найденных) в пропорции
+        1 - engagement_weight : engagement_weight.
+
+        Args:
+            query: Тема или заголовок + начало новости
+            specialty: Специализация (канал — по SPECIALTY_MAP)
+            k: Сколько постов вернуть
+
+        Returns:
+            [{"id", "text" (HTML), "views", "forwards", "score"}], лучшие первыми
+        """
+        channel = channel_of(specialty)
+        if not channel or k <= 0:
+            return []
+
+        relevance = self._bm25(tokenize(query[:QUERY_MAX_CHARS]), channel)
+        if not relevance:
+            return []
+
+        best_relevance = max(relevance.values())
+        engagement = {doc_id: self._engagement(self._docs[doc_id]) for doc_id in relevance}
+        best_engagement = max(engagement.values()) or 1.0
+
+        weight = self.engagement_weight
+        scores = {
+            doc_id: (1 - weight) * relevance[doc_id] / best_relevance + weight * engagement[doc_id] / best_engagement
+            for doc_id in relevance
+        }
+        ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+
+        return [
+            {
+                "id": self._docs[doc_id]["id"],
+                "text": markdown_to_html(self._docs[doc_id]["text"]),
+                "views": self._docs[doc_id]["views"],
+                "forwards": self._docs[doc_id]["forwards"],
+                "score": round(scores[doc_id], 3)
+            }
+            for doc_id in ranked
+        ]
+
+
+__all__ = ["ExamplesIndex", "tokenize", "markdown_to_html", "channel_of"]
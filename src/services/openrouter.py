@@ -3,31 +3,267 @@
 """
 
 import ssl
+import json
+import time
+import asyncio
 import aiohttp
-from typing import Dict, Any, List, Optional
+from contextlib import AsyncExitStack, aclosing
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
 from src.core.logger import logger
 from src.core.config import config
+from src.core.deadline import Deadline
+from src.core.tracing import NULL_SPAN, Span, current_span, http_trace_config, span, tracer
+from src.services.cache import PersistentCache, make_cache_key
+from src.services.rate_limiter import ModelRateLimiter, parse_retry_after
+from src.services.resilience import RetryPolicy, CircuitBreaker, LatencyTracker, is_provider_failure
+from src.services.usage_ledger import UsageLedger, BUDGET_DEGRADE, BUDGET_REFUSE
+from src.utils.helpers import gather_bounded
+from src.utils.tokens import estimate_messages_tokens, plan_context
+
+
+def build_messages(
+    user_prompt: str,
+    cached_system: List[str],
+    system: str = None
+) -> List[Dict[str, Any]]:
+    """
+    Messages с кэшируемым системным префиксом
+
+    Статичные части системного промпта идут первыми, после последней
+    ставится метка cache_control: провайдер (Anthropic, Gemini) кэширует
+    префикс и не обрабатывает его заново при следующих вызовах.
+    Изменчивая часть system идёт после метки и в кэш не попадает.
+
+    Args:
+        user_prompt: Пользовательский промпт
+        cached_system: Стабильные части системного промпта, от общих к частным
+        system: Изменчивая часть системного промпта
+
+    Returns:
+        Messages для OpenRouterService.generate()
+    """
+    blocks = [{"type": "text", "text": part.strip()} for part in cached_system if part]
+    if blocks:
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    if system:
+        blocks.append({"type": "text", "text": system.strip()})
+
+    return [
+        {"role": "system", "content": blocks},
+        {"role": "user", "content": user_prompt.strip()}
+    ]
+
+
+def supports_prompt_cache(model: str) -> bool:
+    """Понимает ли модель явные метки cache_control"""
+    return config.PROMPT_CACHE_ENABLED and any(
+        model.startswith(prefix) for prefix in config.PROMPT_CACHE_MODEL_PREFIXES
+    )
+
+
+def supports_structured_output(model: str) -> bool:
+    """Поддерживает ли модель response_format с JSON-схемой"""
+    return any(model.startswith(prefix) for prefix in config.STRUCTURED_OUTPUT_MODEL_PREFIXES)
+
+
+def json_schema_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """response_format для строгого ответа по JSON-схеме"""
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": schema}
+    }
+
+
+def strip_cache_control(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Склеивает текстовые блоки обратно в строку (для моделей без cache_control)"""
+    stripped = []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, list) and all(block.get("type") == "text" for block in content):
+            content = "\n\n".join(block["text"] for block in content)
+        stripped.append({**message, "content": content})
+    return stripped
 
 
 class OpenRouterService:
-    """Клиент для OpenRouter API"""
+    """
+    Клиент для OpenRouter API
+
+    Держит одну HTTP-сессию с пулом keep-alive соединений на всё время
+    работы приложения. Сессия открывается через start() и закрывается
+    через close() (см. main.py).
+
+    Детерминированные вызовы (temperature <= LLM_CACHE_MAX_TEMPERATURE)
+    кэшируются по хэшу (model, messages, temperature, max_tokens).
+
+    Все запросы проходят через ModelRateLimiter: лимит запросов в секунду
+    и адаптивное окно параллельных запросов на каждую модель.
+
+    Временные сбои (таймауты, 429, 5xx) повторяются по RetryPolicy,
+    а CircuitBreaker на каждую модель сразу отказывает, пока провайдер лежит.
+
+    Модели перебираются по цепочке (DEFAULT_MODEL + FALLBACK_MODELS):
+    если основная не прислала первый байт за p95 своего TTFB, параллельно
+    запускается хедж-запрос к следующей, побеждает первый успешный ответ;
+    при сбое модели запрос уходит к следующей.
+
+    Одновременные идентичные запросы (single-flight) объединяются: по сети
+    уходит один, остальные вызывающие получают его результат.
+
+    Статичный системный префикс (см. build_messages) помечается cache_control
+    и кэшируется провайдером; для моделей без поддержки метки снимаются.
+
+    Время ограничивается Deadline вызывающего: повторы, fallback и каждый
+    HTTP-запрос получают остаток общего бюджета, раздельно ограничены
+    соединение и ожидание первого байта.
+
+    Каждый вызов (токены, латентность, стоимость) пишется в UsageLedger
+    с разбивкой по агенту и специализации из metadata. При превышении
+    бюджета вызов уходит на LLM_BUDGET_CHEAP_MODEL или получает отказ.
+    """
     
     def __init__(
         self,
         api_key: str,
-        base_url: str = "https://openrouter.ai/api/v1"
+        base_url: str = "https://openrouter.ai/api/v1",
+        pool_size: int = None,
+        pool_per_host: int = None,
+        keepalive_timeout: float = None,
+        dns_cache_ttl: int = None,
+        cache: Optional[PersistentCache] = None,
+        limiter: Optional[ModelRateLimiter] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        models: Optional[List[str]] = None,
+        hedging: bool = None,
+        ledger: Optional[UsageLedger] = None
     ):
+        """
+        Args:
+            api_key: API-ключ OpenRouter
+            base_url: Базовый URL API
+            pool_size: Максимум соединений в пуле (по умолчанию из config)
+            pool_per_host: Максимум соединений на один хост (по умолчанию из config)
+            keepalive_timeout: Время жизни простаивающего соединения, сек
+            dns_cache_ttl: TTL кэша DNS, сек
+            cache: Кэш ответов (None — без кэширования)
+            limiter: Лимитер запросов (по умолчанию — из config)
+            retry_policy: Политика повторов (по умолчанию — из config)
+            models: Цепочка моделей по приоритету
+                (по умолчанию DEFAULT_MODEL + FALLBACK_MODELS)
+            hedging: Включить хеджирование (по умолчанию OPENROUTER_HEDGING)
+            ledger: Журнал токенов и бюджетов (None — без учёта и лимитов)
+        """
         self.api_key = api_key
         self.base_url = base_url
+        self.pool_size = pool_size or config.OPENROUTER_POOL_SIZE
+        self.pool_per_host = pool_per_host or config.OPENROUTER_POOL_PER_HOST
+        self.keepalive_timeout = keepalive_timeout or config.OPENROUTER_KEEPALIVE_TIMEOUT
+        self.dns_cache_ttl = dns_cache_ttl or config.OPENROUTER_DNS_CACHE_TTL
+        self.cache = cache
+        self.limiter = limiter or ModelRateLimiter()
+        self.retry_policy = retry_policy or RetryPolicy()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.models = models or [config.DEFAULT_MODEL, *config.FALLBACK_MODELS]
+        self.hedging = config.OPENROUTER_HEDGING if hedging is None else hedging
+        self._ttfb: Dict[str, LatencyTracker] = {}
+        self._inflight: Dict[str, "_InFlight"] = {}
+        self.ledger = ledger
         self.session: Optional[aiohttp.ClientSession] = None
+        self._start_lock = asyncio.Lock()
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        await self.start()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
+        await self.close()
+
+    @property
+    def is_started(self) -> bool:
+        """Открыта ли HTTP-сессия"""
+        return self.session is not None and not self.session.closed
+
+    async def start(self, warmup_connections: int = None):
+        """
+        Открывает общую HTTP-сессию и прогревает пул соединений
+
+        Args:
+            warmup_connections: Сколько соединений открыть заранее
+                (по умолчанию OPENROUTER_WARMUP_CONNECTIONS, 0 — без прогрева)
+        """
+        async with self._start_lock:
+            if self.is_started:
+                return
+
+            # Создаём SSL context без проверки сертификатов
+            ssl_context = ssl.create_default_context()
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+
+            connector = aiohttp.TCPConnector(
+                ssl=ssl_context,
+                limit=self.pool_size,
+                limit_per_host=self.pool_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_cache_ttl
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                    "HTTP-Referer": "https://github.com/annyandr/ai-tg-content",
+                },
+                # DNS, соединение и первый байт — дочерние спаны запроса
+                trace_configs=[http_trace_config()] if tracer.enabled else None
+                # Таймауты задаются на каждый запрос из его Deadline
+            )
+
+            logger.info(
+                f"🔌 OpenRouter: пул соединений открыт "
+                f"(limit={self.pool_size}, per_host={self.pool_per_host}, "
+                f"keepalive={self.keepalive_timeout}s, dns_ttl={self.dns_cache_ttl}s)"
+            )
+
+        if warmup_connections is None:
+            warmup_connections = config.OPENROUTER_WARMUP_CONNECTIONS
+
+        if warmup_connections > 0:
+            await self.warmup(warmup_connections)
+
+    async def warmup(self, connections: int):
+        """
+        Заранее открывает соединения (TCP + TLS), чтобы первые запросы
+        редакторов не платили за handshake
+
+        Args:
+            connections: Количество параллельных соединений
+        """
+        async def _touch():
+            async with self.session.head(
+                self.base_url,
+                timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                await response.read()
+
+        results = await asyncio.gather(
+            *[_touch() for _ in range(connections)],
+            return_exceptions=True
+        )
+        failed = [r for r in results if isinstance(r, Exception)]
+
+        if failed:
+            logger.warning(f"⚠️ OpenRouter: прогрев не удался для {len(failed)}/{connections} соединений: {failed[0]}")
+        else:
+            logger.info(f"🔥 OpenRouter: прогрето {connections} соединений")
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую сессию, открывая её при необходимости"""
+        if not self.is_started:
+            logger.warning("⚠️ OpenRouter: сессия не была открыта через start(), открываю без прогрева")
+            await self.start(warmup_connections=0)
+        return self.session
 
     async def generate_with_prompts(
             self,
@@ -35,7 +271,10 @@ class OpenRouterService:
             user_prompt: str,
             model: str = None,
             temperature: float = None,
-            max_tokens: int = None
+            max_tokens: int = None,
+            metadata: Optional[Dict[str, Any]] = None,
+            system_context: str = None,
+            deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
         """
         Удобная обертка для генерации с system_prompt и user_prompt
@@ -46,117 +285,1018 @@ class OpenRouterService:
             model: Модель (по умолчанию из config)
             temperature: Температура (по умолчанию из config)
             max_tokens: Макс токенов (по умолчанию из config)
+            metadata: {"agent": ..., "specialty": ...} для журнала токенов
+            system_context: Большая статичная часть системного промпта
+                (промпт специализации) — кэшируется провайдером, а
+                system_prompt идёт после неё как изменчивая часть
+            deadline: Срок выполнения (по умолчанию OPENROUTER_TIMEOUT)
 
         Returns:
             Dict с результатом {"success": bool, "content": str, "error": str}
         """
-        # Формируем messages в формате OpenAI Chat Completions API
-        messages = [
-            {"role": "system", "content": system_prompt.strip()},
-            {"role": "user", "content": user_prompt.strip()}
-        ]
+        if system_context:
+            messages = build_messages(user_prompt, [system_context], system=system_prompt)
+        else:
+            messages = build_messages(user_prompt, [system_prompt])
 
         return await self.generate(
             messages=messages,
             model=model,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            metadata=metadata,
+            deadline=deadline
         )
 
-    async def generate(
+    def _build_payload(
         self,
         messages: List[Dict[str, str]],
         model: str = None,
         temperature: float = None,
-        max_tokens: int = None
+        max_tokens: int = None,
+        response_format: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
+        """Формирует тело запроса Chat Completions с дефолтами из config"""
+        data = {
+            "model": model or config.DEFAULT_MODEL,
+            "messages": messages,
+            "temperature": temperature if temperature is not None else config.TEMPERATURE,
+            "max_tokens": max_tokens or config.MAX_TOKENS,
+            # OpenRouter вернёт фактическую стоимость в usage.cost
+            "usage": {"include": True}
+        }
+        if response_format:
+            data["response_format"] = response_format
+        return data
+
+    @staticmethod
+    def _payload_for_model(data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Тело запроса под конкретную модель цепочки: без cache_control
+        и response_format, если модель их не поддерживает
+        """
+        if not supports_prompt_cache(data["model"]):
+            data = {**data, "messages": strip_cache_control(data["messages"])}
+        if "response_format" in data and not supports_structured_output(data["model"]):
+            data = {key: value for key, value in data.items() if key != "response_format"}
+        return data
+
+    @staticmethod
+    def _client_timeout(deadline: Deadline) -> aiohttp.ClientTimeout:
+        """Таймауты HTTP-запроса из остатка дедлайна"""
+        # total=0 в aiohttp означает «без таймаута», поэтому не даём остатку обнулиться
+        remaining = max(deadline.remaining(), 0.001)
+        return aiohttp.ClientTimeout(
+            total=remaining,
+            sock_connect=min(deadline.connect, remaining),
+            # Для потока — максимальная пауза между фрагментами
+            sock_read=min(deadline.ttfb, remaining)
+        )
+
+    @staticmethod
+    def _deadline_result() -> Dict[str, Any]:
+        return {
+            "success": False,
+            "content": None,
+            "error": "Превышено время ожидания ответа",
+            "deadline_exceeded": True
+        }
+
+    @staticmethod
+    def _log_prompt_cache(model: str, usage: Dict[str, Any]):
+        """Сообщает, сколько токенов промпта провайдер взял из кэша"""
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached_tokens:
+            logger.info(
+                f"💾 OpenRouter {model}: {cached_tokens}/{usage.get('prompt_tokens', '?')} "
+                f"токенов промпта из кэша провайдера"
+            )
+
+    @staticmethod
+    def _error_result(
+        status: int,
+        error_text: str,
+        retry_after: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Превращает неуспешный HTTP-ответ в результат {"success": False}"""
+        # Проверяем, не HTML ли это (блокировка firewall)
+        if '<!DOCTYPE' in error_text or '<html' in error_text:
+            logger.error(f"❌ Доступ заблокирован корпоративным firewall")
+            return {
+                "success": False,
+                "content": None,
+                "error": "API заблокирован. Попробуйте с другой машины или используйте VPN",
+                "status": status
+            }
+
+        if status == 429:
+            # Паузу и сжатие окна уже залогировал лимитер
+            wait = f", повтор через {retry_after:.0f} с" if retry_after is not None else ""
+            return {
+                "success": False,
+                "content": None,
+                "error": f"Превышен лимит запросов OpenRouter (429){wait}",
+                "status": 429,
+                "retry_after": retry_after
+            }
+
+        logger.error(f"❌ OpenRouter error {status}: {error_text[:200]}")
+
+        return {
+            "success": False,
+            "content": None,
+            "error": f"API error {status}: {error_text[:200]}",
+            "status": status
+        }
+
+    @staticmethod
+    def _exception_result(e: Exception) -> Dict[str, Any]:
+        """Превращает исключение запроса в результат {"success": False}"""
+        logger.error(f"❌ OpenRouter exception: {type(e).__name__}: {e}")
+        return {
+            "success": False,
+            "content": None,
+            "error": str(e) or type(e).__name__,
+            # Таймауты и обрывы соединения — временные сбои
+            "retryable": isinstance(e, (asyncio.TimeoutError, aiohttp.ClientConnectionError))
+        }
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        """Circuit breaker модели"""
+        if model not in self._breakers:
+            self._breakers[model] = CircuitBreaker(name=model)
+        return self._breakers[model]
+
+    @staticmethod
+    def _circuit_open_result(breaker: CircuitBreaker) -> Dict[str, Any]:
+        return {
+            "success": False,
+            "content": None,
+            "error": (
+                f"OpenRouter ({breaker.name}) временно недоступен, "
+                f"повтор через {breaker.retry_in():.0f} с"
+            ),
+            "circuit_open": True
+        }
+
+    def _record_outcome(self, breaker: CircuitBreaker, result: Dict[str, Any], probe: bool = False):
+        """Учитывает результат попытки в circuit breaker"""
+        if result.get("deadline_exceeded"):
+            # Кончилось наше время, а не сломался провайдер: исход неизвестен —
+            # не сбрасываем счётчик сбоев и не замыкаем цепь, только освобождаем пробу
+            if probe:
+                breaker.release_probe()
+            return
+        if is_provider_failure(result):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def _apply_budget(self, chain: List[str], metadata: Dict[str, Any]) -> Optional[List[str]]:
+        """
+        Цепочка моделей с учётом бюджета
+
+        Returns:
+            Исходная цепочка, [LLM_BUDGET_CHEAP_MODEL] при превышении
+            лимита или None, если вызов нужно отклонить
+        """
+        if self.ledger is None:
+            return chain
+
+        decision = self.ledger.check_budget(metadata.get("specialty"))
+
+        if decision == BUDGET_REFUSE:
+            logger.error(f"💸 Бюджет LLM исчерпан, вызов отклонён ({metadata.get('agent')}, {metadata.get('specialty')})")
+            return None
+        if decision == BUDGET_DEGRADE:
+            logger.warning(f"💸 Бюджет LLM превышен, переключаюсь на {config.LLM_BUDGET_CHEAP_MODEL}")
+            return [config.LLM_BUDGET_CHEAP_MODEL]
+        return chain
+
+    @staticmethod
+    def _apply_context_window(
+        messages: List[Dict[str, Any]],
+        chain: List[str],
+        max_tokens: int,
+        metadata: Dict[str, Any]
+    ) -> Tuple[List[str], int]:
+        """
+        Цепочка моделей и max_tokens с учётом окна контекста
+
+        Returns:
+            Модели, в окно которых помещается промпт, и max_tokens,
+            урезанный до остатка окна; пустая цепочка — не помещается никуда
+        """
+        prompt_tokens = estimate_messages_tokens(messages)
+        fitting, fitted_max_tokens = plan_context(prompt_tokens, max_tokens, chain)
+
+        if not fitting:
+            logger.error(
+                f"📏 Промпт ~{prompt_tokens} токенов не помещается в окно ни одной модели "
+                f"({metadata.get('agent')}, {metadata.get('specialty')})"
+            )
+        elif len(fitting) < len(chain) or fitted_max_tokens < max_tokens:
+            logger.warning(
+                f"📏 Промпт ~{prompt_tokens} токенов: модели {fitting}, max_tokens {max_tokens} → {fitted_max_tokens}"
+            )
+        return fitting, fitted_max_tokens
+
+    @staticmethod
+    def _context_overflow_result() -> Dict[str, Any]:
+        return {
+            "success": False,
+            "content": None,
+            "error": "Исходный текст слишком длинный для модели, сократите его",
+            "context_overflow": True
+        }
+
+    @staticmethod
+    def _budget_exceeded_result() -> Dict[str, Any]:
+        return {
+            "success": False,
+            "content": None,
+            "error": "Исчерпан бюджет на генерацию, попробуйте позже",
+            "budget_exceeded": True
+        }
+
+    def _record_usage(
+        self,
+        result: Dict[str, Any],
+        model: str,
+        started_at: float,
+        metadata: Dict[str, Any]
+    ):
+        """Пишет вызов в журнал токенов"""
+        if self.ledger is None:
+            return
+
+        self.ledger.record(
+            model=result.get("model") or model,
+            usage=result.get("usage") or {},
+            latency=time.monotonic() - started_at,
+            success=result["success"],
+            agent=metadata.get("agent"),
+            specialty=metadata.get("specialty"),
+            cached=bool(result.get("cached") or result.get("coalesced"))
+        )
+
+    async def generate(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        temperature: float = None,
+        max_tokens: int = None,
+        stream: bool = False,
+        use_cache: Optional[bool] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        refresh_cache: bool = False
+    ):
         """
         Генерация через OpenRouter API
         
         Args:
             messages: Список сообщений [{"role": "user", "content": "..."}]
-            model: Модель (по умолчанию из config)
+            model: Конкретная модель без хеджа и fallback
+                (по умолчанию — цепочка self.models)
             temperature: Температура (по умолчанию из config)
             max_tokens: Макс токенов (по умолчанию из config)
+            stream: Потоковый режим (SSE). Вместо словаря возвращается
+                CompletionStream — асинхронный итератор по фрагментам текста.
+                Потоковые вызовы не кэшируются
+            use_cache: True/False — принудительно включить/обойти кэш,
+                None — кэшировать только детерминированные вызовы
+            refresh_cache: Не читать кэш, но записать новый ответ поверх
+                (повтор после непригодного ответа из кэша)
+            metadata: {"agent": ..., "specialty": ...} — разбивка в журнале
+                токенов и дневной лимит специализации
+            deadline: Срок выполнения с учётом повторов и fallback
+                (по умолчанию — OPENROUTER_TIMEOUT от текущего момента)
+            response_format: Структурированный ответ (см. json_schema_format);
+                моделям без поддержки не отправляется
         
         Returns:
             Dict с результатом {"success": bool, "content": str, "error": str}
+            или CompletionStream при stream=True
+        
+        Вызов — спан openrouter.generate (для потока закрывается вместе
+        с потоком), каждый HTTP-запрос — дочерний спан с этапами.
         """
         
-        if not self.session:
-            # Создаём SSL context без проверки сертификатов
-            ssl_context = ssl.create_default_context()
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
+        metadata = metadata or {}
+        deadline = deadline or Deadline(config.OPENROUTER_TIMEOUT)
+        started_at = time.monotonic()
+        call_span = span("openrouter.generate", agent=metadata.get("agent"), stream=stream)
+
+        chain = self._apply_budget([model] if model else self.models, metadata)
+        if chain is None or deadline.expired:
+            result = self._budget_exceeded_result() if chain is None else self._deadline_result()
+            return self._rejected(result, stream, call_span)
+
+        # Слишком длинный промпт отклоняем сразу, а не после ответа API
+        chain, max_tokens = self._apply_context_window(messages, chain, max_tokens or config.MAX_TOKENS, metadata)
+        if not chain:
+            return self._rejected(self._context_overflow_result(), stream, call_span)
+
+        data = self._build_payload(messages, chain[0], temperature, max_tokens, response_format)
+        call_span.set(model=data["model"], fallbacks=len(chain) - 1, max_tokens=max_tokens)
+
+        if stream:
+            return CompletionStream(
+                self, data, fallback_models=chain[1:], metadata=metadata, deadline=deadline, span=call_span
+            )
+
+        with call_span:
+            result = await self._generate_cached(data, chain, use_cache, deadline, refresh_cache)
+            self._trace_result(call_span, result)
+        self._record_usage(result, data["model"], started_at, metadata)
+        return result
+
+    def _rejected(self, result: Dict[str, Any], stream: bool, call_span: Span):
+        """Вызов отклонён до запроса к API (бюджет, дедлайн, окно контекста)"""
+        call_span.fail(result["error"]).end()
+        if stream:
+            return CompletionStream.failed(self, result)
+        return result
+
+    @staticmethod
+    def _trace_result(call_span: Span, result: Dict[str, Any]):
+        """Итог вызова в атрибутах спана"""
+        usage = result.get("usage") or {}
+        call_span.set(
+            model=result.get("model"),
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            chars=len(result.get("content") or "")
+        )
+        if not result["success"]:
+            call_span.fail(result.get("error"))
+
+    async def generate_many(
+        self,
+        requests: List[Dict[str, Any]],
+        concurrency: int = None,
+        on_progress: Optional[Callable[[int, int, int, Dict[str, Any]], Awaitable[None]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Пакетная генерация с ограничением параллельности
+
+        Args:
+            requests: Аргументы generate() для каждого запроса
+                ({"messages": [...], "temperature": 0.3, "metadata": {...}, ...};
+                stream не поддерживается)
+            concurrency: Максимум запросов пакета в полёте одновременно
+                (по умолчанию OPENROUTER_BATCH_CONCURRENCY)
+            on_progress: Корутина (done, total, index, result), вызывается
+                по мере готовности каждого запроса
+
+        Returns:
+            Результаты в порядке requests; ошибка одного запроса
+            не прерывает остальные ({"success": False, ...} на его месте)
+        """
+        concurrency = concurrency or config.OPENROUTER_BATCH_CONCURRENCY
+        logger.info(f"📦 OpenRouter: пакет из {len(requests)} запросов, параллельно до {concurrency}")
+
+        results = await gather_bounded(
+            requests,
+            lambda request: self.generate(**{**request, "stream": False}),
+            concurrency=concurrency,
+            on_progress=on_progress,
+            on_error=lambda request, e: self._exception_result(e)
+        )
+
+        failed = sum(1 for r in results if not r["success"])
+        logger.info(f"📦 OpenRouter: пакет завершён, ошибок {failed}/{len(results)}")
+        return results
+
+    async def _generate_cached(
+        self,
+        data: Dict[str, Any],
+        chain: List[str],
+        use_cache: Optional[bool],
+        deadline: Deadline,
+        refresh: bool = False
+    ) -> Dict[str, Any]:
+        """Ответ из кэша или генерация с объединением одинаковых запросов"""
+        cache_key = None
+        if self._should_cache(data, use_cache):
+            cache_key = self._cache_key(data, data["model"])
+            cached = None if refresh else await self.cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"⚡ OpenRouter: ответ из кэша ({len(cached['content'])} символов)")
+                current_span().set(cached=True)
+                # Токены за повторный ответ не тратятся
+                return {**cached, "usage": {}, "cached": True}
 
-            connector = aiohttp.TCPConnector(ssl=ssl_context)
-            self.session = aiohttp.ClientSession(connector=connector)
+        return await self._single_flight(data, chain, cache_key, deadline)
+
+    async def _single_flight(
+        self,
+        data: Dict[str, Any],
+        chain: List[str],
+        cache_key: Optional[str],
+        deadline: Deadline
+    ) -> Dict[str, Any]:
+        """
+        Объединяет одновременные идентичные запросы в один
+
+        Запрос отменяется, только когда его перестали ждать все вызывающие.
+        Каждый вызывающий ждёт не дольше своего дедлайна.
+        """
+        key = make_cache_key(chain, data)
+        flight = self._inflight.get(key)
+
+        if flight is None:
+            flight = _InFlight(asyncio.create_task(self._generate_and_store(data, chain, cache_key, deadline)))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(
+                lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is flight else None
+            )
+            is_leader = True
+        else:
+            logger.info("🔗 OpenRouter: идентичный запрос уже выполняется, жду его результат")
+            current_span().set(coalesced=True)
+            is_leader = False
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(flight.task), timeout=deadline.remaining())
+        except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+            flight.waiters -= 1
+            if flight.waiters == 0:
+                flight.task.cancel()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return self._deadline_result()
+
+        flight.waiters -= 1
+
+        if is_leader:
+            return result
+        # Токены потрачены один раз — у присоединившихся usage пустой
+        return {**result, "usage": {}, "coalesced": True}
+
+    async def _generate_and_store(
+        self,
+        data: Dict[str, Any],
+        chain: List[str],
+        cache_key: Optional[str],
+        deadline: Deadline
+    ) -> Dict[str, Any]:
+        """Генерация по цепочке моделей с сохранением успешного ответа в кэш"""
+        result = await self._generate_with_fallback(data, chain, deadline)
+
+        if cache_key and result["success"]:
+            # Ответ запасной модели — под её ключом, а не под ключом основной
+            if result.get("fallback"):
+                cache_key = self._cache_key(data, result["fallback"])
+            await self.cache.set(cache_key, result)
+
+        return result
+
+    @staticmethod
+    def _cache_key(data: Dict[str, Any], model: str) -> str:
+        """Ключ ответа: модель + всё, что меняет ответ (в том числе структура ответа)"""
+        return make_cache_key(
+            model, data["messages"], data["temperature"], data["max_tokens"], data.get("response_format")
+        )
+
+    def _should_cache(self, data: Dict[str, Any], use_cache: Optional[bool]) -> bool:
+        """Можно ли отдать/положить ответ в кэш"""
+        if self.cache is None or use_cache is False:
+            return False
+        if use_cache:
+            return True
+        return data["temperature"] <= config.LLM_CACHE_MAX_TEMPERATURE
+
+    def _hedge_delay(self, model: str) -> float:
+        """Сколько ждать первого байта модели перед хедж-запросом"""
+        tracker = self._ttfb.get(model)
+        if tracker is None or len(tracker) < config.OPENROUTER_HEDGE_MIN_SAMPLES:
+            return config.OPENROUTER_HEDGE_DELAY
+        return tracker.percentile(config.OPENROUTER_HEDGE_PERCENTILE)
+
+    def _record_ttfb(self, model: str, seconds: float):
+        if model not in self._ttfb:
+            self._ttfb[model] = LatencyTracker()
+        self._ttfb[model].record(seconds)
+
+    async def _generate_with_fallback(
+        self,
+        data: Dict[str, Any],
+        chain: List[str],
+        deadline: Deadline
+    ) -> Dict[str, Any]:
+        """
+        Перебирает модели цепочки: хедж при медленном первом байте,
+        fallback при сбое. Проигравшие запросы отменяются.
+        """
+        if len(chain) == 1:
+            return await self._request_with_retry(data, deadline)
+
+        tasks: Dict[asyncio.Task, str] = {}
+        first_byte = asyncio.Event()
+        next_index = 0
+        last_result = None
+
+        def launch():
+            nonlocal next_index
+            model = chain[next_index]
+            next_index += 1
+            task = asyncio.create_task(
+                self._request_with_retry({**data, "model": model}, deadline, first_byte=first_byte)
+            )
+            tasks[task] = model
+
+        launch()
+
+        try:
+            while tasks:
+                waiters = set(tasks)
+                timeout = None
+                first_byte_waiter = None
+
+                # Хеджируем, пока единственный запрос молчит
+                if self.hedging and len(tasks) == 1 and next_index < len(chain) and not first_byte.is_set():
+                    timeout = self._hedge_delay(next(iter(tasks.values())))
+                    first_byte_waiter = asyncio.create_task(first_byte.wait())
+                    waiters.add(first_byte_waiter)
+
+                done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if first_byte_waiter:
+                    first_byte_waiter.cancel()
+
+                if not done:
+                    logger.info(
+                        f"🏁 OpenRouter: {next(iter(tasks.values()))} молчит дольше {timeout:.1f}s, "
+                        f"хедж-запрос к {chain[next_index]}"
+                    )
+                    current_span().set(hedged_to=chain[next_index])
+                    launch()
+                    continue
+
+                for task in done & set(tasks):
+                    model = tasks.pop(task)
+                    result = task.result()
+
+                    if result["success"]:
+                        if model != chain[0]:
+                            logger.info(f"🏁 OpenRouter: ответ получен от {model}")
+                            # Модель цепочки, ответившая вместо основной (ключ кэша)
+                            result = {**result, "fallback": model}
+                        return result
+
+                    last_result = result
+                    logger.warning(f"⚠️ OpenRouter: {model} не ответила ({result['error'][:100]})")
+
+                # Все запущенные упали — переходим к следующей модели, если есть время
+                if not tasks and next_index < len(chain) and not deadline.expired:
+                    launch()
+
+            return last_result
+
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _request_with_retry(
+        self,
+        data: Dict[str, Any],
+        deadline: Deadline,
+        first_byte: Optional[asyncio.Event] = None
+    ) -> Dict[str, Any]:
+        """Запрос с повторами временных сбоев и circuit breaker модели (в пределах дедлайна)"""
+        breaker = self._breaker(data["model"])
+        attempts = self.retry_policy.max_attempts
+
+        for attempt in range(1, attempts + 1):
+            if not breaker.allow_request():
+                return self._circuit_open_result(breaker)
+            probe = breaker.is_probing
+
+            try:
+                result = await self._request(data, deadline, first_byte)
+            except asyncio.CancelledError:
+                # Проигравший хедж или снятый этап: исхода нет — не сбой, но пробу освобождаем
+                if probe:
+                    breaker.release_probe()
+                raise
+            self._record_outcome(breaker, result, probe)
+
+            if result["success"] or not self.retry_policy.is_retryable(result) or attempt == attempts:
+                return result
+
+            delay = self.retry_policy.backoff(attempt, result.get("retry_after"))
+            if delay >= deadline.remaining():
+                logger.warning(f"⏱ OpenRouter: на повтор не осталось времени ({deadline.remaining():.1f}s)")
+                return result
+
+            logger.warning(
+                f"🔁 OpenRouter: попытка {attempt}/{attempts} не удалась "
+                f"({result['error'][:100]}), повтор через {delay:.1f}s"
+            )
+            with span("retry_backoff", attempt=attempt, delay=round(delay, 3)):
+                await asyncio.sleep(delay)
+
+        return result
+
+    async def _request(
+        self,
+        data: Dict[str, Any],
+        deadline: Deadline,
+        first_byte: Optional[asyncio.Event] = None
+    ) -> Dict[str, Any]:
+        """
+        Один HTTP-запрос к /chat/completions (через лимитер модели)
+
+        Args:
+            data: Тело запроса
+            deadline: Срок, включая ожидание слота лимитера
+            first_byte: Событие, выставляемое при получении заголовков ответа
         
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/annyandr/ai-tg-content",
-        }
+        Спан openrouter.request: queue_wait (слот лимитера), http.* (см.
+        http_trace_config), http.body_read и json.parse.
+        """
+        with span("openrouter.request", model=data["model"]) as request_span:
+            result = await self._send(data, deadline, first_byte, request_span)
+            if not result["success"]:
+                request_span.fail(result["error"])
+            return result
+
+    async def _send(
+        self,
+        data: Dict[str, Any],
+        deadline: Deadline,
+        first_byte: Optional[asyncio.Event],
+        request_span: Span
+    ) -> Dict[str, Any]:
+        session = await self._get_session()
         
-        data = {
-            "model": model or config.DEFAULT_MODEL,
-            "messages": messages,
-            "temperature": temperature or config.TEMPERATURE,
-            "max_tokens": max_tokens or config.MAX_TOKENS
-        }
+        try:
+            queued_ns = time.time_ns()
+            async with asyncio.timeout(deadline.remaining()), self.limiter.slot(data["model"]) as permit:
+                request_span.record("queue_wait", queued_ns)
+                sent_at = time.monotonic()
+                async with session.post(
+                    f"{self.base_url}/chat/completions",
+                    json=self._payload_for_model(data),
+                    timeout=self._client_timeout(deadline),
+                    trace_request_ctx={"span": request_span}
+                ) as response:
+                    self._record_ttfb(data["model"], time.monotonic() - sent_at)
+                    if first_byte:
+                        first_byte.set()
+
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                    permit.report(response.status, retry_after)
+                    request_span.set(status=response.status)
+
+                    if response.status == 200:
+                        read_ns = time.time_ns()
+                        body = await response.read()
+                        request_span.record("http.body_read", read_ns, bytes=len(body))
+                        with request_span.child("json.parse"):
+                            result = json.loads(body)
+                        content = result["choices"][0]["message"]["content"]
+
+                        logger.info(f"✅ OpenRouter: успешная генерация ({len(content)} символов)")
+                        usage = result.get("usage") or {}
+                        self._log_prompt_cache(data["model"], usage)
+
+                        return {
+                            "success": True,
+                            "content": content,
+                            "model": result.get("model", data["model"]),
+                            "usage": usage
+                        }
+                    else:
+                        error_text = await response.text()
+                        return self._error_result(response.status, error_text, retry_after)
+        
+        except Exception as e:
+            if deadline.expired:
+                logger.error(f"⏱ OpenRouter {data['model']}: дедлайн истёк ({type(e).__name__})")
+                return self._deadline_result()
+            return self._exception_result(e)
+    
+    async def close(self):
+        """Закрытие сессии и всех соединений пула"""
+        if self.is_started:
+            await self.session.close()
+            logger.info("🔌 OpenRouter: пул соединений закрыт")
+        self.session = None
+
+
+class _InFlight:
+    """Выполняющийся запрос и число ожидающих его вызывающих"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class CompletionStream:
+    """
+    Потоковая генерация OpenRouter (Server-Sent Events)
+
+    Асинхронный итератор по фрагментам текста по мере их прихода.
+    После завершения итерации доступны content, usage и to_result()
+    в том же формате, что и у OpenRouterService.generate().
+
+    Если модель упала до первого фрагмента, поток переключается на
+    следующую модель из fallback_models.
+
+    Пример:
+        stream = await openrouter.generate(messages, stream=True)
+        async for delta in stream:
+            print(delta, end="")
+        result = stream.to_result()
+    """
+
+    def __init__(
+        self,
+        service: OpenRouterService,
+        data: Dict[str, Any],
+        fallback_models: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None,
+        span: Span = NULL_SPAN
+    ):
+        """
+        Args:
+            service: Сервис OpenRouter, чья сессия используется
+            data: Тело запроса Chat Completions
+            fallback_models: Запасные модели по порядку
+            metadata: Агент и специализация для журнала токенов
+            deadline: Срок всего потока (по умолчанию OPENROUTER_TIMEOUT)
+            span: Спан вызова; закрывается, когда поток дочитан или прерван
         
+        Внутри генераторов спаны не активируются (контекст потребителя
+        сохраняется между фрагментами), поэтому этапы попыток пишутся
+        дочерними к span явно.
+        """
+        self._service = service
+        self._data = {**data, "stream": True}
+        self._chain = [data["model"], *(fallback_models or [])]
+        self.model = data["model"]
+        self.content = ""
+        self.usage: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.finished = False
+        self._failure: Optional[Dict[str, Any]] = None
+        self._metadata = metadata or {}
+        self._deadline = deadline or Deadline(config.OPENROUTER_TIMEOUT)
+        self._span = span
+        # Спаны вызывающих (agent.generate): закрываются после span
+        self._outer_spans: List[Span] = []
+
+    @classmethod
+    def failed(cls, service: OpenRouterService, result: Dict[str, Any]) -> "CompletionStream":
+        """Поток, который не отдаст ни одного фрагмента (запрос отклонён заранее)"""
+        stream = cls(service, {"model": None})
+        stream._chain = []
+        stream._fail(result)
+        return stream
+
+    def end_with(self, outer: Span):
+        """Закрыть спан вызывающего вместе с потоком (сразу, если поток уже отклонён)"""
+        if self._chain:
+            self._outer_spans.append(outer)
+        else:
+            outer.end()
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        """Перебор моделей с записью итогового вызова в журнал токенов"""
+        started_at = time.monotonic()
         try:
-            async with self.session.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=aiohttp.ClientTimeout(total=60)
-            ) as response:
+            async with aclosing(self._iterate_chain()) as chain_stream:
+                async for delta in chain_stream:
+                    yield delta
+        finally:
+            if self._chain:
+                result = self.to_result()
+                self._service._trace_result(self._span, result)
+                self._span.end()
+                for outer in self._outer_spans:
+                    outer.end()
+                self._service._record_usage(result, self.model, started_at, self._metadata)
+
+    async def _iterate_chain(self):
+        """
+        Читает SSE-поток и отдаёт фрагменты текста
+
+        Временные сбои повторяются (и модели переключаются), только пока
+        не отдано ни одного фрагмента: начатый черновик незаметно
+        перезапустить нельзя.
+        """
+        for model in self._chain:
+            if model != self._chain[0]:
+                logger.warning(f"⚠️ OpenRouter stream: {self.model} не ответила ({self.error[:100]}), переключаюсь на {model}")
+
+            self.model = model
+            self._data["model"] = model
+
+            async with aclosing(self._iterate_model()) as model_stream:
+                async for delta in model_stream:
+                    yield delta
+
+            if self._failure is None or self.content or self._deadline.expired:
+                return
+
+    async def _iterate_model(self):
+        """Попытки потоковой генерации на текущей модели"""
+        breaker = self._service._breaker(self.model)
+        policy = self._service.retry_policy
+
+        for attempt in range(1, policy.max_attempts + 1):
+            if not breaker.allow_request():
+                self._fail(self._service._circuit_open_result(breaker))
+                return
+            probe = breaker.is_probing
+
+            self._failure = None
+            self.error = None
 
-                if response.status == 200:
-                    result = await response.json()
-                    content = result["choices"][0]["message"]["content"]
+            # aclosing: при досрочном выходе потребителя сразу освобождаем соединение и слот
+            recorded = False
+            try:
+                async with aclosing(self._attempt()) as attempt_stream:
+                    async for delta in attempt_stream:
+                        yield delta
 
-                    logger.info(f"✅ OpenRouter: успешная генерация ({len(content)} символов)")
+                self._service._record_outcome(breaker, self._failure or {"success": True}, probe)
+                recorded = True
+            finally:
+                # Поток закрыт потребителем или отменён до исхода попытки
+                if probe and not recorded:
+                    breaker.release_probe()
 
-                    return {
-                        "success": True,
-                        "content": content,
-                        "model": data["model"],
-                        "usage": result.get("usage", {})
-                    }
-                else:
+            if self._failure is None or self.content or not policy.is_retryable(self._failure):
+                return
+            if attempt == policy.max_attempts:
+                return
+
+            delay = policy.backoff(attempt, self._failure.get("retry_after"))
+            if delay >= self._deadline.remaining():
+                logger.warning(f"⏱ OpenRouter stream: на повтор не осталось времени ({self._deadline.remaining():.1f}s)")
+                return
+
+            logger.warning(
+                f"🔁 OpenRouter stream: попытка {attempt}/{policy.max_attempts} не удалась "
+                f"({self.error[:100]}), повтор через {delay:.1f}s"
+            )
+            backoff_ns = time.time_ns()
+            await asyncio.sleep(delay)
+            self._span.record("retry_backoff", backoff_ns, attempt=attempt, delay=round(delay, 3))
+
+    def _fail(self, result: Dict[str, Any]):
+        self._failure = result
+        self.error = result["error"]
+
+    async def _attempt(self):
+        """Одна попытка потокового запроса"""
+        attempt_span = self._span.child("openrouter.stream_attempt", model=self.model)
+        try:
+            async with aclosing(self._attempt_traced(attempt_span)) as attempt_stream:
+                async for delta in attempt_stream:
+                    yield delta
+        finally:
+            if self.error:
+                attempt_span.fail(self.error)
+            attempt_span.end()
+
+    async def _attempt_traced(self, attempt_span: Span):
+        """
+        Попытка с этапами: queue_wait, http.* (см. http_trace_config),
+        model.first_token — от заголовков до первого фрагмента текста,
+        http.body_read — чтение потока (parse_ms — из него разбор JSON)
+        """
+        session = await self._service._get_session()
+
+        if self._deadline.expired:
+            self._fail(self._service._deadline_result())
+            return
+
+        queued_ns, queued_at = time.time_ns(), time.monotonic()
+        read_ns = None
+        parse_ns = 0
+        chunks = 0
+
+        try:
+            async with AsyncExitStack() as stack:
+                # Ожидание слота лимитера укладывается в дедлайн (как в OpenRouterService._send);
+                # таймаут запроса — из того, что осталось после получения слота
+                async with asyncio.timeout(self._deadline.remaining()):
+                    permit = await stack.enter_async_context(self._service.limiter.slot(self.model))
+                response = await stack.enter_async_context(session.post(
+                    f"{self._service.base_url}/chat/completions",
+                    json=self._service._payload_for_model(self._data),
+                    timeout=self._service._client_timeout(self._deadline),
+                    trace_request_ctx={"span": attempt_span}
+                ))
+
+                # Слот выдан в момент permit.started_at, ещё до отправки запроса
+                attempt_span.record("queue_wait", queued_ns, queued_ns + int((permit.started_at - queued_at) * 1e9))
+                self._service._record_ttfb(self.model, time.monotonic() - permit.started_at)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                permit.report(response.status, retry_after)
+                attempt_span.set(status=response.status)
+
+                if response.status != 200:
                     error_text = await response.text()
+                    self._fail(self._service._error_result(response.status, error_text, retry_after))
+                    return
 
-                    # Проверяем, не HTML ли это (блокировка firewall)
-                    if '<!DOCTYPE' in error_text or '<html' in error_text:
-                        logger.error(f"❌ Доступ заблокирован корпоративным firewall")
-                        return {
+                read_ns = time.time_ns()
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+
+                    # Пустые строки разделяют события, ":" — keep-alive комментарии OpenRouter
+                    if not line or line.startswith(":") or not line.startswith("data:"):
+                        continue
+
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        break
+
+                    parse_started_ns = time.time_ns()
+                    chunk = json.loads(payload)
+                    parse_ns += time.time_ns() - parse_started_ns
+                    chunks += 1
+
+                    if chunk.get("error"):
+                        message = chunk["error"].get("message", str(chunk["error"]))
+                        code = chunk["error"].get("code")
+                        logger.error(f"❌ OpenRouter stream error: {message}")
+                        self._fail({
                             "success": False,
                             "content": None,
-                            "error": "API заблокирован. Попробуйте с другой машины или используйте VPN"
-                        }
+                            "error": message,
+                            "status": code if isinstance(code, int) else None
+                        })
+                        break
 
-                    logger.error(f"❌ OpenRouter error {response.status}: {error_text[:200]}")
+                    if chunk.get("usage"):
+                        self.usage = chunk["usage"]
 
-                    return {
-                        "success": False,
-                        "content": None,
-                        "error": f"API error {response.status}: {error_text[:200]}"
-                    }
-        
-        except Exception as e:
-            logger.error(f"❌ OpenRouter exception: {e}")
+                    choices = chunk.get("choices") or []
+                    delta = choices[0].get("delta", {}).get("content") if choices else None
+
+                    if delta:
+                        if not self.content:
+                            attempt_span.record("model.first_token", read_ns)
+                        self.content += delta
+                        yield delta
+
+                # Поток дочитан до конца (а не прерван потребителем)
+                self.finished = True
+
+            if not self.error:
+                logger.info(f"✅ OpenRouter: потоковая генерация завершена ({len(self.content)} символов)")
+                self._service._log_prompt_cache(self.model, self.usage)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+            if self._deadline.expired:
+                logger.error(f"⏱ OpenRouter stream {self.model}: дедлайн истёк ({type(e).__name__})")
+                self._fail(self._service._deadline_result())
+            else:
+                self._fail(self._service._exception_result(e))
+
+        finally:
+            if read_ns is not None:
+                attempt_span.record("http.body_read", read_ns, chunks=chunks, parse_ms=round(parse_ns / 1e6, 3))
+
+    async def collect(self) -> Dict[str, Any]:
+        """Дочитывает поток до конца и возвращает итоговый результат"""
+        async for _ in self:
+            pass
+        return self.to_result()
+
+    def to_result(self) -> Dict[str, Any]:
+        """Результат в формате OpenRouterService.generate()"""
+        if self._failure:
+            return self._failure
+
+        if not self.finished:
             return {
                 "success": False,
                 "content": None,
-                "error": str(e)
+                "error": "Поток генерации не завершён"
             }
-    
-    async def close(self):
-        """Закрытие сессии"""
-        if self.session:
-            await self.session.close()
+
+        return {
+            "success": True,
+            "content": self.content,
+            "model": self.model,
+            "usage": self.usage
+        }
 
 
-__all__ = ["OpenRouterService"]
+__all__ = ["OpenRouterService", "CompletionStream", "build_messages", "json_schema_format"]
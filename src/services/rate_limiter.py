@@ -0,0 +1,284 @@
+"""
+Ограничение частоты и параллельности запросов к OpenRouter
+
+- TokenBucket — не больше N запросов в секунду (с запасом на всплеск)
+- AdaptiveConcurrencyLimiter — окно одновременных запросов по AIMD:
+  растёт на +1 за "круг" успешных ответов, сжимается вдвое при 429/5xx/таймаутах
+- ModelRateLimiter — пара лимитеров на каждую модель
+"""
+
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from src.core.logger import logger
+from src.core.config import config
+
+
+# HTTP-статусы, означающие перегрузку провайдера
+OVERLOAD_STATUSES = {429, 500, 502, 503, 504, 529}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Разбирает заголовок Retry-After
+
+    Args:
+        value: Число секунд или HTTP-дата
+
+    Returns:
+        Пауза в секундах или None
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше burst про запас"""
+
+    def __init__(self, rate: float, burst: int):
+        """
+        Args:
+            rate: Запросов в секунду
+            burst: Ёмкость корзины
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """Дождаться токена (ожидающие обслуживаются по очереди)"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Не выдавать токены seconds секунд (ответ 429 / Retry-After)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Окно одновременных запросов с AIMD-регулировкой
+
+    - Успех быстрее target_latency: limit += 1 / limit
+    - Успех медленнее target_latency: limit *= 0.9
+    - Перегрузка (429, 5xx, таймаут): limit *= 0.5
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        target_latency: float
+    ):
+        """
+        Args:
+            initial: Стартовое окно
+            min_limit: Нижняя граница окна
+            max_limit: Верхняя граница окна
+            target_latency: Латентность, выше которой окно сжимается, сек
+        """
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        """Дождаться свободного места в окне"""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, overloaded: bool):
+        """
+        Освободить место и скорректировать окно
+
+        Args:
+            latency: Длительность запроса, сек
+            overloaded: Провайдер сигнализировал о перегрузке
+        """
+        async with self._cond:
+            self.in_flight -= 1
+
+            if overloaded:
+                self.limit = max(self.min_limit, self.limit * 0.5)
+            elif latency > self.target_latency:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self._cond.notify_all()
+
+    async def abandon(self):
+        """Освободить место, не меняя окно: запрос отменён, исход неизвестен"""
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+
+class RatePermit:
+    """Разрешение на один запрос; вызывающий код сообщает итог через report()"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.status: Optional[int] = None
+        self.retry_after: Optional[float] = None
+        self.failed = False
+
+    def report(self, status: int, retry_after: Optional[float] = None):
+        """
+        Args:
+            status: HTTP-статус ответа
+            retry_after: Значение Retry-After, сек
+        """
+        self.status = status
+        self.retry_after = retry_after
+
+
+class ModelRateLimiter:
+    """Лимиты частоты и параллельности отдельно для каждой модели"""
+
+    def __init__(
+        self,
+        rps: float = None,
+        burst: int = None,
+        initial_concurrency: int = None,
+        min_concurrency: int = None,
+        max_concurrency: int = None,
+        target_latency: float = None
+    ):
+        """
+        Args:
+            rps: Запросов в секунду на модель
+            burst: Допустимый всплеск
+            initial_concurrency: Стартовое окно параллельных запросов
+            min_concurrency: Минимальное окно
+            max_concurrency: Максимальное окно
+            target_latency: Целевая латентность, сек
+        """
+        self.rps = rps or config.OPENROUTER_RPS
+        self.burst = burst or config.OPENROUTER_BURST
+        self.initial_concurrency = initial_concurrency or config.OPENROUTER_INITIAL_CONCURRENCY
+        self.min_concurrency = min_concurrency or config.OPENROUTER_MIN_CONCURRENCY
+        self.max_concurrency = max_concurrency or config.OPENROUTER_MAX_CONCURRENCY
+        self.target_latency = target_latency or config.OPENROUTER_TARGET_LATENCY
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._windows: Dict[str, AdaptiveConcurrencyLimiter] = {}
+
+    def _get(self, model: str):
+        if model not in self._buckets:
+            self._buckets[model] = TokenBucket(self.rps, self.burst)
+            self._windows[model] = AdaptiveConcurrencyLimiter(
+                initial=self.initial_concurrency,
+                min_limit=self.min_concurrency,
+                max_limit=self.max_concurrency,
+                target_latency=self.target_latency
+            )
+        return self._buckets[model], self._windows[model]
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        """
+        Занять слот для запроса к модели
+
+        Пример:
+            async with limiter.slot(model) as permit:
+                ...
+                permit.report(response.status, retry_after)
+        """
+        bucket, window = self._get(model)
+
+        queued_at = time.monotonic()
+        await window.acquire()
+        try:
+            await bucket.acquire()
+        except BaseException:
+            # Запроса не было — это не успех с нулевой латентностью
+            await window.abandon()
+            raise
+
+        waited = time.monotonic() - queued_at
+        if waited > 1:
+            logger.info(f"🚦 OpenRouter {model}: ожидание слота {waited:.1f}s")
+
+        permit = RatePermit()
+        cancelled = False
+
+        try:
+            yield permit
+        except (asyncio.TimeoutError, TimeoutError):
+            permit.failed = True
+            raise
+        except asyncio.CancelledError:
+            # Проигравший хедж, истёкший дедлайн, снятый этап: ответа нет —
+            # окно не растёт и не сжимается (если статус уже получен, он учитывается)
+            cancelled = permit.status is None
+            raise
+        finally:
+            if cancelled:
+                await window.abandon()
+            else:
+                overloaded = permit.failed or permit.status in OVERLOAD_STATUSES
+
+                if permit.status == 429:
+                    pause = permit.retry_after if permit.retry_after is not None else 1 / self.rps
+                    bucket.pause(pause)
+                    logger.warning(f"🚦 OpenRouter {model}: 429, пауза {pause:.1f}s, окно {window.limit:.1f} → {max(window.min_limit, window.limit * 0.5):.1f}")
+
+                await window.release(time.monotonic() - permit.started_at, overloaded)
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Текущее окно и число запросов в полёте по моделям"""
+        return {
+            model: {"limit": round(window.limit, 2), "in_flight": window.in_flight}
+            for model, window in self._windows.items()
+        }
+
+
+__all__ = [
+    "TokenBucket",
+    "AdaptiveConcurrencyLimiter",
+    "ModelRateLimiter",
+    "RatePermit",
+    "parse_retry_after",
+    "OVERLOAD_STATUSES"
+]
@@ -0,0 +1,237 @@
+"""
+Повторы с backoff, circuit breaker и замеры латентности для вызовов OpenRouter
+"""
+
+import time
+import random
+from collections import deque
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from src.core.logger import logger
+from src.core.config import config
+
+
+# Временные ошибки провайдера — имеет смысл повторить
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504, 529}
+
+
+class RetryPolicy:
+    """
+    Политика повторов: экспоненциальный backoff с полным jitter
+
+    Повторяются только временные сбои (таймауты, обрывы соединения,
+    429 и 5xx). Ошибки 4xx (кроме 408/429) считаются фатальными.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = None,
+        base_delay: float = None,
+        max_delay: float = None
+    ):
+        """
+        Args:
+            max_attempts: Всего попыток (включая первую)
+            base_delay: Базовая задержка, сек
+            max_delay: Потолок задержки, сек
+        """
+        self.max_attempts = max_attempts or config.OPENROUTER_RETRY_ATTEMPTS
+        self.base_delay = base_delay if base_delay is not None else config.OPENROUTER_RETRY_BASE_DELAY
+        self.max_delay = max_delay or config.OPENROUTER_RETRY_MAX_DELAY
+
+    @staticmethod
+    def is_retryable(result: Dict[str, Any]) -> bool:
+        """Временная ли ошибка в результате {"success": False, ...}"""
+        if result.get("retryable"):
+            return True
+        return result.get("status") in RETRYABLE_STATUSES
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Задержка перед следующей попыткой
+
+        Args:
+            attempt: Номер неудавшейся попытки (с 1)
+            retry_after: Пауза, которую попросил провайдер (Retry-After)
+
+        Returns:
+            Задержка в секундах
+        """
+        ceiling = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        delay = random.uniform(0, ceiling)
+
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        return delay
+
+
+class CircuitState(str, Enum):
+    """Состояния circuit breaker"""
+    CLOSED = "closed"        # Запросы идут как обычно
+    OPEN = "open"            # Провайдер лежит — сразу отказываем
+    HALF_OPEN = "half_open"  # Пробный запрос после паузы
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для одной модели
+
+    После failure_threshold сбоев подряд размыкается на recovery_timeout
+    секунд: запросы сразу получают отказ, не дожидаясь таймаута. Затем
+    пропускает один пробный запрос — успех замыкает цепь, сбой снова
+    размыкает.
+
+    Пробный запрос, отменённый без результата (проигравший хедж, досрочно
+    закрытый поток), возвращает право пробы через release_probe(); потерянная
+    проба истекает через probe_timeout — модель не отключается до перезапуска.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = None,
+        recovery_timeout: float = None,
+        probe_timeout: float = None
+    ):
+        """
+        Args:
+            name: Имя (модель) для логов
+            failure_threshold: Сбоев подряд до размыкания
+            recovery_timeout: Пауза до пробного запроса, сек
+            probe_timeout: Через сколько секунд проба без результата считается
+                потерянной (по умолчанию OPENROUTER_TIMEOUT — бюджет одного вызова)
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold or config.OPENROUTER_BREAKER_THRESHOLD
+        self.recovery_timeout = recovery_timeout or config.OPENROUTER_BREAKER_RECOVERY
+        self.probe_timeout = probe_timeout or config.OPENROUTER_TIMEOUT
+
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+
+    def retry_in(self) -> float:
+        """Через сколько секунд breaker пропустит пробный запрос"""
+        return max(0.0, self._opened_at + self.recovery_timeout - time.monotonic())
+
+    def allow_request(self) -> bool:
+        """Можно ли отправить запрос сейчас"""
+        if self.state == CircuitState.CLOSED:
+            return True
+
+        if self.state == CircuitState.OPEN:
+            if self.retry_in() > 0:
+                return False
+            self.state = CircuitState.HALF_OPEN
+            logger.info(f"🔌 Circuit {self.name}: пробный запрос")
+
+        # HALF_OPEN: пропускаем только один пробный запрос
+        if self._probe_in_flight:
+            if time.monotonic() - self._probe_started_at < self.probe_timeout:
+                return False
+            logger.warning(f"🔌 Circuit {self.name}: пробный запрос потерян, пропускаю новый")
+        self._probe_in_flight = True
+        self._probe_started_at = time.monotonic()
+        return True
+
+    @property
+    def is_probing(self) -> bool:
+        """Выдана ли проба: запрос, которому allow_request() только что ответил True, — пробный"""
+        return self.state == CircuitState.HALF_OPEN and self._probe_in_flight
+
+    def release_probe(self):
+        """Пробный запрос отменён, не дав результата: следующий запрос станет пробным"""
+        if self._probe_in_flight:
+            self._probe_in_flight = False
+            logger.info(f"🔌 Circuit {self.name}: пробный запрос отменён")
+
+    def record_success(self):
+        """Провайдер ответил (в том числе 4xx — он жив)"""
+        if self.state != CircuitState.CLOSED:
+            logger.info(f"✅ Circuit {self.name}: провайдер снова доступен")
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        """Сбой провайдера: 5xx, таймаут или обрыв соединения"""
+        self.failures += 1
+        self._probe_in_flight = False
+
+        if self.state == CircuitState.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != CircuitState.OPEN:
+                logger.error(
+                    f"🔌 Circuit {self.name}: разомкнут после {self.failures} сбоев, "
+                    f"пауза {self.recovery_timeout:.0f}s"
+                )
+            self.state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние для мониторинга"""
+        return {
+            "state": self.state.value,
+            "failures": self.failures,
+            "retry_in": round(self.retry_in(), 1) if self.state == CircuitState.OPEN else 0
+        }
+
+
+class LatencyTracker:
+    """Скользящее окно замеров латентности (например, TTFB модели)"""
+
+    def __init__(self, window: int = 200):
+        """
+        Args:
+            window: Сколько последних замеров хранить
+        """
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        """Добавить замер"""
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Перцентиль по окну
+
+        Args:
+            q: Доля от 0 до 1 (0.95 — p95)
+
+        Returns:
+            Значение в секундах или None, если замеров нет
+        """
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def is_provider_failure(result: Dict[str, Any]) -> bool:
+    """
+    Считается ли неудачный результат сбоем провайдера (для breaker)
+
+    429 — провайдер жив, просто ограничивает нас; 4xx — ошибка запроса.
+    """
+    if result.get("success"):
+        return False
+    if result.get("retryable"):
+        return True
+    status = result.get("status")
+    return status is not None and status >= 500
+
+
+__all__ = [
+    "RetryPolicy",
+    "CircuitBreaker",
+    "CircuitState",
+    "LatencyTracker",
+    "RETRYABLE_STATUSES",
+    "is_provider_failure"
+]
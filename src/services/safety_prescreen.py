@@ -0,0 +1,191 @@
+"""
+Локальный предскрининг медицинской безопасности перед SafetyAgent
+
+Один скомпилированный регэксп (альтернатива именованных групп) за один
+проход находит дозировки, абсолютные обещания, опасные советы и стоп-фразы
+PostValidator. Явные нарушения отклоняются без запроса к LLM, а по оценке
+риска SafetyAgent выбирает полный или короткий промпт. Обещания и опасные
+советы в предложении с отрицанием или ссылкой на врача не отклоняются —
+они только поднимают риск.
+"""
+
+import re
+from typing import Any, Dict, List, NamedTuple
+
+from src.services.validator import FORBIDDEN_WORDS
+
+
+class Rule(NamedTuple):
+    """Правило предскрининга: тип и severity — как в ответе SafetyAgent"""
+    type: str
+    severity: str
+    weight: float
+    pattern: str
+    description: str
+    recommendation: str
+    # Совпадение в предложении с отрицанием или чужой речью — только риск, без отказа
+    guarded: bool = False
+
+
+# Голое «г» после четырёхзначного года — «2024 г.», а не граммы
+_DOSE = (
+    r"(?<![\d.,])(?:\d+(?:[.,]\d+)?\s*(?:мг|мкг|мл|ед|ме|таблет\w*|капсул\w*|капел\w*)"
+    r"|(?!(?:1[89]|20)\d\d\s*г)\d+(?:[.,]\d+)?\s*г)(?!\w)"
+)
+
+# (?<!не\s): «не принимайте 2 таблетки…» — предостережение, а не назначение
+RULES: List[Rule] = [
+    Rule(
+        "direct_prescription", "critical", 1.0,
+        r"(?<!не\s)\b(?:принимайте|примите|пейте|выпейте|колите|уколите|назначьте\s+себе|используйте)\s+(?:\S+\s+){0,4}?" + _DOSE,
+        "Прямое назначение препарата с дозировкой",
+        "Заменить на: «по показаниям врач может назначить…»"
+    ),
+    Rule(
+        "false_promise", "critical", 1.0,
+        r"\b(?:гарантированн\w*|гарантирует)\s+(?:\S+\s+){0,2}?(?:излеч|вылеч|выздоров|избав)\w*"
+        r"|\bнавсегда\s+(?:излеч|вылеч|избав)\w*"
+        r"|\b(?:полностью|навсегда)\s+избавит\w*"
+        r"|\b100\s?%\s*(?:эффективн|излеч|вылеч|результат)\w*",
+        "Абсолютное обещание результата лечения",
+        "Убрать обещания, указать эффективность по данным исследований",
+        guarded=True
+    ),
+    Rule(
+        "dangerous_advice", "critical", 1.0,
+        r"\bможно\s+не\s+обращаться\s+к\s+врачу|\bможете\s+не\s+обращаться\s+к\s+врачу"
+        r"|(?<!не\s)\b(?:прекратите|бросьте|отмените)\s+(?:\S+\s+){0,1}?(?:лечени|при[её]м|принима|терапи)\w*"
+        r"|(?<!не\s)\bзамените\s+(?:\S+\s+){0,1}?(?:препарат|лекарств)\w*",
+        "Опасный совет: отказ от лечения или врача",
+        "Убрать совет, добавить «решение принимает лечащий врач»",
+        guarded=True
+    ),
+    Rule(
+        "dosage", "high", 0.4,
+        _DOSE + r"\s*(?:\S+\s+){0,3}?(?:раз\w*\s+в\s+(?:день|сутки|неделю)|в\s+сутки|ежедневно|на\s+ночь|утром|вечером)",
+        "Схема приёма с дозировкой",
+        "Указать, что дозировку определяет врач, или убрать схему"
+    ),
+    Rule(
+        "forbidden_phrase", "critical", 1.0,
+        "|".join(re.escape(word) for word in FORBIDDEN_WORDS),
+        "Стоп-фраза",
+        "Убрать фразу"
+    ),
+]
+
+# Рецептурные препараты и группы: упоминание без оговорки про врача — риск
+RX_PATTERN = re.compile(
+    r"\b(?:антибиотик|гормональн|кортикостероид|глюкокортикоид|антидепрессант|транквилизатор|опиоид"
+    r"|инсулин|метформин|амоксициллин|азитромицин|цефтриаксон|преднизолон|дексаметазон|левотироксин"
+    r"|изотретиноин|варфарин|анксиолитик|нейролептик)\w*",
+    re.IGNORECASE
+)
+CAVEAT_PATTERN = re.compile(
+    r"врач|по\s+показаниям|по\s+назначению|консультац|специалист|доктор",
+    re.IGNORECASE
+)
+RX_WITHOUT_CAVEAT = Rule(
+    "missing_disclaimer", "high", 0.3, RX_PATTERN.pattern,
+    "Рецептурный препарат без оговорки про врача",
+    "Добавить «по назначению врача» / «по показаниям»"
+)
+
+# Все правила — одним проходом: (?P<r0>...)|(?P<r1>...)|...
+_COMBINED = re.compile(
+    "|".join(f"(?P<r{i}>{rule.pattern})" for i, rule in enumerate(RULES)),
+    re.IGNORECASE
+)
+
+# Сколько символов вокруг совпадения показывать в location
+_CONTEXT = 30
+
+# Предостережение («ни один препарат не гарантирует излечения», «избавиться
+# нельзя») и чужая речь («врач может сказать: отмените приём») — не обещание
+# и не совет автора; решает LLM
+_GUARD = re.compile(
+    r"\b(?:не|ни|нет|нельзя|невозможно|врач\w*|доктор\w*|специалист\w*|лечащ\w*)\b",
+    re.IGNORECASE
+)
+_SENTENCE_END = re.compile(r"[.!?\n]")
+
+
+def _guarded(content: str, start: int, end: int) -> bool:
+    """Отрицание или ссылка на врача в том же предложении, вне самого совпадения"""
+    sentence_start = max(content.rfind(char, 0, start) for char in ".!?\n") + 1
+    tail = _SENTENCE_END.search(content, end)
+    sentence_end = tail.start() if tail else len(content)
+    return bool(_GUARD.search(content, sentence_start, start) or _GUARD.search(content, end, sentence_end))
+
+
+def _issue(rule: Rule, content: str, start: int, end: int) -> Dict[str, Any]:
+    location = content[max(0, start - _CONTEXT):end + _CONTEXT].strip()
+    return {
+        "type": rule.type,
+        "severity": rule.severity,
+        "description": f"{rule.description} (предскрининг)",
+        "location": location,
+        "recommendation": rule.recommendation
+    }
+
+
+def prescreen(content: str, whole_post: bool = True) -> Dict[str, Any]:
+    """
+    Быстрая локальная проверка текста
+
+    Args:
+        content: Текст поста или фрагмента
+        whole_post: Текст — весь пост. Для фрагмента не проверяется
+            отсутствие оговорок про врача (они могут быть дальше)
+
+    Returns:
+        Dict:
+            - reject: найдено явное (critical) нарушение
+            - risk: оценка риска 0..1 (сумма весов сработавших правил)
+            - issues: проблемы в формате SafetyAgent
+    """
+    issues = []
+    seen_types = set()
+    risk = 0.0
+
+    for match in _COMBINED.finditer(content):
+        rule = RULES[int(match.lastgroup[1:])]
+        if not (rule.guarded and _guarded(content, match.start(), match.end())):
+            issues.append(_issue(rule, content, match.start(), match.end()))
+        # Повторы одного правила риск не увеличивают
+        if rule.type not in seen_types:
+            seen_types.add(rule.type)
+            risk += rule.weight
+
+    if whole_post and not CAVEAT_PATTERN.search(content):
+        rx = RX_PATTERN.search(content)
+        if rx:
+            issues.append(_issue(RX_WITHOUT_CAVEAT, content, rx.start(), rx.end()))
+            risk += RX_WITHOUT_CAVEAT.weight
+
+    return {
+        "reject": any(issue["severity"] == "critical" for issue in issues),
+        "risk": min(1.0, risk),
+        "issues": issues
+    }
+
+
+def rejection_verdict(screen: Dict[str, Any]) -> Dict[str, Any]:
+    """Вердикт в формате SafetyAgent.execute() для отклонённого предскринингом текста"""
+    issues = screen["issues"]
+    statistics = {"total_issues": len(issues)}
+    for level in ("critical", "high", "medium", "low"):
+        statistics[f"{level}_issues"] = sum(1 for i in issues if i["severity"] == level)
+
+    return {
+        "success": True,
+        "is_safe": False,
+        "severity": "critical",
+        "issues": issues,
+        "recommendations": [i["recommendation"] for i in issues if i["severity"] == "critical"],
+        "statistics": statistics,
+        "prescreen": True
+    }
+
+
+__all__ = ["prescreen", "rejection_verdict", "RULES"]
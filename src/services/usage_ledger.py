@@ -0,0 +1,326 @@
+"""
+Учёт токенов, латентности и стоимости вызовов LLM + бюджеты
+"""
+
+import time
+import asyncio
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.logger import logger
+from src.core.config import config
+
+
+# Цены OpenRouter, $ за 1M токенов (prompt, completion).
+# Используются, если провайдер не вернул usage.cost
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "anthropic/claude-3.5-sonnet": (3.0, 15.0),
+    "anthropic/claude-3.5-haiku": (0.8, 4.0),
+    "anthropic/claude-3-haiku": (0.25, 1.25),
+    "openai/gpt-4o": (2.5, 10.0),
+    "openai/gpt-4o-mini": (0.15, 0.6),
+    "google/gemini-2.0-flash-001": (0.1, 0.4),
+}
+
+# Токены промпта из кэша провайдера стоят ~10% обычной цены (Anthropic, Gemini)
+CACHED_PROMPT_PRICE_FACTOR = 0.1
+
+# Решения по бюджету
+BUDGET_OK = "ok"
+BUDGET_DEGRADE = "degrade"
+BUDGET_REFUSE = "refuse"
+
+
+def estimate_cost(model: str, usage: Dict[str, Any]) -> float:
+    """
+    Стоимость вызова в долларах
+
+    Args:
+        model: Модель
+        usage: Блок usage из ответа OpenRouter
+
+    Returns:
+        Стоимость; 0, если цена модели неизвестна
+    """
+    if usage.get("cost") is not None:
+        return float(usage["cost"])
+
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    return (
+        (usage.get("prompt_tokens", 0) - cached_tokens) * prompt_price
+        + cached_tokens * prompt_price * CACHED_PROMPT_PRICE_FACTOR
+        + usage.get("completion_tokens", 0) * completion_price
+    ) / 1_000_000
+
+
+class UsageLedger:
+    """
+    Журнал вызовов LLM в SQLite
+
+    Записи копятся в памяти и пишутся пачками (раз в flush_interval
+    секунд или по batch_size записей). Траты за день/месяц держатся
+    в памяти, чтобы проверка бюджета не ходила в базу.
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        flush_interval: float = 5.0,
+        batch_size: int = 50
+    ):
+        """
+        Args:
+            db_path: Путь к файлу SQLite (по умолчанию LLM_LEDGER_PATH)
+            flush_interval: Период записи на диск, сек
+            batch_size: Размер пачки, после которого запись идёт сразу
+        """
+        self.db_path = db_path or config.LLM_LEDGER_PATH
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._buffer: List[tuple] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_usage ("
+            "ts REAL NOT NULL, day TEXT NOT NULL, month TEXT NOT NULL, "
+            "agent TEXT, specialty TEXT, model TEXT, "
+            "prompt_tokens INTEGER, completion_tokens INTEGER, cached_tokens INTEGER, "
+            "latency REAL, cost REAL, success INTEGER, cached INTEGER)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_usage_day ON llm_usage (day)")
+        self._conn.commit()
+
+        self._day, self._month = self._periods()
+        self._spend = self._load_spend()
+
+    @staticmethod
+    def _periods() -> Tuple[str, str]:
+        now = datetime.now()
+        return now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+
+    def _load_spend(self) -> Dict[str, Any]:
+        """Траты текущих дня и месяца из базы (после перезапуска)"""
+        day_total = self._conn.execute(
+            "SELECT COALESCE(SUM(cost), 0) FROM llm_usage WHERE day = ?", (self._day,)
+        ).fetchone()[0]
+        month_total = self._conn.execute(
+            "SELECT COALESCE(SUM(cost), 0) FROM llm_usage WHERE month = ?", (self._month,)
+        ).fetchone()[0]
+        by_specialty = dict(self._conn.execute(
+            "SELECT specialty, SUM(cost) FROM llm_usage WHERE day = ? GROUP BY specialty", (self._day,)
+        ).fetchall())
+
+        return {"day": day_total, "month": month_total, "day_by_specialty": by_specialty}
+
+    def _roll_periods(self):
+        """Обнуляет дневные/месячные траты при смене даты"""
+        day, month = self._periods()
+        if day != self._day:
+            self._spend["day"] = 0.0
+            self._spend["day_by_specialty"] = {}
+            self._day = day
+        if month != self._month:
+            self._spend["month"] = 0.0
+            self._month = month
+
+    # ------------------------------------------------------------------ запись
+
+    def record(
+        self,
+        model: str,
+        usage: Dict[str, Any],
+        latency: float,
+        success: bool,
+        agent: str = None,
+        specialty: str = None,
+        cached: bool = False
+    ) -> float:
+        """
+        Записать вызов
+
+        Args:
+            model: Модель, давшая ответ
+            usage: Блок usage из ответа
+            latency: Длительность вызова, сек
+            success: Успешен ли вызов
+            agent: Класс агента (ContentGeneratorAgent, SafetyAgent, ...)
+            specialty: Специализация
+            cached: Ответ из кэша / объединённый запрос (токены не тратились)
+
+        Returns:
+            Стоимость вызова
+        """
+        self._roll_periods()
+
+        cost = 0.0 if cached else estimate_cost(model, usage)
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+
+        self._buffer.append((
+            time.time(), self._day, self._month, agent, specialty, model,
+            usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), cached_tokens,
+            latency, cost, int(success), int(cached)
+        ))
+
+        self._spend["day"] += cost
+        self._spend["month"] += cost
+        by_specialty = self._spend["day_by_specialty"]
+        by_specialty[specialty] = by_specialty.get(specialty, 0.0) + cost
+
+        if len(self._buffer) >= self.batch_size:
+            asyncio.get_running_loop().create_task(self.flush())
+
+        return cost
+
+    async def flush(self):
+        """Записать накопленные записи на диск одной транзакцией"""
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+
+            def _write():
+                self._conn.executemany(
+                    "INSERT INTO llm_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch
+                )
+                self._conn.commit()
+
+            try:
+                await asyncio.to_thread(_write)
+            except sqlite3.Error as e:
+                logger.error(f"❌ Журнал токенов: не удалось записать {len(batch)} записей: {e}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self):
+        """Запустить периодическую запись на диск"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+            logger.info(
+                f"📒 Журнал токенов: сегодня ${self._spend['day']:.2f}, "
+                f"за месяц ${self._spend['month']:.2f}"
+            )
+
+    async def close(self):
+        """Остановить фоновую запись и сбросить буфер"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+
+        await self.flush()
+        self._conn.close()
+
+    # ----------------------------------------------------------------- бюджеты
+
+    def check_budget(self, specialty: str = None) -> str:
+        """
+        Решение по бюджету перед вызовом
+
+        - Траты ниже лимитов — BUDGET_OK
+        - Лимит превышен и задана дешёвая модель — BUDGET_DEGRADE
+        - Превышен жёсткий лимит (лимит × LLM_BUDGET_HARD_FACTOR)
+          или дешёвой модели нет — BUDGET_REFUSE
+
+        Args:
+            specialty: Специализация (для специализированных дневных лимитов)
+
+        Returns:
+            BUDGET_OK / BUDGET_DEGRADE / BUDGET_REFUSE
+        """
+        self._roll_periods()
+
+        checks = [
+            (self._spend["day"], config.LLM_DAILY_BUDGET_USD),
+            (self._spend["month"], config.LLM_MONTHLY_BUDGET_USD),
+        ]
+        if specialty and specialty in config.LLM_SPECIALTY_DAILY_BUDGETS:
+            checks.append((
+                self._spend["day_by_specialty"].get(specialty, 0.0),
+                config.LLM_SPECIALTY_DAILY_BUDGETS[specialty]
+            ))
+
+        decision = BUDGET_OK
+        for spent, limit in checks:
+            if not limit or spent < limit:
+                continue
+            if not config.LLM_BUDGET_CHEAP_MODEL or spent >= limit * config.LLM_BUDGET_HARD_FACTOR:
+                return BUDGET_REFUSE
+            decision = BUDGET_DEGRADE
+
+        return decision
+
+    def get_spend(self) -> Dict[str, Any]:
+        """Текущие траты за день и месяц"""
+        self._roll_periods()
+        return {
+            "day": round(self._spend["day"], 4),
+            "month": round(self._spend["month"], 4),
+            "day_by_specialty": {
+                k: round(v, 4) for k, v in self._spend["day_by_specialty"].items()
+            }
+        }
+
+    # ------------------------------------------------------------------ отчёты
+
+    async def get_report(self, period: str = "day") -> List[Dict[str, Any]]:
+        """
+        Разбивка по агентам и специализациям
+
+        Args:
+            period: "day" или "month"
+
+        Returns:
+            Строки отчёта: agent, specialty, calls, tokens, cost, avg_latency
+        """
+        await self.flush()
+        column, value = ("day", self._day) if period == "day" else ("month", self._month)
+
+        def _query():
+            return self._conn.execute(
+                "SELECT agent, specialty, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), "
+                "SUM(cached_tokens), SUM(cost), AVG(latency), SUM(cached) "
+                f"FROM llm_usage WHERE {column} = ? "
+                "GROUP BY agent, specialty ORDER BY SUM(cost) DESC",
+                (value,)
+            ).fetchall()
+
+        rows = await asyncio.to_thread(_query)
+
+        return [
+            {
+                "agent": agent or "—",
+                "specialty": specialty or "—",
+                "calls": calls,
+                "prompt_tokens": prompt_tokens or 0,
+                "completion_tokens": completion_tokens or 0,
+                "cached_tokens": cached_tokens or 0,
+                "cost": round(cost or 0.0, 4),
+                "avg_latency": round(avg_latency or 0.0, 2),
+                "cache_hits": cache_hits or 0
+            }
+            for agent, specialty, calls, prompt_tokens, completion_tokens,
+                cached_tokens, cost, avg_latency, cache_hits in rows
+        ]
+
+
+__all__ = [
+    "UsageLedger",
+    "estimate_cost",
+    "MODEL_PRICES",
+    "BUDGET_OK",
+    "BUDGET_DEGRADE",
+    "BUDGET_REFUSE"
+]
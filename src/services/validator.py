@@ -2,14 +2,17 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Стоп-фразы: пост с ними не проходит валидацию и отклоняется предскринингом
+# безопасности (src/services/safety_prescreen.py) без запроса к LLM
+FORBIDDEN_WORDS = ["срочно купите", "инфоцыгане", "100% гарантия"]
+
 class PostValidator:
     """Класс для валидации сгенерированных постов."""
 
     def __init__(self):
         self.min_length = 50
         self.max_length = 4000
-        # Список стоп-слов (пример)
-        self.forbidden_words = ["срочно купите", "инфоцыгане", "100% гарантия"]
+        self.forbidden_words = list(FORBIDDEN_WORDS)
 
     def validate_post(self, content: str) -> dict:
         """
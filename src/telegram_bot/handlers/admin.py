@@ -6,6 +6,7 @@ from aiogram import Router
 from aiogram.filters import Command
 from aiogram.types import Message
 
+from src.core.config import config
 from src.core.logger import logger
 
 router = Router()
@@ -13,6 +14,12 @@ router = Router()
 # Глобальная переменная для доступа к telegram_bot (инициализируется в main.py)
 telegram_bot = None
 
+# Журнал токенов LLM (инициализируется в main.py)
+usage_ledger = None
+
+# Конвейер поста (инициализируется в main.py)
+post_pipeline = None
+
 
 def set_telegram_bot(bot):
     """Инициализация telegram_bot из main.py"""
@@ -20,6 +27,18 @@ def set_telegram_bot(bot):
     telegram_bot = bot
 
 
+def set_usage_ledger(ledger):
+    """Инициализация журнала токенов из main.py"""
+    global usage_ledger
+    usage_ledger = ledger
+
+
+def set_post_pipeline(pipeline):
+    """Инициализация конвейера поста из main.py"""
+    global post_pipeline
+    post_pipeline = pipeline
+
+
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     """Команда /start"""
@@ -28,6 +47,8 @@ async def cmd_start(message: Message):
         "Я автоматически публикую медицинский контент в каналы.\n\n"
         "Доступные команды:\n"
         "/stats - Статистика публикаций\n"
+        "/usage - Расход токенов и бюджет\n"
+        "/pipeline - Время этапов генерации\n"
         "/health - Проверка работоспособности"
     )
 
@@ -88,6 +109,88 @@ async def cmd_status(message: Message):
         await message.answer(f"❌ <b>Ошибка получения статуса</b>\n\n<code>{str(e)}</code>", parse_mode="HTML")
 
 
+@router.message(Command("usage"))
+async def cmd_usage(message: Message):
+    """Команда /usage - расход токенов LLM по агентам и специализациям"""
+    if not usage_ledger:
+        await message.answer("⚠️ Учёт токенов не включён", parse_mode="HTML")
+        return
+
+    try:
+        period = "month" if "month" in (message.text or "") else "day"
+        spend = usage_ledger.get_spend()
+        rows = await usage_ledger.get_report(period)
+
+        def budget(spent, limit):
+            return f"${spent:.2f} / ${limit:.2f}" if limit else f"${spent:.2f} (без лимита)"
+
+        usage_text = f"""💸 <b>Расход LLM</b>
+
+📅 Сегодня: {budget(spend['day'], config.LLM_DAILY_BUDGET_USD)}
+🗓 За месяц: {budget(spend['month'], config.LLM_MONTHLY_BUDGET_USD)}
+
+<b>{'За месяц' if period == 'month' else 'Сегодня'} по агентам:</b>
+"""
+
+        if rows:
+            for row in rows:
+                usage_text += (
+                    f"\n• {row['agent']} / {row['specialty']}: "
+                    f"{row['calls']} выз., "
+                    f"{row['prompt_tokens'] + row['completion_tokens']} ток., "
+                    f"${row['cost']:.3f}, ~{row['avg_latency']}s"
+                )
+                if row["cache_hits"]:
+                    usage_text += f", из кэша {row['cache_hits']}"
+                if row["cached_tokens"]:
+                    usage_text += f", кэш промпта {row['cached_tokens']} ток."
+        else:
+            usage_text += "\nВызовов пока не было"
+
+        usage_text += "\n\n<i>/usage month — разбивка за месяц</i>"
+
+        await message.answer(usage_text, parse_mode="HTML")
+
+    except Exception as e:
+        logger.error(f"Ошибка в /usage: {e}")
+        await message.answer(f"❌ Ошибка: {str(e)}", parse_mode="HTML")
+
+
+@router.message(Command("pipeline"))
+async def cmd_pipeline(message: Message):
+    """Команда /pipeline - время этапов конвейера поста"""
+    if not post_pipeline:
+        await message.answer("⚠️ Конвейер не инициализирован", parse_mode="HTML")
+        return
+
+    try:
+        stats = post_pipeline.get_stats()
+        pipeline_text = f"""⏱ <b>Конвейер поста</b>
+
+Прогонов: {stats['runs']} (✅ {stats['ok']}, ♻️ {stats['stopped']}, ❌ {stats['failed']})
+В среднем: {stats['avg_ms'] / 1000:.1f}s
+
+<b>Этапы:</b>
+"""
+        for name, stage in stats["stages"].items():
+            pipeline_text += (
+                f"\n• {name}: {stage['avg_ms']:.0f} мс (макс. {stage['max_ms']:.0f}), "
+                f"ожидание слота {stage['avg_wait_ms']:.0f} мс"
+            )
+            if stage["concurrency"]:
+                pipeline_text += f", сейчас {stage['running']}/{stage['concurrency']}, в очереди {stage['waiting']}"
+            if stage["failed"] or stage["timeouts"] or stage["rejected"]:
+                pipeline_text += (
+                    f", ошибок {stage['failed']}, таймаутов {stage['timeouts']}, отклонено {stage['rejected']}"
+                )
+
+        await message.answer(pipeline_text, parse_mode="HTML")
+
+    except Exception as e:
+        logger.error(f"Ошибка в /pipeline: {e}")
+        await message.answer(f"❌ Ошибка: {str(e)}", parse_mode="HTML")
+
+
 @router.message(Command("health"))
 async def cmd_health(message: Message):
     """Команда /health - проверка работоспособности"""
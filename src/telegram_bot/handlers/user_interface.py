@@ -5,6 +5,7 @@
 from datetime import datetime, timedelta
 import uuid
 import html
+import time
 
 from aiogram import Router, F, types, Dispatcher
 from aiogram.filters import Command
@@ -13,6 +14,12 @@ from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message, CallbackQuery
 
 from src.agents.specialty_loader import SPECIALTY_MAP, get_specialty_config
+from src.agents.post_pipeline import build_post_pipeline, review_status
+from src.core.config import config
+from src.core.deadline import Deadline
+from src.core.exceptions import GenerationError
+from src.core.tracing import current_span, current_trace_id, traced
+from src.services.dedup import SOURCE_LABELS
 # Импорты ваших сервисов
 from src.services.content_generator import ContentGeneratorService
 from src.services.validator import PostValidator, logger
@@ -23,6 +30,13 @@ from src.utils.channel_utils import normalize_channel_id, get_channel_display_na
 
 router = Router()
 
+# Живое превью черновика во время потоковой генерации
+PREVIEW_EDIT_INTERVAL = 1.5  # сек между правками сообщения (лимиты Telegram)
+PREVIEW_MAX_CHARS = 3000     # показываем хвост черновика, лимит сообщения 4096
+
+# Чаты, где генерация уже идёт (защита от двойного нажатия "Сгенерировать заново")
+generating_chats = set()
+
 # FSM States
 class PostCreation(StatesGroup):
     waiting_for_specialty = State()
@@ -35,14 +49,48 @@ class PostCreation(StatesGroup):
 generator_agent = None  # Инициализируется в main.py
 safety_agent = None
 telegram_bot = None
+duplicate_index = None  # DuplicateIndex (DEDUP_ENABLED)
+draft_cache = None  # DraftCache (DRAFT_CACHE_ENABLED)
+post_pipeline = None  # Конвейер генерация → безопасность → статус → формат
 
 
-def set_agents(gen_agent, safe_agent, tg_bot):
+def set_agents(gen_agent, safe_agent, tg_bot, duplicates=None, drafts=None, pipeline=None):
     """Инициализация агентов из main.py"""
-    global generator_agent, safety_agent, telegram_bot
+    global generator_agent, safety_agent, telegram_bot, duplicate_index, draft_cache, post_pipeline
     generator_agent = gen_agent
     safety_agent = safe_agent
     telegram_bot = tg_bot
+    duplicate_index = duplicates
+    draft_cache = drafts
+    if pipeline is None and gen_agent is not None:
+        pipeline = build_post_pipeline(gen_agent, safe_agent, duplicates=duplicates)
+    post_pipeline = pipeline
+
+
+def _duplicate_warning(title: str, match: dict, note: str) -> str:
+    """Сообщение редактору о почти-дубликате"""
+    return (
+        f"♻️ <b>{title}</b>\n\n"
+        f"«{html.escape(match['title'] or 'без заголовка')}»\n"
+        f"<b>Где:</b> {SOURCE_LABELS.get(match['source'], match['source'])}\n"
+        f"<b>Сходство:</b> {match['similarity']:.0%}\n\n"
+        f"{note}\n"
+        f"Можно изменить тему или всё равно сгенерировать пост."
+    )
+
+
+DUPLICATE_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="✍️ Всё равно сгенерировать", callback_data="force_generate")],
+    [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel")]
+])
+
+# Кнопки под превью поста
+REVIEW_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🚀 Опубликовать мгновенно", callback_data="publish_now")],
+    [InlineKeyboardButton(text="⏰ Запланировать публикацию", callback_data="publish_scheduled")],
+    [InlineKeyboardButton(text="🔄 Сгенерировать заново", callback_data="regenerate")],
+    [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel")]
+])
 
 
 # ====================================================================================
@@ -146,11 +194,159 @@ async def process_specialty_choice(callback: CallbackQuery, state: FSMContext):
 
 @router.message(PostCreation.waiting_for_topic)
 async def process_topic_and_generate(message: Message, state: FSMContext):
-    """Получаем тему и генерируем пост с AI"""
-    from aiogram.exceptions import TelegramNetworkError, TelegramAPIError
+    """Получаем тему и генерируем пост с AI (или берём принятый ранее черновик)"""
+    data = await state.get_data()
+    await _run_generation(message, state, message.text, data)
+
 
-    topic = message.text
+@router.callback_query(F.data == "force_generate", PostCreation.waiting_for_topic)
+async def force_generate(callback: CallbackQuery, state: FSMContext):
+    """Генерация по теме, похожей на уже существующий пост (без проверки дубликатов и кэша черновиков)"""
+    await callback.answer()
     data = await state.get_data()
+    await _run_generation(callback.message, state, data["topic"], data, check_duplicates=False, reuse_drafts=False)
+
+
+async def _run_generation(message: Message, state: FSMContext, topic: str, data: dict, **options):
+    """_generate_post_flow, не более одной генерации на чат"""
+    if message.chat.id in generating_chats:
+        logger.info(f"🔗 Генерация в чате {message.chat.id} уже идёт, повторный запрос пропущен")
+        await message.answer(
+            "⏳ <b>Пост уже генерируется</b>\n\n"
+            "Запрос получен — дождитесь результата текущей генерации.",
+            parse_mode="HTML"
+        )
+        return
+    generating_chats.add(message.chat.id)
+
+    try:
+        await _generate_post_flow(message, state, topic, data, **options)
+    finally:
+        generating_chats.discard(message.chat.id)
+
+
+@traced("telegram.preview")
+async def _show_preview(
+    message: Message,
+    state: FSMContext,
+    topic: str,
+    data: dict,
+    post_content: str,
+    is_safe: bool,
+    severity: str,
+    issues: list,
+    suggestions: list = (),
+    note: str = ""
+):
+    """Превью поста с вердиктом безопасности и кнопками публикации"""
+    current_span().set(from_cache=bool(note), severity=severity)
+    status = review_status(is_safe, severity)
+
+    # Сохраняем в состояние
+    await state.update_data(
+        topic=topic,
+        post_content=post_content,
+        is_safe=is_safe,
+        severity=severity,
+        issues=issues
+    )
+
+    preview_text = (
+        f"✨ <b>Пост готов!</b>\n\n"
+        f"<b>Специализация:</b> {data['emoji']} {data['name']}\n"
+        f"<b>Тема:</b> {topic[:100]}{'...' if len(topic) > 100 else ''}\n\n"
+        f"<b>Проверка безопасности:</b> {status['color']} {status['emoji']} {status['text']}\n"
+    )
+
+    if issues:
+        preview_text += f"<b>Замечания:</b> {len(issues)}\n"
+
+    if suggestions:
+        preview_text += f"<b>Советы редактора:</b> {len(suggestions)}\n"
+
+    if note:
+        preview_text += f"\n{note}\n"
+
+    preview_text += f"\n{'─' * 40}\n\n{post_content}\n\n{'─' * 40}\n"
+
+    await message.answer(
+        preview_text,
+        parse_mode="HTML",
+        reply_markup=REVIEW_KEYBOARD
+    )
+
+    await state.set_state(PostCreation.reviewing_post)
+
+
+async def _remember_draft(data: dict):
+    """Принятый черновик — в кэш: повторная тема получит его без генерации"""
+    if draft_cache is None or not data.get('topic'):
+        return
+    await draft_cache.put(data['topic'], data['specialty'], {
+        "content": data['post_content'],
+        "is_safe": data.get('is_safe', False),
+        "severity": data.get('severity', "unknown"),
+        "issues": data.get('issues', [])
+    })
+
+
+async def _generate_post_flow(
+    message: Message,
+    state: FSMContext,
+    topic: str,
+    data: dict,
+    check_duplicates: bool = True,
+    reuse_drafts: bool = True
+):
+    """Генерация, проверка безопасности и превью поста"""
+    from aiogram.exceptions import TelegramNetworkError, TelegramAPIError
+
+    # Тему уже разбирали и пост приняли — показываем его сразу, раньше проверки
+    # дубликатов: принятый пост сам лежит в индексе (очередь, опубликован), и
+    # предупреждение закрыло бы дорогу к черновику. О похожем посте говорит заметка.
+    # «Сгенерировать заново» и «Всё равно сгенерировать» запускают свежую генерацию
+    if reuse_drafts and draft_cache is not None:
+        draft = await draft_cache.get(topic, data['specialty'])
+        if draft:
+            accepted_at = datetime.fromtimestamp(draft['accepted_at']).strftime('%d.%m.%Y %H:%M')
+            note = (
+                f"♻️ <b>Черновик из кэша</b>: принят {accepted_at} по теме "
+                f"«{html.escape(draft['topic'][:100])}». Генерация не запускалась."
+            )
+            match = duplicate_index.find_topic(topic, data['specialty']) if duplicate_index is not None else None
+            if match:
+                note += (
+                    f"\n⚠️ Похожий пост: «{html.escape(match['title'] or 'без заголовка')}» "
+                    f"({SOURCE_LABELS.get(match['source'], match['source'])}) — проверьте, не повтор ли это."
+                )
+            await _show_preview(
+                message,
+                state,
+                topic,
+                data,
+                draft['content'],
+                is_safe=draft['is_safe'],
+                severity=draft['severity'],
+                issues=draft['issues'],
+                note=note
+            )
+            return
+
+    # Тему, которую уже разбирали (опубликовано, в очереди, в архиве канала),
+    # не генерируем: редактор решает сам
+    if check_duplicates and duplicate_index is not None:
+        match = duplicate_index.find_topic(topic, data['specialty'])
+        if match:
+            logger.info(f"♻️ Похожая тема: {topic!r} ~ {match['key']} ({match['similarity']})")
+            await state.update_data(topic=topic)
+            await message.answer(
+                _duplicate_warning(
+                    "Похожая тема уже есть", match, "Генерация не запускалась — вызовы модели сэкономлены."
+                ),
+                parse_mode="HTML",
+                reply_markup=DUPLICATE_KEYBOARD
+            )
+            return
 
     # Показываем прогресс
     progress_msg = await message.answer(
@@ -161,128 +357,124 @@ async def process_topic_and_generate(message: Message, state: FSMContext):
         parse_mode="HTML"
     )
 
-    async def safe_edit_progress(text: str):
+    async def safe_edit_progress(text: str, reply_markup: InlineKeyboardMarkup = None):
         """Безопасное обновление прогресса с обработкой timeout"""
         try:
-            await progress_msg.edit_text(text, parse_mode="HTML")
+            await progress_msg.edit_text(text, parse_mode="HTML", reply_markup=reply_markup)
         except (TelegramNetworkError, TelegramAPIError) as e:
             logger.warning(f"⚠️ Не удалось обновить прогресс: {e}")
             # Продолжаем работу даже если не удалось обновить UI
 
-    try:
-        # Формируем данные для генератора
-        news = {
-            "title": topic,
-            "content": f"Тема для поста: {topic}",
-            "source_name": "Пользовательский запрос",
-            "source_url": ""
-        }
-
-        channel = {
-            "name": data['name'],
-            "specialty": data['specialty'],
-            "emoji": data['emoji'],
-            "link": data['link']
-        }
-
-        # 1. Генерируем контент
+    # Несколько черновиков параллельно, каждый сразу проверяется —
+    # редактор получает лучший из них без ручной перегенерации
+    candidates = config.GENERATION_CANDIDATES > 1
+
+    async def show_stage(stage: str):
+        """Прогресс по этапам конвейера"""
+        if stage == "generate":
+            await safe_edit_progress(
+                "🤖 <b>Генерирую контент...</b>\n\n"
+                "✅ Анализирую тему\n"
+                "⏳ Создаю структуру поста\n"
+                "⏳ Проверяю медицинскую безопасность"
+            )
+        elif stage == "safety" and not candidates:
+            await safe_edit_progress(
+                "🤖 <b>Генерирую контент...</b>\n\n"
+                "✅ Анализирую тему\n"
+                "✅ Создал структуру поста\n"
+                "⏳ Проверяю медицинскую безопасность"
+            )
+
+    async def show_candidates_progress(done: int, total: int):
         await safe_edit_progress(
             "🤖 <b>Генерирую контент...</b>\n\n"
             "✅ Анализирую тему\n"
-            "⏳ Создаю структуру поста\n"
-            "⏳ Проверяю медицинскую безопасность"
+            f"✍️ Готово и проверено черновиков: {done}/{total}\n"
+            "⏳ Выбираю лучший"
         )
 
-        gen_result = await generator_agent.execute(
-            news=news,
-            channel=channel
-        )
-
-        if not gen_result["success"]:
-            raise Exception(f"Ошибка генерации: {gen_result.get('error')}")
+    last_preview_at = 0.0
 
-        post_content = gen_result["content"]
+    async def show_draft(draft: str):
+        """Показывает черновик по мере генерации (не чаще PREVIEW_EDIT_INTERVAL)"""
+        nonlocal last_preview_at
+        now = time.monotonic()
+        if now - last_preview_at < PREVIEW_EDIT_INTERVAL:
+            return
+        last_preview_at = now
 
-        # 2. Проверяем безопасность
+        # Черновик может обрываться посреди HTML-тега, поэтому экранируем
+        tail = draft[-PREVIEW_MAX_CHARS:]
         await safe_edit_progress(
             "🤖 <b>Генерирую контент...</b>\n\n"
             "✅ Анализирую тему\n"
-            "✅ Создал структуру поста\n"
-            "⏳ Проверяю медицинскую безопасность"
+            "✍️ Пишу пост...\n\n"
+            f"<i>{'…' if len(draft) > len(tail) else ''}{html.escape(tail)}</i>"
         )
 
-        safety_result = await safety_agent.execute(
-            content=post_content,
-            specialty=data['specialty'],
-            channel_name=data['name']
+    try:
+        # Генерация → дубликаты → безопасность → статус, форматирование параллельно с проверкой.
+        # Общий SLA на генерацию + проверку: генерация оставляет SAFETY_RESERVE
+        # проверке, проверка получает весь остаток
+        run = await post_pipeline.run(
+            on_stage=show_stage,
+            news={
+                "title": topic,
+                "content": f"Тема для поста: {topic}",
+                "source_name": "Пользовательский запрос",
+                "source_url": ""
+            },
+            channel={
+                "name": data['name'],
+                "specialty": data['specialty'],
+                "emoji": data['emoji'],
+                "link": data['link']
+            },
+            deadline=Deadline(config.GENERATION_SLA),
+            on_chunk=None if candidates else show_draft,
+            on_progress=show_candidates_progress,
+            check_duplicates=check_duplicates
         )
 
-        if not safety_result["success"]:
-            raise Exception("Ошибка проверки безопасности")
-
-        is_safe = safety_result.get("is_safe", False)
-        severity = safety_result.get("severity", "unknown")
-        issues = safety_result.get("issues", [])
-
-        # Определяем эмодзи статуса
-        if is_safe and severity == "safe":
-            status_emoji = "✅"
-            status_text = "БЕЗОПАСНО"
-            status_color = "🟢"
-        elif severity in ["low", "medium"]:
-            status_emoji = "⚠️"
-            status_text = "ТРЕБУЕТ ВНИМАНИЯ"
-            status_color = "🟡"
-        else:
-            status_emoji = "❌"
-            status_text = "ТРЕБУЕТ ПРАВКИ"
-            status_color = "🔴"
-
-        # Сохраняем в состояние
-        await state.update_data(
-            topic=topic,
-            post_content=post_content,
-            is_safe=is_safe,
-            severity=severity,
-            issues=issues
-        )
+        # Черновик почти совпадает с существующим постом — показываем его вместо превью
+        if run.stopped:
+            note = (
+                "Варианты не показаны, чтобы не опубликовать повтор."
+                if candidates else
+                "Проверка безопасности не запускалась — вызов модели сэкономлен."
+            )
+            await state.update_data(topic=topic)
+            await safe_edit_progress(
+                _duplicate_warning("Черновик почти совпадает с постом", run.stop_details["match"], note),
+                reply_markup=DUPLICATE_KEYBOARD
+            )
+            return
 
-        # 3. Показываем результат
+        if not run.ok:
+            raise GenerationError(run.error)
+
+        # Показываем результат
         try:
             await progress_msg.delete()
         except (TelegramNetworkError, TelegramAPIError):
             pass  # Игнорируем ошибки при удалении
 
-        preview_text = (
-            f"✨ <b>Пост готов!</b>\n\n"
-            f"<b>Специализация:</b> {data['emoji']} {data['name']}\n"
-            f"<b>Тема:</b> {topic[:100]}{'...' if len(topic) > 100 else ''}\n\n"
-            f"<b>Проверка безопасности:</b> {status_color} {status_emoji} {status_text}\n"
+        review = run["review"]
+        await _show_preview(
+            message,
+            state,
+            topic,
+            data,
+            run["generate"]["content"],
+            is_safe=review["is_safe"],
+            severity=review["severity"],
+            issues=review["issues"],
+            suggestions=review["suggestions"]
         )
 
-        if issues:
-            preview_text += f"<b>Замечания:</b> {len(issues)}\n"
-
-        preview_text += f"\n{'─' * 40}\n\n{post_content}\n\n{'─' * 40}\n"
-
-        # Кнопки действий
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🚀 Опубликовать мгновенно", callback_data="publish_now")],
-            [InlineKeyboardButton(text="⏰ Запланировать публикацию", callback_data="publish_scheduled")],
-            [InlineKeyboardButton(text="🔄 Сгенерировать заново", callback_data="regenerate")],
-            [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel")]
-        ])
-
-        await message.answer(
-            preview_text,
-            parse_mode="HTML",
-            reply_markup=keyboard
-        )
-
-        await state.set_state(PostCreation.reviewing_post)
-
     except Exception as e:
-        logger.error(f"Ошибка генерации: {e}")
+        logger.error(f"Ошибка генерации: {e} (trace {current_trace_id() or '—'})")
         try:
             await progress_msg.edit_text(
                 f"❌ <b>Ошибка генерации контента</b>\n\n"
@@ -329,6 +521,7 @@ async def publish_immediately(callback: CallbackQuery, state: FSMContext):
         
         # Отправляем в очередь
         await telegram_bot.add_task(task)
+        await _remember_draft(data)
         
         await callback.message.edit_text(
             f"✅ <b>Пост опубликован!</b>\n\n"
@@ -433,6 +626,7 @@ async def process_scheduled_time(callback: CallbackQuery, state: FSMContext):
 
         # Добавляем в очередь
         await telegram_bot.add_task(task)
+        await _remember_draft(data)
 
         await callback.message.edit_text(
             f"⏰ <b>Пост запланирован!</b>\n\n"
@@ -486,6 +680,7 @@ async def process_custom_time(message: Message, state: FSMContext):
         )
 
         await telegram_bot.add_task(task)
+        await _remember_draft(data)
 
         await message.answer(
             f"⏰ <b>Пост запланирован!</b>\n\n"
@@ -524,8 +719,8 @@ async def regenerate_post(callback: CallbackQuery, state: FSMContext):
 
     data = await state.get_data()
 
-    # Повторяем генерацию
-    await process_topic_and_generate(callback.message, state)
+    # Повторяем генерацию по той же теме — свежую, мимо кэша черновиков
+    await _run_generation(callback.message, state, data["topic"], data, reuse_drafts=False)
 
 
 # ====================================================================================
@@ -0,0 +1,38 @@
+"""
+Middleware aiogram
+"""
+
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from src.core.tracing import span
+
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Корневой спан telegram.update на каждый апдейт
+
+    Регистрируется как outer middleware на dp.update: всё, что делает
+    обработчик (генерация, проверка, превью), попадает в одну трассу.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        with span("telegram.update", update_id=event.update_id, type=event.event_type) as update_span:
+            chat = data.get("event_chat")
+            user = data.get("event_from_user")
+            update_span.set(
+                chat_id=chat.id if chat else None,
+                user_id=user.id if user else None,
+                callback=event.callback_query.data if event.callback_query else None
+            )
+            return await handler(event, data)
+
+
+__all__ = ["TracingMiddleware"]
@@ -7,6 +7,7 @@ from typing import List, Optional, Dict
 from collections import defaultdict
 
 from src.telegram_bot.models import PublishTask, TaskStatus
+from src.services.dedup import DuplicateIndex, SOURCE_QUEUED, SOURCE_PUBLISHED, specialty_of_channel
 from src.core.logger import logger
 
 
@@ -16,12 +17,25 @@ class TaskQueue:
     Для production рекомендуется использовать Redis или БД
     """
     
-    def __init__(self):
+    def __init__(self, duplicates: Optional[DuplicateIndex] = None):
+        """
+        Args:
+            duplicates: Индекс почти-дубликатов — в него попадают посты
+                из очереди и опубликованные
+        """
         self.tasks: Dict[str, PublishTask] = {}
         self.completed_tasks: Dict[str, PublishTask] = {}
         self.failed_tasks: Dict[str, PublishTask] = {}
+        self.duplicates = duplicates
         logger.info("📋 Очередь задач инициализирована")
     
+    async def _track(self, task_id: str, action, *args):
+        """Обновляет индекс дубликатов; его сбой не должен мешать публикации"""
+        try:
+            await action(f"task:{task_id}", *args)
+        except Exception as e:
+            logger.warning(f"⚠️ Индекс дубликатов не обновлён ({task_id}): {e}")
+    
     async def add_task(self, task: PublishTask) -> str:
         """
         Добавить задачу в очередь
@@ -34,6 +48,10 @@ class TaskQueue:
         """
         self.tasks[task.task_id] = task
         logger.info(f"➕ Задача добавлена: {task.task_id} → {task.channel_id} в {task.scheduled_time}")
+        if self.duplicates is not None:
+            await self._track(
+                task.task_id, self.duplicates.add_post, task.text, specialty_of_channel(task.channel_id), SOURCE_QUEUED
+            )
         return task.task_id
     
     async def get_task(self, task_id: str) -> Optional[PublishTask]:
@@ -85,6 +103,8 @@ class TaskQueue:
             task.message_id = message_id
             self.completed_tasks[task_id] = task
             logger.info(f"✅ Задача выполнена: {task_id}")
+            if self.duplicates is not None:
+                await self._track(task_id, self.duplicates.set_source, SOURCE_PUBLISHED)
         else:
             logger.warning(f"⚠️ Задача {task_id} не найдена для завершения")
     
@@ -107,6 +127,8 @@ class TaskQueue:
                 task.status = TaskStatus.FAILED
                 self.failed_tasks[task_id] = task
                 logger.error(f"❌ Задача провалена окончательно: {task_id} ({error})")
+                if self.duplicates is not None:
+                    await self._track(task_id, self.duplicates.remove)
             else:
                 # Оставляем в очереди для повтора
                 task.status = TaskStatus.PENDING
@@ -132,6 +154,8 @@ class TaskQueue:
         
         if task:
             logger.info(f"🚫 Задача отменена: {task_id}")
+            if self.duplicates is not None:
+                await self._track(task_id, self.duplicates.remove)
             return True
         
         logger.warning(f"⚠️ Задача {task_id} не найдена для отмены")
@@ -4,6 +4,8 @@ import json
 import asyncio
 import logging
 import os
+import re
+import unicodedata
 from functools import wraps
 
 logger = logging.getLogger(__name__)
@@ -16,6 +18,12 @@ def hash_content(content: str) -> str:
     """Создает хеш контента для проверки дубликатов."""
     return hashlib.md5(content.encode('utf-8')).hexdigest()
 
+def normalize_content(content: str) -> str:
+    """Приводит текст к каноническому виду: NFC, без лишних пробелов и пустых строк по краям."""
+    content = unicodedata.normalize("NFC", content)
+    lines = (re.sub(r"[ \t\u00a0]+", " ", line).strip() for line in content.strip().splitlines())
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
 def load_json_file(filepath: str):
     """Загружает данные из JSON файла."""
     if not os.path.exists(filepath):
@@ -45,3 +53,38 @@ def retry_async(retries=3, delay=2):
             raise last_exception
         return wrapper
     return decorator
+
+async def gather_bounded(items, worker, concurrency, on_progress=None, on_error=None):
+    """
+    Выполняет worker(item) для всех items, не больше concurrency одновременно.
+
+    Результаты возвращаются в порядке items. Исключение в одном элементе не
+    прерывает остальные: его результатом станет on_error(item, exc) (или само
+    исключение, если on_error не задан). on_progress(done, total, index, result)
+    вызывается по мере готовности элементов.
+    """
+    items = list(items)
+    total = len(items)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    done = 0
+
+    async def run(index, item):
+        nonlocal done
+        async with semaphore:
+            try:
+                result = await worker(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Batch item {index + 1}/{total} failed: {e}")
+                result = on_error(item, e) if on_error else e
+
+        done += 1
+        if on_progress:
+            try:
+                await on_progress(done, total, index, result)
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {e}")
+        return result
+
+    return await asyncio.gather(*[run(i, item) for i, item in enumerate(items)])
@@ -0,0 +1,199 @@
+"""
+Терпимый разбор JSON из ответов LLM, в том числе по мере потоковой генерации
+
+Модели оборачивают JSON в ```json```, добавляют текст до и после,
+обрывают ответ на max_tokens. IncrementalJSONParser принимает фрагменты
+потока и в любой момент отдаёт уже известную часть объекта: is_safe и
+severity становятся известны задолго до конца ответа.
+"""
+
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.tracing import span
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+# Число в конце текста ещё может дописываться: «12» → «123», «0.» → «0.75»
+_OPEN_NUMBER = re.compile(r"[:,\[\s](?:-|-?\d[\d.eE+-]*)$")
+
+
+class IncrementalJSONParser:
+    """
+    Потоковый разбор первого JSON-объекта в тексте
+
+    Пример:
+        parser = IncrementalJSONParser()
+        async for delta in stream:
+            parser.feed(delta)
+            if "severity" in parser.partial():
+                ...
+        verdict = parser.result()
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._start = -1          # позиция первой «{» верхнего уровня
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._done = False        # объект верхнего уровня закрыт
+        # Последняя точка, где все значения завершены: (позиция, стек)
+        self._checkpoint: Optional[Tuple[int, Tuple[str, ...]]] = None
+        self._partial_cache: Optional[Dict[str, Any]] = None
+
+    @property
+    def complete(self) -> bool:
+        """Объект верхнего уровня закрыт"""
+        return self._done
+
+    def feed(self, chunk: str):
+        """Добавляет фрагмент текста"""
+        if self._done or not chunk:
+            return
+
+        offset = len(self._text)
+        self._text += chunk
+        self._partial_cache = None
+
+        for i, char in enumerate(chunk, start=offset):
+            if self._start < 0:
+                if char == "{":
+                    self._start = i
+                    self._stack.append("{")
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in _CLOSERS:
+                self._stack.append(char)
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                self._checkpoint = (i + 1, tuple(self._stack))
+                if not self._stack:
+                    self._done = True
+                    return
+            elif char == ",":
+                self._checkpoint = (i, tuple(self._stack))
+
+    def partial(self) -> Dict[str, Any]:
+        """
+        Уже известная часть объекта
+
+        Незакрытые массивы и объекты достраиваются; недописанные строки,
+        числа и пары «ключ: значение» отбрасываются. Пустой словарь — если ещё
+        ничего не известно.
+        """
+        if self._start < 0:
+            return {}
+        if self._partial_cache is not None:
+            return self._partial_cache
+
+        text = self._text[self._start:]
+        value = _loads_object(text) if self._done else None
+
+        if value is None and not self._in_string and not _OPEN_NUMBER.search(text):
+            # Хвост без недописанной строки или числа — достраиваем как есть
+            value = _loads_object(_close(text, self._stack))
+        if value is None and self._checkpoint is not None:
+            # Иначе — от последней точки, где все значения завершены
+            # (недописанная строка могла бы дать "crit" вместо "critical")
+            position, stack = self._checkpoint
+            value = _loads_object(_close(self._text[self._start:position], list(stack)))
+
+        self._partial_cache = value or {}
+        return self._partial_cache
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Полный объект (None, если JSON не закрыт или некорректен)"""
+        if not self._done:
+            return None
+        return _loads_object(self._text[self._start:])
+
+
+def _close(text: str, stack: List[str]) -> str:
+    """Убирает незавершённую пару «ключ:», висящую запятую и закрывает скобки"""
+    text = text.rstrip()
+    if text.endswith(":"):
+        key_end = text.rfind('"')
+        text = text[:text.rfind('"', 0, key_end)].rstrip()
+    text = text.rstrip(",").rstrip()
+    return text + "".join(_CLOSERS[opener] for opener in reversed(stack))
+
+
+def _loads_object(text: str) -> Optional[Dict[str, Any]]:
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text)
+    except (json.JSONDecodeError, ValueError):
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Первый JSON-объект из ответа модели
+
+    Понимает обёртку ```json```, текст до и после объекта (в том числе
+    фигурные скобки в тексте перед ним) и висящие запятые. Оборванный
+    ответ не достраивается — для этого есть IncrementalJSONParser.partial().
+
+    Returns:
+        Словарь или None, если объекта в тексте нет
+    """
+    with span("json.extract", chars=len(text)) as extract_span:
+        value = None
+        start = text.find("{")
+        candidates = 0
+        # «{» из текста перед объектом («Note {not json} then {...}») — пробуем следующую
+        while start >= 0 and value is None:
+            candidates += 1
+            value = _extract_from(text[start:])
+            start = text.find("{", start + 1)
+        extract_span.set(found=value is not None, candidates=candidates)
+        return value
+
+
+def _extract_from(text: str) -> Optional[Dict[str, Any]]:
+    """Объект, начинающийся с первой «{» текста"""
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    value = parser.result()
+    if value is None and parser.complete:
+        # Висящие запятые перед } и ]
+        value = _loads_object(_strip_trailing_commas(text[text.find("{"):]))
+    return value
+
+
+def _strip_trailing_commas(text: str) -> str:
+    out = []
+    in_string = escape = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            rest = text[i + 1:].lstrip()
+            if rest[:1] in ("}", "]"):
+                continue
+        out.append(char)
+    return "".join(out)
+
+
+__all__ = ["IncrementalJSONParser", "extract_json"]
@@ -0,0 +1,130 @@
+"""
+Оценка числа токенов и бюджет контекста модели
+
+Точный токенизатор у каждого провайдера свой, поэтому оценка — по
+символам, с запасом: кириллица и эмодзи дороже латиницы. Этого хватает,
+чтобы заранее, без запроса к API, понять, что промпт не влезет в окно
+модели, и подобрать max_tokens под нужную длину поста.
+"""
+
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.core.config import config
+
+# Символов на токен (с запасом: реальные токенизаторы обычно экономнее)
+ASCII_CHARS_PER_TOKEN = 3.5
+NON_ASCII_CHARS_PER_TOKEN = 2.0
+# Служебные токены на каждое сообщение (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Запас max_tokens сверх длины поста
+OUTPUT_RESERVE_TOKENS = 64
+# Меньше этого на ответ модель не получит — такой вызов бессмысленен
+MIN_OUTPUT_TOKENS = 256
+
+TRIM_MARKER = " […]"
+
+_SENTENCE_END = re.compile(r"[.!?…](?=\s)")
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Оценка числа токенов в тексте (сверху)"""
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return math.ceil(ascii_chars / ASCII_CHARS_PER_TOKEN + (len(text) - ascii_chars) / NON_ASCII_CHARS_PER_TOKEN)
+
+
+def estimate_messages_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Оценка токенов промпта: все сообщения, включая блоки системного промпта"""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+        else:
+            total += sum(estimate_tokens(block.get("text")) for block in content or [])
+        total += MESSAGE_OVERHEAD_TOKENS
+    return total
+
+
+def context_window(model: str) -> int:
+    """Окно контекста модели: самый длинный подходящий префикс из MODEL_CONTEXT_WINDOWS"""
+    matches = [prefix for prefix in config.MODEL_CONTEXT_WINDOWS if model.startswith(prefix)]
+    if not matches:
+        return config.DEFAULT_CONTEXT_WINDOW
+    return config.MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def max_tokens_for_length(max_length: int) -> int:
+    """max_tokens для ответа длиной до max_length символов"""
+    return math.ceil(max_length / NON_ASCII_CHARS_PER_TOKEN) + OUTPUT_RESERVE_TOKENS
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Обрезает текст до max_tokens (по оценке)
+
+    Режет по границе абзаца, иначе предложения, иначе слова — начало
+    новости (лид) важнее хвоста. К обрезанному тексту добавляется « […]».
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+
+    budget = max_tokens - estimate_tokens(TRIM_MARKER)
+    limit = len(text) * budget // estimate_tokens(text)
+    # Пропорция неточна при смеси алфавитов — ужимаем, пока не влезет
+    while limit > 0 and estimate_tokens(text[:limit]) > budget:
+        limit = limit * 9 // 10
+    cut = text[:limit]
+
+    boundary = cut.rfind("\n\n")
+    if boundary < limit // 2:
+        ends = [match.end() for match in _SENTENCE_END.finditer(cut)]
+        boundary = ends[-1] if ends else -1
+    if boundary < limit // 2:
+        boundary = cut.rfind(" ")
+    if boundary > 0:
+        cut = cut[:boundary]
+
+    return cut.rstrip() + TRIM_MARKER
+
+
+def plan_context(
+    prompt_tokens: int,
+    max_tokens: int,
+    models: List[str]
+) -> Tuple[List[str], int]:
+    """
+    Бюджет вызова для цепочки моделей
+
+    Модели, в окно которых промпт не помещается (с MIN_OUTPUT_TOKENS
+    на ответ), убираются из цепочки; max_tokens урезается до остатка
+    самого узкого окна среди оставшихся.
+
+    Args:
+        prompt_tokens: Оценка токенов промпта
+        max_tokens: Запрошенный максимум ответа
+        models: Цепочка моделей (основная + fallback)
+
+    Returns:
+        (подходящие модели, max_tokens); пустой список — промпт не влезает никуда
+    """
+    min_output = min(max_tokens, MIN_OUTPUT_TOKENS)
+    fitting = [model for model in models if context_window(model) - prompt_tokens >= min_output]
+    if not fitting:
+        return [], max_tokens
+
+    room = min(context_window(model) for model in fitting) - prompt_tokens
+    return fitting, min(max_tokens, room)
+
+
+__all__ = [
+    "estimate_tokens",
+    "estimate_messages_tokens",
+    "context_window",
+    "max_tokens_for_length",
+    "trim_to_tokens",
+    "plan_context"
+]
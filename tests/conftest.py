@@ -0,0 +1,12 @@
+"""
+Общие настройки тестов: корень репозитория в sys.path, трассировка выключена
+"""
+
+import os
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+os.environ.setdefault("TRACING_EXPORTER", "none")
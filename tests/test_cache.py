@@ -0,0 +1,37 @@
+"""
+PersistentCache: кэши в одном файле SQLite не мешают друг другу
+"""
+
+import asyncio
+
+from src.services.cache import PersistentCache
+
+
+def test_caches_sharing_file_write_concurrently(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+
+    async def scenario():
+        responses = PersistentCache(db_path, table="llm_responses")
+        verdicts = PersistentCache(db_path, table="verdicts")
+
+        await asyncio.gather(*(
+            cache.set(f"{cache.table}-{i}", {"i": i})
+            for i in range(50)
+            for cache in (responses, verdicts)
+        ))
+        responses.close()
+
+        # Второй кэш работает после закрытия первого
+        await verdicts.set("after-close", {"ok": True})
+        verdicts.close()
+
+        reopened = PersistentCache(db_path, table="verdicts")
+        assert await reopened.get("after-close") == {"ok": True}
+        assert await reopened.get("verdicts-49") == {"i": 49}
+        reopened.close()
+
+        reopened = PersistentCache(db_path, table="llm_responses")
+        assert all([await reopened.get(f"llm_responses-{i}") == {"i": i} for i in range(50)])
+        reopened.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,25 @@
+"""
+Ключ черновика: одна тема в разной записи совпадает, разные темы — нет
+"""
+
+from src.services.draft_cache import normalize_topic
+
+
+def test_same_topic_same_key():
+    assert normalize_topic("Новые критерии ГСД") == normalize_topic("критерии ГСД, новые!")
+    assert normalize_topic("  Витамин D  при беременности ") == normalize_topic("витамин d при беременности")
+
+
+def test_different_topics_do_not_collide():
+    pairs = [
+        ("Сахарный диабет 1 типа у детей", "Сахарный диабет 2 типа у детей"),
+        ("Витамин D при беременности", "Витамин B при беременности"),
+        ("Метформин при СПКЯ", "Метформин без СПКЯ"),
+        ("Можно ли делать прививку", "Нельзя ли не делать прививку"),
+    ]
+    for first, second in pairs:
+        assert normalize_topic(first) != normalize_topic(second), (first, second)
+
+
+def test_punctuation_only_topic_is_empty():
+    assert normalize_topic("?!…") == ""
@@ -0,0 +1,42 @@
+"""
+Разбор JSON из ответов модели: текст вокруг объекта и потоковые фрагменты
+"""
+
+from src.utils.json_stream import IncrementalJSONParser, extract_json
+
+
+def test_extract_wrapped_object():
+    text = 'Вот вердикт:\n```json\n{"is_safe": true, "severity": "safe", "issues": [],}\n```'
+    assert extract_json(text) == {"is_safe": True, "severity": "safe", "issues": []}
+
+
+def test_extract_skips_prose_braces():
+    assert extract_json('Note {not json} then {"is_safe": false}') == {"is_safe": False}
+    assert extract_json('Шаблон {тема} и {"a": {"b": 1}}') == {"a": {"b": 1}}
+
+
+def test_extract_no_object():
+    assert extract_json("Вердикт: безопасно") is None
+    assert extract_json("{только текст}") is None
+
+
+def test_partial_does_not_emit_unterminated_number():
+    parser = IncrementalJSONParser()
+    parser.feed('{"is_safe": true, "score": 12')
+    assert parser.partial() == {"is_safe": True}
+
+    parser.feed('3, "ratio": 0.')
+    assert parser.partial() == {"is_safe": True, "score": 123}
+
+    parser.feed("75}")
+    assert parser.partial() == {"is_safe": True, "score": 123, "ratio": 0.75}
+
+
+def test_partial_keeps_finished_literals():
+    parser = IncrementalJSONParser()
+    parser.feed('{"severity": "critical", "is_safe": false')
+    assert parser.partial() == {"severity": "critical", "is_safe": False}
+
+    parser = IncrementalJSONParser()
+    parser.feed('{"severity": "crit')
+    assert parser.partial() == {}
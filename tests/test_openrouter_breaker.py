@@ -0,0 +1,105 @@
+"""
+OpenRouterService: отменённая попытка не оставляет breaker в HALF_OPEN навсегда
+"""
+
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+from src.core.deadline import Deadline
+from src.services.openrouter import CompletionStream, OpenRouterService
+from src.services.resilience import CircuitState
+
+SLOW, FAST = "slow/model", "fast/model"
+
+
+def make_service() -> OpenRouterService:
+    service = OpenRouterService(api_key="test", base_url="http://127.0.0.1:9", models=[SLOW, FAST], hedging=True)
+    service._hedge_delay = lambda model: 0.01
+
+    async def fake_request(data, deadline, first_byte=None):
+        if data["model"] == SLOW:
+            await asyncio.sleep(30)
+        return {"success": True, "content": "ok", "model": data["model"]}
+
+    service._request = fake_request
+    return service
+
+
+def open_breaker(service: OpenRouterService, model: str):
+    breaker = service._breaker(model)
+    breaker.record_failure()
+    breaker.state = CircuitState.OPEN
+    breaker._opened_at = time.monotonic() - breaker.recovery_timeout - 1
+    return breaker
+
+
+def test_hedged_loser_releases_half_open_probe():
+    async def scenario():
+        service = make_service()
+        breaker = open_breaker(service, SLOW)
+        failures = breaker.failures
+
+        # Пробный запрос к SLOW молчит, хедж к FAST выигрывает, проба отменяется
+        result = await service._generate_with_fallback({"messages": []}, [SLOW, FAST], Deadline(5))
+
+        assert result["success"] and result["model"] == FAST
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.failures == failures  # отмена — не сбой провайдера
+        assert breaker.allow_request()       # следующая проба разрешена
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_probe_released():
+    async def scenario():
+        service = make_service()
+        breaker = open_breaker(service, SLOW)
+
+        task = asyncio.create_task(service._request_with_retry({"model": SLOW}, Deadline(5)))
+        await asyncio.sleep(0.01)
+        assert breaker.is_probing
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert breaker.allow_request()
+
+    asyncio.run(scenario())
+
+
+def test_deadline_result_not_counted_as_success():
+    service = make_service()
+    breaker = open_breaker(service, SLOW)
+    failures = breaker.failures
+    assert breaker.allow_request()
+
+    service._record_outcome(breaker, OpenRouterService._deadline_result(), probe=True)
+
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.failures == failures
+    assert breaker.allow_request()
+
+
+def test_stream_limiter_wait_bounded_by_deadline():
+    async def scenario():
+        service = make_service()
+
+        async def get_session():
+            return None
+
+        class BusyLimiter:
+            @asynccontextmanager
+            async def slot(self, model):
+                await asyncio.sleep(30)
+                yield
+
+        service._get_session = get_session
+        service.limiter = BusyLimiter()
+        stream = CompletionStream(service, {"model": FAST, "messages": []}, deadline=Deadline(0.2))
+
+        result = await asyncio.wait_for(stream.collect(), 5)
+
+        assert not result["success"]
+        assert result.get("deadline_exceeded")
+
+    asyncio.run(scenario())
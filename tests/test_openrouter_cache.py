@@ -0,0 +1,99 @@
+"""
+Кэш ответов OpenRouter: ключ учитывает структуру ответа и модель, которая ответила;
+непригодный ответ заменяется повтором
+"""
+
+import asyncio
+
+from src.agents.safety_agent import SafetyAgent
+from src.services.cache import PersistentCache
+from src.services.openrouter import OpenRouterService
+
+PRIMARY, FALLBACK = "primary/model", "fallback/model"
+SCHEMA = {"type": "json_schema", "json_schema": {"name": "verdict", "schema": {"type": "object"}}}
+MESSAGES = [{"role": "user", "content": "Проверь пост"}]
+
+
+def make_service(tmp_path, failing=()):
+    service = OpenRouterService(
+        api_key="test",
+        base_url="http://127.0.0.1:9",
+        models=[PRIMARY, FALLBACK],
+        hedging=False,
+        cache=PersistentCache(str(tmp_path / "cache.db"), table="llm_responses")
+    )
+    service.requests = []
+
+    async def fake_request(data, deadline, first_byte=None):
+        service.requests.append(data)
+        if data["model"] in failing:
+            return {"success": False, "content": None, "error": "HTTP 500", "status": 500}
+        content = '{"is_safe": true}' if "response_format" in data else "свободный текст"
+        return {"success": True, "content": content, "model": data["model"]}
+
+    service._request = fake_request
+    service._record_usage = lambda *args, **kwargs: None
+    return service
+
+
+def test_response_format_is_part_of_cache_key(tmp_path):
+    async def scenario():
+        service = make_service(tmp_path)
+
+        free = await service.generate(MESSAGES, temperature=0)
+        structured = await service.generate(MESSAGES, temperature=0, response_format=SCHEMA)
+        again = await service.generate(MESSAGES, temperature=0, response_format=SCHEMA)
+
+        assert free["content"] == "свободный текст"
+        assert structured["content"] == '{"is_safe": true}'
+        assert again.get("cached") and again["content"] == structured["content"]
+        assert len(service.requests) == 2
+        service.cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_fallback_answer_not_cached_as_primary(tmp_path):
+    async def scenario():
+        service = make_service(tmp_path, failing=(PRIMARY,))
+        service.retry_policy.max_attempts = 1
+
+        first = await service.generate(MESSAGES, temperature=0)
+        assert first["success"] and first["fallback"] == FALLBACK
+
+        # Основная модель снова в строю: её ответ не подменяется ответом запасной
+        recovered = make_service(tmp_path)
+        recovered.cache.close()
+        recovered.cache = service.cache
+        second = await recovered.generate(MESSAGES, temperature=0)
+        assert not second.get("cached")
+        assert second["model"] == PRIMARY
+
+        # Запрос прямо к запасной модели берёт её ответ из кэша
+        direct = await recovered.generate(MESSAGES, model=FALLBACK, temperature=0)
+        assert direct.get("cached")
+        service.cache.close()
+
+    asyncio.run(scenario())
+
+
+def test_invalid_verdict_replaced_in_cache(tmp_path):
+    async def scenario():
+        service = make_service(tmp_path)
+        answers = iter(["Вердикт: всё хорошо", '{"is_safe": true, "severity": "safe", "issues": []}'])
+
+        async def fake_request(data, deadline, first_byte=None):
+            service.requests.append(data)
+            return {"success": True, "content": next(answers), "model": data["model"]}
+
+        service._request = fake_request
+        agent = SafetyAgent(service)
+
+        first = await agent.execute("Пейте больше воды в жару.", "терапия", "Канал")
+        second = await agent.execute("Пейте больше воды в жару.", "терапия", "Канал")
+
+        assert first["success"] and second["success"]
+        assert len(service.requests) == 2  # второй раз — исправленный ответ из кэша
+        service.cache.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,194 @@
+"""
+Конвейер этапов: зависимости, fail-fast, остановка, таймаут, перегрузка, отмена
+"""
+
+import asyncio
+
+from src.agents.post_pipeline import SEVERITY_UNCHECKED, build_post_pipeline
+from src.core.pipeline import RUN_FAILED, RUN_OK, RUN_STOPPED, Pipeline, Stage
+
+
+async def slow(ctx):
+    await asyncio.sleep(5)
+
+
+async def boom(ctx):
+    await asyncio.sleep(0.05)
+    raise ValueError("сбой этапа")
+
+
+def test_independent_stages_run_in_parallel():
+    async def scenario():
+        async def first(ctx):
+            await asyncio.sleep(0.05)
+            return 1
+
+        async def branch(ctx):
+            await asyncio.sleep(0.2)
+            return ctx.results["first"] + 1
+
+        async def join(ctx):
+            return ctx.results["left"] + ctx.results["right"]
+
+        pipeline = Pipeline("t", [
+            Stage("first", first),
+            Stage("left", branch, after=("first",)),
+            Stage("right", branch, after=("first",)),
+            Stage("join", join, after=("left", "right"))
+        ])
+        run = await pipeline.run()
+
+        assert run.status == RUN_OK
+        assert run["join"] == 4
+        assert run.duration_ms < 400  # left и right — одновременно
+
+    asyncio.run(scenario())
+
+
+def test_fail_fast_cancels_running_stages():
+    async def scenario():
+        cleaned = []
+
+        async def long_stage(ctx):
+            ctx.on_abort(lambda: cleaned.append("long"))
+            await slow(ctx)
+
+        pipeline = Pipeline("f", [
+            Stage("boom", boom),
+            Stage("long", long_stage),
+            Stage("after", slow, after=("boom",))
+        ])
+        run = await asyncio.wait_for(pipeline.run(), 2)
+
+        assert run.status == RUN_FAILED
+        assert run.failed_stage == "boom"
+        assert isinstance(run.exception, ValueError)
+        assert {name: t["status"] for name, t in run.timings.items()} == {
+            "boom": "failed", "long": "cancelled", "after": "cancelled"
+        }
+        assert cleaned == ["long"]
+
+        stats = pipeline.get_stats()["stages"]
+        assert stats["long"]["cancelled"] == 1 and stats["long"]["failed"] == 0
+        assert stats["after"]["runs"] == 0  # так и не начался
+        assert stats["boom"]["failed"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_stop_without_error():
+    async def scenario():
+        async def stopper(ctx):
+            ctx.stop("duplicate", match="post:1")
+
+        pipeline = Pipeline("s", [Stage("check", stopper), Stage("next", slow, after=("check",))])
+        run = await pipeline.run()
+
+        assert run.status == RUN_STOPPED and run.stopped
+        assert run.stop_reason == "duplicate"
+        assert run.stop_details == {"match": "post:1"}
+        assert run.error is None
+        assert run.timings["next"]["status"] == "cancelled"
+        assert pipeline.get_stats()["stopped"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_stage_timeout():
+    async def scenario():
+        async def inner_timeout(ctx):
+            raise TimeoutError("таймаут внутри этапа")
+
+        pipeline = Pipeline("to", [Stage("slow", slow, timeout=0.05)])
+        run = await pipeline.run()
+        assert run.status == RUN_FAILED
+        assert run.timings["slow"]["status"] == "timeout"
+        assert "не уложился" in run.error
+        assert pipeline.get_stats()["stages"]["slow"]["timeouts"] == 1
+
+        # Собственный TimeoutError этапа — ошибка этапа, а не таймаут конвейера
+        run = await Pipeline("ti", [Stage("inner", inner_timeout, timeout=5)]).run()
+        assert run.timings["inner"]["status"] == "failed"
+        assert run.error == "таймаут внутри этапа"
+
+    asyncio.run(scenario())
+
+
+def test_overloaded_stage_rejects_runs():
+    async def scenario():
+        async def work(ctx):
+            await asyncio.sleep(0.1)
+            return 1
+
+        pipeline = Pipeline("c", [Stage("work", work, concurrency=2, max_pending=3)])
+        runs = await asyncio.gather(*(pipeline.run() for _ in range(8)))
+
+        statuses = [run.status for run in runs]
+        assert statuses.count(RUN_OK) == 5
+        assert statuses.count(RUN_FAILED) == 3
+        assert all(run.timings["work"]["status"] == "rejected" for run in runs if not run.ok)
+
+        stats = pipeline.get_stats()["stages"]["work"]
+        assert stats["rejected"] == 3 and stats["ok"] == 5
+        assert stats["max_waiting"] == 3
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_run_records_cancelled_stage():
+    async def scenario():
+        cleaned = []
+
+        async def long_stage(ctx):
+            ctx.on_abort(lambda: cleaned.append("long"))
+            await slow(ctx)
+
+        pipeline = Pipeline("oc", [Stage("long", long_stage)])
+        task = asyncio.create_task(pipeline.run())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert cleaned == ["long"]
+        assert pipeline.get_stats()["failed"] == 1
+        assert pipeline.get_stats()["stages"]["long"]["cancelled"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_post_without_safety_agent_is_unchecked():
+    async def scenario():
+        async def generate(ctx):
+            return {"success": True, "content": "Текст поста"}
+
+        pipeline = build_post_pipeline(generate=generate)
+        run = await pipeline.run(news={}, channel={"name": "Канал", "specialty": "терапия"})
+
+        assert run.ok
+        assert run["safety"] is None
+        assert run["review"]["severity"] == SEVERITY_UNCHECKED
+        assert run["review"]["status"]["text"] == "НЕ ПРОВЕРЕН"
+
+    asyncio.run(scenario())
+
+
+def test_post_checked_text_is_the_published_text():
+    async def scenario():
+        checked = []
+
+        class RecordingSafetyAgent:
+            async def execute(self, content, specialty, channel_name, deadline=None):
+                checked.append(content)
+                return {"success": True, "is_safe": True, "severity": "safe", "issues": []}
+
+        async def generate(ctx):
+            return {"success": True, "content": "Текст поста без хештегов"}
+
+        pipeline = build_post_pipeline(safety_agent=RecordingSafetyAgent(), generate=generate)
+        run = await pipeline.run(news={}, channel={"name": "Канал", "specialty": "терапия"}, pipelined=False)
+
+        assert run.ok
+        assert checked == [run["generate"]["content"]]
+        assert set(run.results) == {"generate", "dedup", "safety", "review"}
+
+    asyncio.run(scenario())
@@ -0,0 +1,83 @@
+"""
+ModelRateLimiter: отменённый запрос освобождает слот, не меняя окно AIMD
+"""
+
+import asyncio
+
+from src.services.rate_limiter import ModelRateLimiter
+
+MODEL = "test/model"
+
+
+def make_limiter() -> ModelRateLimiter:
+    return ModelRateLimiter(
+        rps=100, burst=10, initial_concurrency=4, min_concurrency=1, max_concurrency=16, target_latency=5
+    )
+
+
+def test_completed_request_grows_window():
+    async def scenario():
+        limiter = make_limiter()
+        async with limiter.slot(MODEL) as permit:
+            permit.report(200)
+        assert limiter.get_stats()[MODEL] == {"limit": 4.25, "in_flight": 0}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_request_keeps_window():
+    async def scenario():
+        limiter = make_limiter()
+
+        async def request():
+            async with limiter.slot(MODEL):
+                await asyncio.sleep(30)
+
+        task = asyncio.create_task(request())
+        await asyncio.sleep(0.01)
+        assert limiter.get_stats()[MODEL]["in_flight"] == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert limiter.get_stats()[MODEL] == {"limit": 4.0, "in_flight": 0}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_while_waiting_for_token_keeps_window():
+    async def scenario():
+        limiter = make_limiter()
+        bucket, _ = limiter._get(MODEL)
+        bucket.pause(30)
+
+        async def request():
+            async with limiter.slot(MODEL):
+                pass
+
+        task = asyncio.create_task(request())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert limiter.get_stats()[MODEL] == {"limit": 4.0, "in_flight": 0}
+
+    asyncio.run(scenario())
+
+
+def test_overload_after_status_still_counted_on_cancel():
+    async def scenario():
+        limiter = make_limiter()
+
+        async def request():
+            async with limiter.slot(MODEL) as permit:
+                permit.report(503)
+                await asyncio.sleep(30)
+
+        task = asyncio.create_task(request())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        assert limiter.get_stats()[MODEL] == {"limit": 2.0, "in_flight": 0}
+
+    asyncio.run(scenario())
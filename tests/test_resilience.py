@@ -0,0 +1,60 @@
+"""
+CircuitBreaker: пробный запрос в HALF_OPEN освобождается и истекает
+"""
+
+import time
+
+from src.services.resilience import CircuitBreaker, CircuitState
+
+
+def half_open_breaker(**kwargs) -> CircuitBreaker:
+    breaker = CircuitBreaker("test/model", failure_threshold=1, recovery_timeout=10, **kwargs)
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    # Пауза восстановления прошла
+    breaker._opened_at = time.monotonic() - 11
+    return breaker
+
+
+def test_single_probe_in_half_open():
+    breaker = half_open_breaker()
+
+    assert breaker.allow_request()
+    assert breaker.is_probing
+    assert [breaker.allow_request() for _ in range(3)] == [False, False, False]
+
+
+def test_released_probe_lets_next_request_through():
+    breaker = half_open_breaker()
+    assert breaker.allow_request()
+
+    breaker.release_probe()
+
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert breaker.failures == 1  # отмена не считается сбоем
+    assert breaker.allow_request()
+
+
+def test_lost_probe_expires():
+    breaker = half_open_breaker(probe_timeout=5)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+    # Проба так и не вернула результат
+    breaker._probe_started_at = time.monotonic() - 6
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_probe_outcome_closes_or_reopens():
+    breaker = half_open_breaker()
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert not breaker.is_probing
+
+    breaker = half_open_breaker()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
@@ -0,0 +1,155 @@
+"""
+PipelinedSafetyCheck: сведение вердиктов фрагментов и поведение после дедлайна
+"""
+
+import asyncio
+
+from src.agents.safety_pipeline import PipelinedSafetyCheck, merge_verdicts
+from src.core.deadline import Deadline
+from src.core.pipeline import Stage
+
+TIMEOUT_VERDICT = {"success": False, "is_safe": False, "severity": "unknown", "error": "Превышено время ожидания ответа"}
+
+
+class FakeSafetyAgent:
+    """check_fragment отдаёт заготовленные вердикты по порядку"""
+
+    def __init__(self, verdicts, delay=0.0):
+        self.verdicts = list(verdicts)
+        self.delay = delay
+        self.executed = 0
+        self.stored = []
+        self.fragments = []
+
+    async def check_fragment(self, fragment, specialty, channel_name, index=1, content=None, deadline=None, on_partial=None):
+        self.fragments.append(fragment)
+        await asyncio.sleep(self.delay)
+        return self.verdicts[index - 1]
+
+    async def execute(self, content, specialty, channel_name, deadline=None):
+        self.executed += 1
+        return {"success": True, "is_safe": True, "severity": "safe", "issues": []}
+
+    async def store_verdict(self, content, verdict, specialty=None):
+        self.stored.append(verdict)
+
+
+def test_no_full_check_after_deadline():
+    async def scenario():
+        agent = FakeSafetyAgent([TIMEOUT_VERDICT], delay=0.05)
+        checker = PipelinedSafetyCheck(agent, "терапия", "Канал", deadline=Deadline(0.01))
+
+        result = await checker.finish("Текст поста")
+
+        assert not result["success"]
+        assert agent.executed == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_check_when_time_left():
+    async def scenario():
+        agent = FakeSafetyAgent([TIMEOUT_VERDICT])
+        checker = PipelinedSafetyCheck(agent, "терапия", "Канал", deadline=Deadline(5))
+
+        result = await checker.finish("Текст поста")
+
+        assert result["success"]
+        assert agent.executed == 1
+
+    asyncio.run(scenario())
+
+
+def verification_verdict(severity, suggestions, issues=()):
+    return {
+        "success": True,
+        "is_safe": severity == "safe",
+        "severity": severity,
+        "issues": list(issues),
+        "recommendations": [],
+        "review": {"safe": severity == "safe", "issues": [], "suggestions": suggestions}
+    }
+
+
+def test_merge_keeps_review_suggestions():
+    verdicts = [
+        verification_verdict("safe", ["Сократить вступление"]),
+        verification_verdict("low", ["Добавить источник", "Сократить вступление"],
+                             issues=[{"severity": "low", "description": "Нет ссылки"}])
+    ]
+
+    result = merge_verdicts(verdicts)
+
+    assert result["review"]["suggestions"] == ["Сократить вступление", "Добавить источник"]
+    assert result["review"]["issues"] == ["Нет ссылки"]
+    assert result["review"]["safe"] is False
+
+
+def test_merge_without_review():
+    result = merge_verdicts([{"success": True, "is_safe": True, "severity": "safe"}])
+    assert "review" not in result
+
+
+def test_finish_caches_verdict_with_review():
+    async def scenario():
+        agent = FakeSafetyAgent([
+            verification_verdict("safe", ["Разбить длинный абзац"]),
+            verification_verdict("safe", ["Добавить призыв к врачу"])
+        ])
+        checker = PipelinedSafetyCheck(agent, "терапия", "Канал", deadline=Deadline(5), min_chars=5)
+        checker.feed("Первый абзац поста.\n\nВторой")
+
+        result = await checker.finish("Первый абзац поста.\n\nВторой абзац.")
+
+        assert result["fragments"] == 2
+        assert result["review"]["suggestions"] == ["Разбить длинный абзац", "Добавить призыв к врачу"]
+        assert agent.stored == [result]
+
+    asyncio.run(scenario())
+
+
+def test_fragments_without_slot_checked_with_tail():
+    async def scenario():
+        agent = FakeSafetyAgent([verification_verdict("safe", []), verification_verdict("safe", [])])
+        stage = Stage("safety", None, concurrency=1)
+        checker = PipelinedSafetyCheck(agent, "терапия", "Канал", deadline=Deadline(5), min_chars=5, slot=stage.slot)
+
+        # Этап safety этого прогона уже держит единственный слот — фрагменту его не дождаться
+        async with stage.slot():
+            checker.feed("Первый абзац поста.\n\nВто")
+            await asyncio.sleep(0)
+            checker.feed("Первый абзац поста.\n\nВторой абзац.\n\nТретий")
+            result = await asyncio.wait_for(checker.finish("Первый абзац поста.\n\nВторой абзац.\n\nТретий абзац."), 1)
+
+        assert result["success"]
+        assert result["fragments"] == 1
+        assert agent.fragments == ["Первый абзац поста.\n\nВторой абзац.\n\nТретий абзац."]
+
+    asyncio.run(scenario())
+
+
+def test_fragment_checks_share_stage_concurrency():
+    async def scenario():
+        agent = FakeSafetyAgent([verification_verdict("safe", [])] * 4, delay=0.02)
+        stage = Stage("safety", None, concurrency=1)
+        checker = PipelinedSafetyCheck(agent, "терапия", "Канал", deadline=Deadline(5), min_chars=5, slot=stage.slot)
+        peak = 0
+
+        async def watch():
+            nonlocal peak
+            while True:
+                peak = max(peak, stage.running)
+                await asyncio.sleep(0.001)
+
+        watcher = asyncio.create_task(watch())
+        for draft in ("Первый абзац.\n\nВто", "Первый абзац.\n\nВторой абзац.\n\nТре",
+                      "Первый абзац.\n\nВторой абзац.\n\nТретий абзац.\n\nЧет"):
+            checker.feed(draft)
+        await asyncio.sleep(0.1)
+        result = await checker.finish("Первый абзац.\n\nВторой абзац.\n\nТретий абзац.\n\nЧетвёртый.")
+        watcher.cancel()
+
+        assert result["fragments"] == 4
+        assert peak == 1
+
+    asyncio.run(scenario())
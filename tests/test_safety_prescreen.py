@@ -0,0 +1,64 @@
+"""
+Предскрининг: дозировки находятся, годы («2024 г.») за граммы не принимаются
+"""
+
+from src.services.safety_prescreen import prescreen
+
+
+def rule_types(text: str) -> set:
+    return {issue["type"] for issue in prescreen(text, whole_post=False)["issues"]}
+
+
+def test_prescription_with_dose_rejected():
+    for text in (
+        "Принимайте по 500 мг парацетамола.",
+        "Пейте 2 г порошка, разведённого в воде.",
+        "Используйте 1,5 г мази.",
+        "Выпейте 2 таблетки перед сном.",
+    ):
+        screen = prescreen(text, whole_post=False)
+        assert screen["reject"], text
+        assert "direct_prescription" in rule_types(text), text
+
+
+def test_dosage_schedule_found():
+    assert "dosage" in rule_types("Обычно это 1 г два раза в день.")
+
+
+def test_year_is_not_a_dose():
+    for text in (
+        "Используйте рекомендации ВОЗ 2024 г. при выборе тактики.",
+        "Используйте данные исследования от 2023 г.",
+        "Примите во внимание обзор Cochrane 1998 г.",
+    ):
+        assert "direct_prescription" not in rule_types(text), text
+        assert not prescreen(text, whole_post=False)["reject"], text
+
+
+def test_caution_is_not_a_prescription():
+    assert "direct_prescription" not in rule_types("Не принимайте 2 таблетки сразу.")
+
+
+def test_promise_and_advice_rejected():
+    for text in (
+        "Этот препарат гарантированно излечит вас от псориаза.",
+        "Крем навсегда избавит от акне.",
+        "Методика даёт 100% результат.",
+        "При улучшении прекратите приём антибиотика.",
+        "С такой сыпью можно не обращаться к врачу.",
+    ):
+        assert prescreen(text, whole_post=False)["reject"], text
+
+
+def test_cautionary_text_not_rejected():
+    for text in (
+        "Ни один препарат не гарантирует излечения от псориаза.",
+        "К сожалению, полностью избавиться от псориаза нельзя.",
+        "Не существует средства, которое навсегда избавит от акне.",
+        "Ни один метод не даёт 100% результата.",
+        "Врач может сказать: отмените приём препарата и сдайте анализы.",
+    ):
+        screen = prescreen(text, whole_post=False)
+        assert not screen["reject"], text
+        # Решение за LLM, но с полным промптом
+        assert screen["risk"] >= 1.0, text
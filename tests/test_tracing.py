@@ -0,0 +1,62 @@
+"""
+Трассировка: спан агента для потокового вызова закрывается после потока
+"""
+
+import asyncio
+
+from src.agents.base_agent import BaseAgent
+from src.core.tracing import tracer
+from src.services.openrouter import CompletionStream, OpenRouterService
+
+
+class CollectingExporter:
+    def __init__(self):
+        self.spans = []
+
+    async def export(self, spans):
+        self.spans.extend(spans)
+
+    async def close(self):
+        pass
+
+
+class EchoAgent(BaseAgent):
+    def get_system_prompt(self) -> str:
+        return "system"
+
+    async def execute(self, **kwargs):
+        return {}
+
+
+def test_agent_span_outlives_stream(monkeypatch):
+    async def fake_chain(self):
+        for delta in ("Первый ", "абзац"):
+            await asyncio.sleep(0.01)
+            self.content += delta
+            yield delta
+        self.finished = True
+
+    monkeypatch.setattr(CompletionStream, "_iterate_chain", fake_chain)
+
+    async def scenario():
+        exporter = CollectingExporter()
+        await tracer.start(exporter=exporter, flush_interval=60)
+        try:
+            service = OpenRouterService(api_key="test", base_url="http://127.0.0.1:9", models=["test/model"])
+            service._record_usage = lambda *args, **kwargs: None
+            agent = EchoAgent(service)
+
+            stream = await agent.generate("Тема", stream=True)
+            # Пока поток не дочитан, спаны вызова открыты
+            assert {s.name for s in tracer._buffer} == {"prompt.build"}
+            async for _ in stream:
+                pass
+        finally:
+            await tracer.close()
+
+        spans = {s.name: s for s in exporter.spans}
+        parent, child = spans["agent.generate"], spans["openrouter.generate"]
+        assert child.parent_id == parent.span_id
+        assert parent.end_ns >= child.end_ns
+
+    asyncio.run(scenario())
@@ -0,0 +1,98 @@
+"""
+Сценарий бота: принятый черновик возвращается по той же теме, даже если пост уже в индексе дубликатов
+"""
+
+import asyncio
+
+from src.services.cache import PersistentCache
+from src.services.dedup import DuplicateIndex
+from src.services.draft_cache import DraftCache
+from src.telegram_bot.handlers import user_interface
+
+TOPIC = "Новые критерии гестационного сахарного диабета"
+CONTENT = (
+    "<b>Новые критерии гестационного сахарного диабета</b>\n\n"
+    + "Глюкозотолерантный тест проводят на 24–28 неделе беременности по назначению врача. " * 10
+)
+DATA = {"specialty": "гинекология", "name": "Гинекология", "emoji": "🌸", "channel": "@profgynecologist"}
+
+
+class FakeChat:
+    id = 1
+
+
+class FakeMessage:
+    chat = FakeChat()
+
+    def __init__(self):
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append((text, kwargs.get("reply_markup")))
+        return self
+
+
+class FakeState:
+    def __init__(self):
+        self.data = {}
+        self.state = None
+
+    async def update_data(self, **kwargs):
+        self.data.update(kwargs)
+
+    async def get_data(self):
+        return dict(self.data)
+
+    async def set_state(self, state):
+        self.state = state
+
+
+def test_accepted_draft_returned_for_same_topic(tmp_path):
+    async def scenario():
+        duplicates = DuplicateIndex(str(tmp_path / "dedup.db"))
+        drafts = DraftCache(PersistentCache(str(tmp_path / "cache.db"), table="drafts"))
+        user_interface.set_agents(None, None, None, duplicates=duplicates, drafts=drafts)
+        try:
+            # Пост по теме принят: в кэше черновиков и (через TaskQueue.add_task) в индексе дубликатов
+            await user_interface._remember_draft({
+                **DATA, "topic": TOPIC, "post_content": CONTENT, "is_safe": True, "severity": "safe", "issues": []
+            })
+            await duplicates.add_post("task:1", CONTENT, DATA["specialty"])
+            assert duplicates.find_topic(TOPIC, DATA["specialty"]) is not None
+
+            message, state = FakeMessage(), FakeState()
+            await user_interface._generate_post_flow(message, state, TOPIC, DATA)
+
+            (text, markup), = message.answers
+            assert markup is user_interface.REVIEW_KEYBOARD
+            assert "Черновик из кэша" in text
+            assert "Похожий пост" in text
+            assert state.data["post_content"] == CONTENT
+            assert state.state == user_interface.PostCreation.reviewing_post
+        finally:
+            user_interface.set_agents(None, None, None)
+            drafts.cache.close()
+            duplicates.close()
+
+    asyncio.run(scenario())
+
+
+def test_new_topic_similar_to_post_gets_warning(tmp_path):
+    async def scenario():
+        duplicates = DuplicateIndex(str(tmp_path / "dedup.db"))
+        drafts = DraftCache(PersistentCache(str(tmp_path / "cache.db"), table="drafts"))
+        user_interface.set_agents(None, None, None, duplicates=duplicates, drafts=drafts)
+        try:
+            await duplicates.add_post("task:1", CONTENT, DATA["specialty"])
+
+            message, state = FakeMessage(), FakeState()
+            await user_interface._generate_post_flow(message, state, TOPIC, DATA)
+
+            (text, markup), = message.answers
+            assert markup is user_interface.DUPLICATE_KEYBOARD
+        finally:
+            user_interface.set_agents(None, None, None)
+            drafts.cache.close()
+            duplicates.close()
+
+    asyncio.run(scenario())